@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'store.middleware.PageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'KEC.urls'
@@ -68,6 +69,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'store.context_processors.wishlist_count',
+                'store.context_processors.cart_count',
             ],
         },
     },
@@ -146,6 +148,49 @@ LOGIN_URL = 'store:login'
 RAZORPAY_KEY_ID = os.environ.get("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = os.environ.get("RAZORPAY_KEY_SECRET")
 
+# Minutes that stock stays reserved while a Razorpay payment is in progress
+STOCK_HOLD_MINUTES = 15
+
+# Idle days after which `manage.py expire_carts` deletes a cart
+CART_ANONYMOUS_TTL_DAYS = 7
+CART_USER_TTL_DAYS = 90
+
+# The catalog cache and its version counter must be shared by every worker
+# process, so point DJANGO_CACHE_DIR at a writable directory when running
+# more than one; without it each process gets its own local-memory cache.
+if os.environ.get("DJANGO_CACHE_DIR"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ["DJANGO_CACHE_DIR"],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a catalog cache entry may live before a catalog change replaces it
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Seconds an anonymous storefront page stays cached (pages show stock levels)
+PAGE_CACHE_TIMEOUT = 60
+
+# Pumps returned per recommendation query by recommend_pumps() and the batch
+# API (`limit` overrides it); the single-query API returns every match unless
+# the client passes `limit`
+RECOMMENDATION_LIMIT = 10
+
+# Queries accepted by one call to the batch recommendation API
+RECOMMENDATION_BATCH_MAX_ROWS = 1000
+
+# Seconds a pump chatbot conversation survives without an answer. Conversations
+# live in the default cache, so with several workers it must be shared
+# (DJANGO_CACHE_DIR above); the local-memory fallback suits a single process
+CHATBOT_SESSION_TIMEOUT = 30 * 60
+
 CORS_ALLOW_ALL_ORIGINS = False
 
 CORS_ALLOWED_ORIGINS = [
@@ -154,7 +199,8 @@ CORS_ALLOWED_ORIGINS = [
 
 
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Set to django.core.mail.backends.console.EmailBackend for local development
+EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -1,8 +1,9 @@
 from django import forms
+from store.forms import PerformanceCurveMixin
 from store.models import Product
 
 
-class ProductForm(forms.ModelForm):
+class ProductForm(PerformanceCurveMixin, forms.ModelForm):
     class Meta:
         model = Product
         fields = [
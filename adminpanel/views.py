@@ -16,8 +16,11 @@ from django.db.models import Sum,Count,F
 from django.db.models.functions import TruncDate
 from django.utils import timezone
 from datetime import timedelta
-from store.models import Order, OrderItem
+from store.models import Order, OrderItem, DailySales, DailyCategorySales
+from store.service.sales import record_status_change
+from store.service.catalog import bump_catalog_version
 
+TREND_DAYS = 30
 
 def admin_login(request):
     # If already logged in and is admin, redirect to dashboard
@@ -57,20 +60,15 @@ def dashboard(request):
 
     recent_orders = Order.objects.order_by('-created_at')[:5]
 
-    # TOTAL REVENUE (ALL ORDERS)
-    total_revenue = sum(order.total_amount for order in Order.objects.all())
+    # TOTAL REVENUE (ALL ORDERS) - read from the daily rollup, O(days)
+    total_revenue = DailySales.objects.aggregate(total=Sum('revenue'))['total'] or 0
 
     #  CATEGORY-WISE SALES ANALYSIS (DELIVERED ORDERS)
     category_sales = (
-        OrderItem.objects
-        .filter(order__status='delivered')
-        .values(
-            'product__category__name',
-            'product__category'
-        )
-        .annotate(
-            revenue=Sum(F('price') * F('quantity'))
-        )
+        DailyCategorySales.objects
+        .filter(status='delivered')
+        .values('category_name')
+        .annotate(revenue=Sum('revenue'))
         .order_by('-revenue')
     )
 
@@ -78,16 +76,32 @@ def dashboard(request):
     category_revenues = []
 
     for item in category_sales:
-        # Works for BOTH FK & CharField category
-        category_name = (
-            item.get('product__category__name')
-            or item.get('product__category')
-            or 'Unknown'
-        )
-
-        category_labels.append(category_name)
+        category_labels.append(item['category_name'])
         category_revenues.append(float(item['revenue'] or 0))
 
+    #  DAILY REVENUE TREND (LAST 30 DAYS)
+    today = timezone.localdate()
+    start = today - timedelta(days=TREND_DAYS - 1)
+    per_day = {
+        row['date']: row
+        for row in DailySales.objects
+        .filter(date__gte=start)
+        .exclude(status='cancelled')
+        .values('date')
+        .annotate(revenue=Sum('revenue'), orders=Sum('order_count'))
+    }
+
+    trend_labels = []
+    trend_revenues = []
+    trend_orders = []
+
+    for offset in range(TREND_DAYS):
+        day = start + timedelta(days=offset)
+        row = per_day.get(day, {})
+        trend_labels.append(day.strftime('%d %b'))
+        trend_revenues.append(float(row.get('revenue') or 0))
+        trend_orders.append(row.get('orders') or 0)
+
     #  FINAL CONTEXT
     context = {
         'total_products': total_products,
@@ -99,6 +113,11 @@ def dashboard(request):
         # Category-wise chart data
         'category_labels': category_labels,
         'category_revenues': category_revenues,
+
+        # Daily trend chart data
+        'trend_labels': trend_labels,
+        'trend_revenues': trend_revenues,
+        'trend_orders': trend_orders,
     }
 
     return render(request, 'adminpanel/dashboard.html', context)
@@ -247,8 +266,10 @@ def order_detail(request, id):
 
         if new_status in status_choices:
             if order.status != new_status:
+                old_status = order.status
                 order.status = new_status
                 order.save()
+                record_status_change(order, old_status)
                 messages.success(
                     request,
                     f"Order #{order.id} status updated to {new_status}"
@@ -271,6 +292,8 @@ def product_bulk_delete(request):
         product_ids = request.POST.getlist('product_ids')
         if product_ids:
             Product.objects.filter(id__in=product_ids).delete()
+            # QuerySet.delete() may skip per-row signals; bump explicitly
+            bump_catalog_version()
     return redirect('adminpanel:product_list')
 
 @login_required(login_url='adminpanel:login')
@@ -309,12 +332,8 @@ def user_detail(request, id):
 
     total_orders = orders.count()
 
-    # Calculate total spent from OrderItem
-    total_spent = OrderItem.objects.filter(
-        order__user=user
-    ).aggregate(
-        total=Sum(F('price') * F('quantity'))
-    )['total'] or 0
+    # Stored order totals, no join over OrderItem
+    total_spent = orders.aggregate(total=Sum('total'))['total'] or 0
 
     context = {
         'user_obj': user,
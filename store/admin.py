@@ -1,5 +1,9 @@
+from django import forms
 from django.contrib import admin
-from .models import Category, Product, Order, OrderItem,Address,Wishlist
+from django.db import transaction
+from .models import Category, Product, Order, OrderItem,Address,Wishlist,StockHold,Job,Cart,CartItem
+from .forms import PerformanceCurveMixin
+from .service import sales, wishlist
 
 # Register your models here.
 
@@ -8,8 +12,14 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name',)
     prepopulated_fields = {'slug': ('name',)}
 
+class ProductAdminForm(PerformanceCurveMixin, forms.ModelForm):
+    class Meta:
+        model = Product
+        fields = '__all__'
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    form = ProductAdminForm
     list_display = ('name', 'category', 'price', 'stock', 'is_available')
     list_filter = ('category', 'is_available')
     search_fields = ('name', 'model_number')
@@ -18,13 +28,43 @@ class ProductAdmin(admin.ModelAdmin):
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    readonly_fields = ('category_name',)
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'full_name', 'status', 'created_at')
+    list_display = ('id', 'full_name', 'status', 'total', 'created_at')
     list_filter = ('status', 'created_at')
+    readonly_fields = ('total', 'item_count')
     inlines = [OrderItemInline]
 
+    # the sales rollup is kept in step with every admin edit (service.sales)
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'status' in form.changed_data:
+            sales.record_status_change(obj, form.initial.get('status'))
+
+    def save_related(self, request, form, formsets, change):
+        order = form.instance
+        before = sales.figures(order) if change else None
+        super().save_related(request, form, formsets, change)
+        # items may have been edited inline
+        order.recalculate_totals()
+        if change:
+            sales.record_total_change(order, before)
+        else:
+            sales.record_order(order)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            sales.record_delete(obj)
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for order in queryset:
+                sales.record_delete(order)
+            super().delete_queryset(request, queryset)
+
 @admin.register(Address)
 class AddressAdmin(admin.ModelAdmin):
     list_display = ('user', 'label', 'full_name', 'phone', 'city', 'is_default', 'created_at')
@@ -36,4 +76,45 @@ class WishlistAdmin(admin.ModelAdmin):
     list_display = ['user', 'product', 'added_on']
     list_filter = ['added_on', 'user']
     search_fields = ['user__username', 'product__name']
-    readonly_fields = ['added_on']
\ No newline at end of file
+    readonly_fields = ['added_on']
+
+    # wishlist rows are normally written through service.wishlist, which
+    # keeps the cached id sets current; edits here just drop them
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        wishlist.forget(obj.user_id, *filter(None, [form.initial.get('user')]))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        wishlist.forget(obj.user_id)
+
+    def delete_queryset(self, request, queryset):
+        users = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        wishlist.forget(*users)
+
+@admin.register(StockHold)
+class StockHoldAdmin(admin.ModelAdmin):
+    list_display = ('product', 'quantity', 'razorpay_order_id', 'user', 'expires_at')
+    search_fields = ('razorpay_order_id', 'product__name')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('created_at', 'updated_at', 'last_error')
+
+
+class CartItemInline(admin.TabularInline):
+    model = CartItem
+    extra = 0
+
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'version', 'updated_at')
+    search_fields = ('user__username',)
+    readonly_fields = ('version', 'created_at', 'updated_at')
+    inlines = [CartItemInline]
@@ -1,8 +1,11 @@
-from .models import Wishlist
+from .service import cart_store, wishlist
 
 def wishlist_count(request):
-    if request.user.is_authenticated:
-        count = Wishlist.objects.filter(user=request.user).count()
-    else:
-        count = 0
-    return {'wishlist_count': count}
+    """Size of the user's cached wishlist id set (no query once cached)."""
+    return {'wishlist_count': wishlist.count(request.user)}
+
+
+def cart_count(request):
+    """Number of lines in the visitor's cart, from the cached cart summary."""
+    _, lines = cart_store.summary(request.session.get(cart_store.SESSION_KEY))
+    return {'cart_count': lines}
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Order,Address
+from .service import curves
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 
@@ -73,3 +74,32 @@ class ProfileForm(forms.ModelForm):
             'email':      forms.EmailInput(attrs={'class': 'form-control'}),
         }
 
+
+class PerformanceCurveMixin(forms.Form):
+    """CSV upload that replaces (or clears) a product's performance curve."""
+    performance_curve_csv = forms.FileField(
+        required=False,
+        label='Performance curve (CSV)',
+        help_text='One "flow_lpm,head_m" row per point, e.g. 0,62 / 40,55 / 80,38.',
+    )
+    clear_performance_curve = forms.BooleanField(required=False, label='Remove performance curve')
+
+    def clean_performance_curve_csv(self):
+        upload = self.cleaned_data.get('performance_curve_csv')
+        if not upload:
+            return None
+        try:
+            return curves.pack(curves.parse_csv(upload.read().decode('utf-8-sig')))
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The curve must be a UTF-8 CSV file.")
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # not a model form field, so set it on the instance directly
+        if cleaned_data.get('performance_curve_csv'):
+            self.instance.performance_curve = cleaned_data['performance_curve_csv']
+        elif cleaned_data.get('clear_performance_curve'):
+            self.instance.performance_curve = None
+        return cleaned_data
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Sum
+
+from store.models import Order
+
+
+class Command(BaseCommand):
+    help = "Fill Order.total and Order.item_count from the order items, in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        updated = 0
+
+        while True:
+            chunk = list(
+                Order.objects
+                .filter(id__gt=last_id)
+                .order_by('id')
+                .annotate(
+                    items_total=Sum(F('items__price') * F('items__quantity')),
+                    items_count=Sum('items__quantity'),
+                )[:chunk_size]
+            )
+            if not chunk:
+                break
+
+            for order in chunk:
+                order.total = order.items_total or 0
+                order.item_count = order.items_count or 0
+            Order.objects.bulk_update(chunk, ['total', 'item_count'])
+
+            updated += len(chunk)
+            last_id = chunk[-1].id
+            self.stdout.write(f"Backfilled {updated} order(s) (up to #{last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done. {updated} order(s) updated."))
@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from store.service import curves
+from store.service.recommendation import PumpIndex
+
+QUERIES = [
+    # depth_ft, usage, phase, budget, (flow_lpm, head_m)
+    (150, 'domestic', 'single', None, None),
+    (300, 'agriculture', 'three', 60000, None),
+    (250, 'agriculture', 'three', None, (120, 80)),
+    (120, 'domestic', 'single', 25000, (40, 45)),
+]
+
+
+def _synthetic_pump(rng, points, pk):
+    shutoff = rng.randint(30, 300)
+    runout = rng.randint(20, 600)
+    # head falls faster as flow rises, like a real centrifugal curve
+    flows = np.linspace(0, runout, points)
+    heads = shutoff * (1 - (flows / runout) ** rng.uniform(1.6, 2.4))
+    row = {
+        'id': pk,
+        'price': str(rng.randint(3000, 90000)),
+        'motor_power_hp': str(rng.randint(1, 30) / 2),
+        'max_head_m': shutoff,
+        'max_flow_lpm': runout,
+        'max_depth_ft': rng.randint(50, 1200),
+        'phase': rng.choice(['single', 'three']),
+        'usage_type': rng.choice(['domestic', 'agriculture', 'industrial']),
+    }
+    return row, curves.pack(list(zip(flows, heads)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Time recommendation queries, including operating-point interpolation, "
+        "on a generated in-memory catalog of pump curves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pumps', type=int, default=50_000)
+        parser.add_argument('--points', type=int, default=8, help="Points per performance curve")
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        started = time.perf_counter()
+        rows, blobs = zip(*(
+            _synthetic_pump(rng, options['points'], pk) for pk in range(1, options['pumps'] + 1)
+        ))
+        index = PumpIndex(list(rows), list(blobs))
+        self.stdout.write(
+            f"Built index of {len(index)} pumps ({options['points']}-point curves) "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+        self.stdout.write(f"{'query':<54}{'matches':>9}{'median ms':>12}")
+        for depth_ft, usage, phase, budget, point in QUERIES:
+            flow_lpm, head_m = point or (None, None)
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                total, _ = index.recommend(
+                    depth_ft, usage, phase, max_budget=budget, limit=10,
+                    flow_lpm=flow_lpm, head_m=head_m,
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+            label = f"{depth_ft}ft {usage}/{phase} budget={budget} point={point}"
+            self.stdout.write(f"{label:<54}{total:>9}{statistics.median(timings):>12.3f}")
+
+        # For comparison: interpolating every curve one at a time
+        head_m = 60
+        started = time.perf_counter()
+        for blob in blobs:
+            curve = curves.unpack(blob)
+            np.interp(head_m, curve[::-1, 1], curve[::-1, 0])
+        loop_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        curves.flow_at_head(index.curve_flows, index.curve_heads, head_m)
+        vector_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(
+            f"Flow at {head_m} m for all {len(index)} curves: per-curve loop {loop_ms:.1f} ms, "
+            f"vectorised {vector_ms:.2f} ms"
+        )
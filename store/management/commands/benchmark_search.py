@@ -0,0 +1,97 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from store.models import Category, Product
+from store.service import search
+
+WORDS = [
+    'submersible', 'openwell', 'monoset', 'borewell', 'pump', 'motor', 'panel',
+    'cable', 'copper', 'stainless', 'domestic', 'agriculture', 'industrial',
+    'single', 'three', 'phase', 'high', 'head', 'flow', 'pressure', 'starter',
+]
+SERIES = ['V-3', 'V-4', 'V-6', 'KO', 'KM', 'KP']
+# Filler vocabulary so descriptions read like catalog copy, not keyword soup
+FILLER = [f'{stem}{n}' for stem in ('spec', 'unit', 'grade', 'part', 'note') for n in range(60)]
+QUERIES = ['V-4', 'submersible', 'three phase', 'openwell pump', 'KM-15', 'copper cable']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the FTS5 search index with the old icontains filter on a "
+        "generated catalog. Runs inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if not search.fts_available():
+            raise CommandError("FTS5 search index is not available on this database.")
+
+        with transaction.atomic():
+            self._populate(options['products'])
+            self._run(options['repeat'])
+            transaction.set_rollback(True)
+
+    def _populate(self, count):
+        rng = random.Random(42)
+        categories = [
+            Category.objects.create(name=name, slug=f'bench-{name.lower()}')
+            for name in ('Pumps', 'Openwell', 'Monoset', 'Panel', 'Cable')
+        ]
+        started = time.perf_counter()
+        batch = []
+        for i in range(count):
+            series = rng.choice(SERIES)
+            words = rng.sample(WORDS, 3)
+            batch.append(Product(
+                category=rng.choice(categories),
+                name=f"{series} {' '.join(words).title()}",
+                slug=f'bench-product-{i}',
+                model_number=f"{series}-{rng.randint(1, 99)}",
+                description=' '.join(rng.choices(FILLER, k=22) + rng.sample(WORDS, 3)),
+                price=rng.randint(1000, 90000),
+                stock=rng.randint(0, 50),
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        indexed = search.rebuild_index()
+        self.stdout.write(
+            f"Generated {count} products, indexed {indexed} in {time.perf_counter() - started:.1f}s"
+        )
+
+    def _time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), len(result)
+
+    def _run(self, repeat):
+        base = Product.objects.filter(is_available=True)
+        self.stdout.write(f"{'query':<16}{'icontains ms':>14}{'hits':>8}{'fts5 ms':>12}{'hits':>8}")
+        for query in QUERIES:
+            old_ms, old_hits = self._time(
+                lambda: list(base.filter(
+                    Q(name__icontains=query) | Q(model_number__icontains=query)
+                ).values_list('id', flat=True)),
+                repeat,
+            )
+            new_ms, new_hits = self._time(
+                lambda: list(search.search_products(base, query).values_list('id', flat=True)),
+                repeat,
+            )
+            self.stdout.write(f"{query:<16}{old_ms:>14.2f}{old_hits:>8}{new_ms:>12.2f}{new_hits:>8}")
+        self.stdout.write(
+            f"fts5 results are relevance-ranked and capped at {search.RESULT_LIMIT}; "
+            "icontains results are unranked and unbounded."
+        )
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from store.models import Order
+from store.service import sales
+
+
+class Command(BaseCommand):
+    help = "Report orders whose stored total/item count drifted from their items"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help="Recalculate drifted orders and correct the sales rollup to match",
+        )
+        parser.add_argument('--limit', type=int, default=50, help="Max drifted orders to list")
+
+    def handle(self, *args, **options):
+        drifted = (
+            Order.objects
+            .annotate(
+                items_total=Coalesce(
+                    Sum(F('items__price') * F('items__quantity')),
+                    Value(0),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                ),
+                items_count=Coalesce(Sum('items__quantity'), Value(0)),
+            )
+            .filter(~Q(total=F('items_total')) | ~Q(item_count=F('items_count')))
+            .order_by('id')
+        )
+
+        count = 0
+        for order in drifted.iterator():
+            count += 1
+            if count <= options['limit']:
+                self.stdout.write(
+                    f"Order #{order.id}: stored {order.total} / {order.item_count} item(s), "
+                    f"actual {order.items_total} / {order.items_count}"
+                )
+            if options['fix']:
+                with transaction.atomic():
+                    before = sales.figures(order)
+                    order.recalculate_totals()
+                    sales.record_total_change(order, before)
+
+        if not count:
+            self.stdout.write(self.style.SUCCESS("All order totals are consistent."))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {count} drifted order(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{count} order(s) drifted. Re-run with --fix to repair."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.service import cart_store
+
+
+class Command(BaseCommand):
+    help = "Delete carts that have been idle longer than CART_ANONYMOUS_TTL_DAYS / CART_USER_TTL_DAYS"
+
+    def handle(self, *args, **options):
+        expired = cart_store.expire()
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} idle cart(s)."))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.service import products
+from store.service.catalog import cache_is_shared
+
+
+class Command(BaseCommand):
+    help = "Show hit rates of the read-through product cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Zero the counters after printing")
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError(
+                "The default cache is local to each process, so this command only sees its own "
+                "(empty) counters. Read them from the server at /api/cache-stats/product-cache/ "
+                "as a staff user, or configure a shared cache (e.g. set DJANGO_CACHE_DIR)."
+            )
+        stats = products.stats()
+        self.stdout.write(
+            f"Lookups: {stats['lookups']}  "
+            f"in-process hits: {stats['local']}  shared-cache hits: {stats['shared']}  "
+            f"misses: {stats['miss']}"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Hit rate: {stats['hit_rate']:.1%}"))
+        if options['reset']:
+            products.reset_stats()
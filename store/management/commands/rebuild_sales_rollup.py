@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from store.service.sales import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollup tables from orders"
+
+    def handle(self, *args, **options):
+        days, category_rows = rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {days} daily row(s) and {category_rows} category row(s)."
+        ))
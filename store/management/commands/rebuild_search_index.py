@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.service import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the FTS5 product search index from the product table"
+
+    def handle(self, *args, **options):
+        if not search.fts_available():
+            raise CommandError("FTS5 search index is not available on this database.")
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} product(s)."))
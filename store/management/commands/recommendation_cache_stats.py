@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.service import recommendation
+from store.service.catalog import cache_is_shared
+
+
+class Command(BaseCommand):
+    help = "Show hit rate and latency of the recommendation result cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Zero the counters after printing")
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError(
+                "The default cache is local to each process, so this command only sees its own "
+                "(empty) counters. Read them from the server at /api/cache-stats/recommend-cache/ "
+                "as a staff user, or configure a shared cache (e.g. set DJANGO_CACHE_DIR)."
+            )
+        stats = recommendation.stats()
+        self.stdout.write(
+            f"Lookups: {stats['lookups']}  "
+            f"hits: {stats['hit']} (avg {stats['hit_ms']:.3f} ms)  "
+            f"misses: {stats['miss']} (avg {stats['miss_ms']:.3f} ms)"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Hit rate: {stats['hit_rate']:.1%}"))
+        if options['reset']:
+            recommendation.reset_stats()
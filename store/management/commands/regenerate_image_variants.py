@@ -0,0 +1,48 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from store.service import images
+from store.service.catalog import bump_catalog_version
+
+
+class Command(BaseCommand):
+    help = "Generate AVIF/WebP variants for existing product and category images in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (default: one per CPU)")
+        parser.add_argument('--all', action='store_true',
+                            help="Regenerate even images whose variants are up to date")
+
+    def handle(self, *args, **options):
+        todo = []
+        for label in images.IMAGE_MODELS:
+            rows = apps.get_model(label).objects.exclude(image='').exclude(image__isnull=True)
+            for instance in rows.only('pk', 'image', 'image_variants').iterator():
+                if options['all'] or images.needs_variants(instance):
+                    todo.append((label, instance.pk, instance.image.name))
+        if not todo:
+            self.stdout.write(self.style.SUCCESS("All image variants are up to date."))
+            return
+
+        done = failed = 0
+        # Workers only resize and write files; the database is updated here
+        with ProcessPoolExecutor(max_workers=max(1, options['workers']), initializer=django.setup) as pool:
+            futures = {pool.submit(images.generate_variants, name): (label, pk, name) for label, pk, name in todo}
+            for future in as_completed(futures):
+                label, pk, name = futures[future]
+                try:
+                    variants = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{name}: {exc}")
+                    continue
+                done += images.store_variants(label, pk, variants, bump=False)
+
+        if done:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {done} image(s), {failed} failed."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.service.holds import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Release stock holds whose Razorpay payment window has expired"
+
+    def handle(self, *args, **options):
+        released = release_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired stock hold(s)."))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.service.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = "Process queued background jobs (receipts, OTP mails, notifications)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process due jobs once and exit")
+        parser.add_argument('--batch', type=int, default=50, help="Jobs to claim per poll")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            succeeded, failed = run_pending(limit=options['batch'])
+            if succeeded or failed:
+                self.stdout.write(f"Processed {succeeded + failed} job(s): {succeeded} ok, {failed} failed")
+            if options['once']:
+                break
+            if not (succeeded or failed):
+                time.sleep(options['sleep'])
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+from django.test import Client
+from django.urls import reverse
+
+from store.middleware import HEADER
+from store.models import Category
+from store.service.catalog import cache_is_shared
+
+
+def _default_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-render the anonymous home, shop and top category pages into the page cache. "
+        "Run after catalog changes (they start a new cache generation)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10,
+                            help="Number of categories to warm, most products first")
+        parser.add_argument('--host', default=None, help="Host header to send")
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError(
+                "The default cache is local to this process, so pages warmed here would never "
+                "reach the web workers. Configure a shared cache (e.g. set DJANGO_CACHE_DIR)."
+            )
+        shop = reverse('store:shop')
+        urls = [reverse('store:home'), shop]
+        categories = (
+            Category.objects
+            .annotate(available=Count('products', filter=Q(products__is_available=True)))
+            .filter(available__gt=0)
+            .order_by('-available', 'name')[:options['categories']]
+        )
+        urls += [f"{shop}?category={category.slug}" for category in categories]
+
+        client = Client(HTTP_HOST=options['host'] or _default_host())
+        warmed = 0
+        for url in urls:
+            response = client.get(url)
+            outcome = response.get(HEADER, '-')
+            if response.status_code != 200:
+                self.stderr.write(f"{url}: HTTP {response.status_code}")
+                continue
+            warmed += outcome in ('MISS', 'HIT')
+            self.stdout.write(f"{url}: {outcome}")
+        self.stdout.write(self.style.SUCCESS(f"Warmed {warmed} of {len(urls)} page(s)."))
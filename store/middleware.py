@@ -0,0 +1,116 @@
+import re
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from .service.cart_store import SESSION_KEY
+from .service.catalog import catalog_key
+
+HEADER = 'X-Page-Cache'
+
+# Pages that look the same to every anonymous visitor
+CACHED_VIEWS = getattr(settings, 'PAGE_CACHE_VIEWS', ('store:home', 'store:shop', 'store:product_detail'))
+
+# Short, because pages show stock and orders change stock without bumping
+# the catalog version
+TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60)
+
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+_CSRF_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+_CSRF_PLACEHOLDER = rb'\1__csrf_token__\2'
+
+
+def page_key(path, query_string):
+    return catalog_key('page', path, query_string)
+
+
+def _bypass(request):
+    """True when the page may differ from what other anonymous visitors get."""
+    if request.user.is_authenticated:
+        return True
+    if len(get_messages(request)):
+        return True
+    if settings.SESSION_COOKIE_NAME in request.COOKIES and (
+        request.session.get(SESSION_KEY) or request.session.get('cart')
+    ):
+        return True
+    return False
+
+
+def _cacheable_view(request):
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    return match.view_name in CACHED_VIEWS
+
+
+class PageCacheMiddleware:
+    """
+    Serve rendered storefront pages to anonymous visitors from the cache,
+    keyed on path, query string and catalog version, so a catalog change
+    never serves an old page. Responses carry X-Page-Cache: HIT, MISS or
+    BYPASS. CSRF tokens are stripped before storing and a fresh one for
+    the current visitor is put back on every hit.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD') or not _cacheable_view(request):
+            return self.get_response(request)
+        if _bypass(request):
+            response = self.get_response(request)
+            response[HEADER] = 'BYPASS'
+            return response
+
+        key = page_key(request.path, request.META.get('QUERY_STRING', ''))
+        cached = cache.get(key)
+        if cached is not None:
+            content, headers = cached
+            response = self._conditional(request, headers)
+            if response is None:
+                if b'__csrf_token__' in content:
+                    content = content.replace(b'__csrf_token__', get_token(request).encode())
+                response = HttpResponse(content)
+                for name, value in headers.items():
+                    response[name] = value
+            response[HEADER] = 'HIT'
+            return response
+
+        response = self.get_response(request)
+        if self._storable(request, response):
+            content = _CSRF_RE.sub(_CSRF_PLACEHOLDER, response.content)
+            headers = {name: response[name] for name in STORED_HEADERS if response.has_header(name)}
+            cache.set(key, (content, headers), TIMEOUT)
+        response[HEADER] = 'MISS'
+        return response
+
+    def _conditional(self, request, headers):
+        """A 304 for a cached page the client already has, else None."""
+        if 'ETag' not in headers:
+            return None
+        last_modified = parse_http_date_safe(headers.get('Last-Modified', ''))
+        response = get_conditional_response(request, etag=headers['ETag'], last_modified=last_modified)
+        if response is not None:
+            for name, value in headers.items():
+                if name != 'Content-Type':
+                    response[name] = value
+        return response
+
+    def _storable(self, request, response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and response.get('Content-Type', '').startswith('text/html')
+            and not request.session.modified
+        )
@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-18 16:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0011_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='phone',
+            field=models.CharField(max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='pincode',
+            field=models.CharField(max_length=6),
+        ),
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('razorpay_order_id', models.CharField(db_index=True, max_length=100)),
+                ('quantity', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='store.product')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='stockhold',
+            index=models.Index(fields=['product', 'expires_at'], name='store_stock_product_900c1a_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_stockhold'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='razorpay_order_id',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
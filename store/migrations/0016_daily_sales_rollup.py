@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-18 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_order_total_item_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.IntegerField(default=0)),
+                ('item_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales',
+                'ordering': ['date'],
+                'unique_together': {('date', 'status')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('category_name', models.CharField(max_length=100)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('item_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily category sales',
+                'ordering': ['date'],
+                'unique_together': {('date', 'status', 'category_name')},
+            },
+        ),
+    ]
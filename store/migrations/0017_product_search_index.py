@@ -0,0 +1,42 @@
+from django.db import migrations, OperationalError
+
+# Frozen copies of the schema at the time of this migration; later changes
+# to store.service.search must not change what it does.
+FTS_TABLE = 'store_product_fts'
+
+CREATE_TABLE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts USING fts5("
+    "name, model_number, description, category, "
+    "tokenize = \"unicode61 tokenchars '-'\")"
+)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(CREATE_TABLE_SQL)
+    except OperationalError:
+        # SQLite built without FTS5; search falls back to icontains
+        return
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, name, model_number, description, category) "
+        "SELECT p.id, p.name, COALESCE(p.model_number, ''), p.description, c.name "
+        "FROM store_product p JOIN store_category c ON c.id = p.category_id"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
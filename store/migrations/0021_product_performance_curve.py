@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_cart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='performance_curve',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
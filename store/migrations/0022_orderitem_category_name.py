@@ -0,0 +1,25 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_category_names(apps, schema_editor):
+    OrderItem = apps.get_model('store', 'OrderItem')
+    Product = apps.get_model('store', 'Product')
+    category = Product.objects.filter(pk=OuterRef('product_id')).values('category__name')[:1]
+    OrderItem.objects.filter(product__isnull=False).update(category_name=Subquery(category))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_product_performance_curve'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='category_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.RunPython(fill_category_names, migrations.RunPython.noop),
+    ]
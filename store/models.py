@@ -9,6 +9,9 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
     image = models.ImageField(upload_to='category_images/', blank=True, null=True)
+    # Resized AVIF/WebP copies of `image` (see store.service.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -25,6 +28,7 @@ class Product(models.Model):
     model_number = models.CharField(max_length=100, blank=True, null=True)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     is_available = models.BooleanField(default=True)
@@ -53,6 +57,12 @@ class Product(models.Model):
         null=True, blank=True
     )
 
+    # (flow LPM, head m) points as packed float32 pairs, see service.curves
+    performance_curve = models.BinaryField(null=True, blank=True)
+
+    # Bumped on every save; stock changes made with UPDATE don't touch it
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
     def __str__(self):
         return self.name
 
@@ -90,10 +100,15 @@ class Order(models.Model):
 
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD, null=True,blank=True)
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS, default='pending')
-    razorpay_order_id = models.CharField(max_length=100, blank=True, null=True)
+    razorpay_order_id = models.CharField(max_length=100, blank=True, null=True, unique=True)
     razorpay_payment_id = models.CharField(max_length=100, blank=True, null=True)
     razorpay_signature = models.CharField(max_length=200, blank=True, null=True)
 
+    # Denormalized from the items when the order is placed; see
+    # recalculate_totals() and the check_order_totals command
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -101,7 +116,19 @@ class Order(models.Model):
 
     @property
     def total_amount(self):
-        return sum(item.subtotal for item in self.items.all())
+        return self.total
+
+    def items_totals(self):
+        """(total, item_count) computed from the order items in one query."""
+        totals = self.items.aggregate(
+            total=models.Sum(models.F('price') * models.F('quantity')),
+            count=models.Sum('quantity'),
+        )
+        return totals['total'] or 0, totals['count'] or 0
+
+    def recalculate_totals(self):
+        self.total, self.item_count = self.items_totals()
+        self.save(update_fields=['total', 'item_count'])
 
 
 class OrderItem(models.Model):
@@ -109,14 +136,140 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # The product's category when the order was placed; the sales rollup
+    # uses it so later renames or deletions don't move past revenue
+    category_name = models.CharField(max_length=100, blank=True)
 
     @property
     def subtotal(self):
         return self.quantity * self.price
 
+    def save(self, *args, **kwargs):
+        if not self.category_name and self.product_id:
+            self.category_name = self.product.category.name
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.product} x {self.quantity}"
     
+class Cart(models.Model):
+    """
+    Server-side shopping cart. The session only stores its id; lines live
+    in CartItem and are changed one row at a time (see
+    store.service.cart_store). `version` goes up on every change so a
+    checkout can refer to "this cart as of version N".
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='cart'
+    )
+    version = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Cart #{self.pk} ({self.user or 'anonymous'})"
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} x {self.quantity}"
+
+class StockHold(models.Model):
+    """
+    Stock set aside for an online payment that hasn't been verified yet.
+    Active holds (expires_at in the future) are subtracted from stock when
+    computing what is available to sell.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    razorpay_order_id = models.CharField(max_length=100, db_index=True)
+    quantity = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product} x {self.quantity} ({self.razorpay_order_id})"
+
+class Job(models.Model):
+    """
+    Outbox row for work that runs outside the request (emails, PDFs, ...).
+    Processed by `manage.py runworker`; see store.service.jobs.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+class DailySales(models.Model):
+    """
+    Per-day, per-status sales rollup maintained by store.service.sales.
+    Rebuild with `manage.py rebuild_sales_rollup`.
+    """
+    date = models.DateField()
+    status = models.CharField(max_length=20)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+    item_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'status')
+        ordering = ['date']
+        verbose_name_plural = "Daily sales"
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.revenue}"
+
+
+class DailyCategorySales(models.Model):
+    """Same rollup broken down by category name (kept if the category is deleted)."""
+    date = models.DateField()
+    status = models.CharField(max_length=20)
+    category_name = models.CharField(max_length=100)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    item_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'status', 'category_name')
+        ordering = ['date']
+        verbose_name_plural = "Daily category sales"
+
+    def __str__(self):
+        return f"{self.date} {self.status} {self.category_name}: {self.revenue}"
+
 class Address(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='addresses')
     label = models.CharField(max_length=100, blank=True, help_text="e.g. Home / Office")
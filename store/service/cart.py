@@ -0,0 +1,104 @@
+from decimal import Decimal
+
+from store.models import Product
+
+
+class InsufficientStock(Exception):
+    """Raised when one or more cart lines can't be covered by current stock."""
+
+    def __init__(self, products):
+        self.products = products
+        names = ", ".join(p.name for p in products)
+        super().__init__(f"Not enough stock for: {names}")
+
+
+class CartLine:
+    """A single priced cart line: product, quantity and line subtotal."""
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def subtotal(self):
+        return self.product.price * self.quantity
+
+
+class PricedCart:
+    """
+    Result of pricing a session cart.
+
+    `items` are the lines that can be bought, `unavailable` are lines whose
+    product exists but is no longer for sale, and `missing` holds the ids
+    of products that were deleted since they were added to the cart.
+    """
+
+    def __init__(self, items, unavailable, missing):
+        self.items = items
+        self.unavailable = unavailable
+        self.missing = missing
+
+    @property
+    def total(self):
+        return sum((line.subtotal for line in self.items), Decimal('0'))
+
+    @property
+    def item_count(self):
+        return sum(line.quantity for line in self.items)
+
+    @property
+    def has_problems(self):
+        return bool(self.unavailable or self.missing)
+
+    def problem_ids(self):
+        """Cart keys (as strings) that should be dropped from the session cart."""
+        ids = [str(pid) for pid in self.missing]
+        ids += [str(line.product.id) for line in self.unavailable]
+        return ids
+
+
+def price_cart(cart):
+    """
+    Resolve a session cart {product_id: qty} in a single query.
+
+    Never raises for stale product ids; they are reported on the result
+    instead so the caller can decide what to tell the user.
+    """
+    wanted = {}
+    missing = []
+    for pid, qty in cart.items():
+        try:
+            wanted[int(pid)] = int(qty)
+        except (TypeError, ValueError):
+            missing.append(pid)
+
+    products = Product.objects.select_related('category').in_bulk(list(wanted))
+    return price_lines(wanted, products, missing)
+
+
+def price_lines(wanted, products, missing=None):
+    """
+    Build a PricedCart from {product_id: qty} and already loaded products
+    {product_id: Product}; ids without a product are reported as missing.
+    """
+    missing = list(missing or [])
+    items = []
+    unavailable = []
+    for pid, qty in wanted.items():
+        product = products.get(pid)
+        if product is None:
+            missing.append(pid)
+        elif not product.is_available:
+            unavailable.append(CartLine(product, qty))
+        else:
+            items.append(CartLine(product, qty))
+
+    return PricedCart(items, unavailable, missing)
+
+
+def line_quantities(lines):
+    """Collapse priced lines into {product_id: total quantity}."""
+    quantities = {}
+    for line in lines:
+        quantities[line.product.id] = quantities.get(line.product.id, 0) + line.quantity
+    return quantities
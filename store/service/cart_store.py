@@ -0,0 +1,280 @@
+"""
+Server-side cart store.
+
+The session holds only `cart_id`; every mutation touches a single
+CartItem row plus one version bump on the Cart, so neither the session nor
+the write size grows with the number of lines. Carts started before login
+are merged into the user's cart on login (store.signals), and carts left
+alone for long enough are deleted in bulk by `manage.py expire_carts`.
+
+Each mutation can pass `expected_version`; if the cart changed since the
+caller read it, CartConflict is raised instead of silently overwriting.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from store.models import Cart, CartItem, Product, StockHold
+
+SESSION_KEY = 'cart_id'
+
+_SUMMARY_KEY = 'cart:{}:summary'
+
+
+class CartConflict(Exception):
+    """The cart was changed by another request since `expected_version`."""
+
+
+def get_cart(request, create=False):
+    """
+    The visitor's cart: the logged-in user's cart, else the anonymous cart
+    the session points to. With create=True a missing cart is created.
+    The session is only written when the pointer itself changes.
+    """
+    user = request.user if request.user.is_authenticated else None
+    cart_id = request.session.get(SESSION_KEY)
+    cart = None
+    if cart_id:
+        cart = Cart.objects.filter(pk=cart_id, user=user).first()
+    if cart is None and user is not None:
+        cart = Cart.objects.filter(user=user).first()
+    if cart is None and create:
+        cart = Cart.objects.create(user=user)
+    if cart is not None and cart_id != cart.pk:
+        request.session[SESSION_KEY] = cart.pk
+    elif cart is None and cart_id:
+        del request.session[SESSION_KEY]
+    return cart
+
+
+def contents(cart):
+    """{product_id (str): quantity}, the shape service.cart.price_cart takes."""
+    if cart is None:
+        return {}
+    return {
+        str(pid): qty
+        for pid, qty in CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity')
+    }
+
+
+def read_lines(cart, product_id=None):
+    """
+    In one query: the cart's products, plus `product_id` if given, each
+    with its live stock. Returns ({product_id: quantity in cart},
+    {product_id: Product}); the extra product has no quantity entry unless
+    it is already in the cart.
+    """
+    items = CartItem.objects.filter(cart=cart)
+    condition = Q(pk__in=items.values('product_id'))
+    if product_id is not None:
+        condition |= Q(pk=product_id)
+    rows = (
+        Product.objects.select_related('category')
+        .filter(condition)
+        .annotate(in_cart=Subquery(items.filter(product=OuterRef('pk')).values('quantity')[:1]))
+    )
+    quantities = {}
+    products = {}
+    for product in rows:
+        products[product.pk] = product
+        if product.in_cart is not None:
+            quantities[product.pk] = product.in_cart
+    return quantities, products
+
+
+def remember_summary(cart, lines):
+    """Store the summary a caller already knows, saving the next lookup a query."""
+    cache.set(_SUMMARY_KEY.format(cart.pk), (cart.version, lines), 60 * 60)
+
+
+def _bump(cart, expected_version=None):
+    """Claim the next version (conditionally, if expected_version is given)."""
+    rows = Cart.objects.filter(pk=cart.pk)
+    if expected_version is not None:
+        rows = rows.filter(version=expected_version)
+    if not rows.update(version=F('version') + 1, updated_at=timezone.now()):
+        raise CartConflict(f"Cart #{cart.pk} changed since version {expected_version}")
+    if expected_version is not None:
+        cart.version = expected_version + 1
+    else:
+        cart.version = Cart.objects.values_list('version', flat=True).get(pk=cart.pk)
+    cache.delete(_SUMMARY_KEY.format(cart.pk))
+
+
+def add(cart, product_id, quantity, expected_version=None):
+    """Add `quantity` of a product (upsert of one line). Returns the new version."""
+    with transaction.atomic():
+        _bump(cart, expected_version)
+        line = CartItem.objects.filter(cart=cart, product_id=product_id)
+        if not line.update(quantity=F('quantity') + quantity):
+            CartItem.objects.create(cart=cart, product_id=product_id, quantity=quantity)
+    return cart.version
+
+
+def set_quantity(cart, product_id, quantity, expected_version=None):
+    """Set one line's quantity; 0 or less removes it. Returns the new version."""
+    with transaction.atomic():
+        _bump(cart, expected_version)
+        if quantity <= 0:
+            CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+        else:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=product_id, quantity=quantity)],
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity'],
+            )
+    return cart.version
+
+
+def add_missing(cart, product_ids, quantity=1):
+    """Add a line of `quantity` for each product not in the cart yet (one INSERT)."""
+    with transaction.atomic():
+        _bump(cart)
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=pk, quantity=quantity) for pk in product_ids],
+            ignore_conflicts=True,
+        )
+    return cart.version
+
+
+def remove(cart, product_id, expected_version=None):
+    """Drop one line. Returns True if the cart had it."""
+    with transaction.atomic():
+        _bump(cart, expected_version)
+        deleted, _ = CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+    return bool(deleted)
+
+
+def remove_many(cart, product_ids):
+    """Drop several lines at once (e.g. products that went unavailable)."""
+    with transaction.atomic():
+        _bump(cart)
+        CartItem.objects.filter(cart=cart, product_id__in=list(product_ids)).delete()
+    return cart.version
+
+
+def clear(cart, expected_version=None):
+    with transaction.atomic():
+        _bump(cart, expected_version)
+        CartItem.objects.filter(cart=cart).delete()
+    return cart.version
+
+
+def merge(source, target):
+    """
+    Move the lines of `source` (an anonymous cart) into `target`, adding
+    quantities for products in both, then delete `source`.
+    """
+    with transaction.atomic():
+        _bump(target)
+        for product_id, quantity in source.items.values_list('product_id', 'quantity'):
+            line = CartItem.objects.filter(cart=target, product_id=product_id)
+            if not line.update(quantity=F('quantity') + quantity):
+                CartItem.objects.create(cart=target, product_id=product_id, quantity=quantity)
+        source_id = source.pk
+        source.delete()
+    cache.delete(_SUMMARY_KEY.format(source_id))
+    return target.version
+
+
+def merge_on_login(request, user):
+    """Fold the session's anonymous cart into `user`'s cart and repoint the session."""
+    cart_id = request.session.get(SESSION_KEY)
+    anonymous = Cart.objects.filter(pk=cart_id, user=None).first() if cart_id else None
+    existing = Cart.objects.filter(user=user).first()
+    if anonymous is None:
+        if existing is not None:
+            request.session[SESSION_KEY] = existing.pk
+        else:
+            request.session.pop(SESSION_KEY, None)
+        return
+    if existing is None:
+        anonymous.user = user
+        anonymous.save(update_fields=['user', 'updated_at'])
+        return
+    merge(anonymous, existing)
+    request.session[SESSION_KEY] = existing.pk
+
+
+def summary(cart_id):
+    """(version, number of lines) for the cart, cached until the next change."""
+    if not cart_id:
+        return (0, 0)
+    key = _SUMMARY_KEY.format(cart_id)
+    value = cache.get(key)
+    if value is None:
+        row = (
+            Cart.objects.filter(pk=cart_id)
+            .annotate(lines=Count('items'))
+            .values_list('version', 'lines')
+            .first()
+        )
+        value = row or (0, 0)
+        cache.set(key, value, 60 * 60)
+    return value
+
+
+def snapshot(cart):
+    """Lightweight pointer to the cart as it is now, kept in the session at checkout."""
+    return {'cart_id': cart.pk, 'version': cart.version}
+
+
+def snapshot_contents(snapshot_data, user, razorpay_order_id=None):
+    """
+    The lines a checkout snapshot refers to: the cart itself if it is still
+    at the snapshot's version, else the stock holds taken for the payment.
+    None if neither is available any more.
+    """
+    if not snapshot_data:
+        return None
+    cart = Cart.objects.filter(
+        pk=snapshot_data.get('cart_id'), user=user, version=snapshot_data.get('version')
+    ).first()
+    if cart is not None:
+        return contents(cart)
+    if razorpay_order_id:
+        lines = {}
+        held = StockHold.objects.filter(razorpay_order_id=razorpay_order_id)
+        for product_id, quantity in held.values_list('product_id', 'quantity'):
+            lines[str(product_id)] = lines.get(str(product_id), 0) + quantity
+        if lines:
+            return lines
+    return None
+
+
+def clear_snapshot(snapshot_data, user):
+    """Empty the cart a checkout snapshot points to, unless it changed since."""
+    cart = Cart.objects.filter(pk=(snapshot_data or {}).get('cart_id'), user=user).first()
+    if cart is None:
+        return False
+    try:
+        clear(cart, expected_version=snapshot_data.get('version'))
+    except CartConflict:
+        return False
+    return True
+
+
+def expire(now=None):
+    """
+    Delete, in bulk, anonymous carts idle for CART_ANONYMOUS_TTL_DAYS and
+    user carts idle for CART_USER_TTL_DAYS. Returns the number of carts.
+    """
+    now = now or timezone.now()
+    stale = (
+        Cart.objects.filter(user=None, updated_at__lt=now - timedelta(days=settings.CART_ANONYMOUS_TTL_DAYS))
+        | Cart.objects.filter(user__isnull=False, updated_at__lt=now - timedelta(days=settings.CART_USER_TTL_DAYS))
+    )
+    ids = list(stale.values_list('pk', flat=True))
+    if not ids:
+        return 0
+    with transaction.atomic():
+        # items first, as one DELETE, so deleting the carts has nothing to cascade
+        CartItem.objects.filter(cart_id__in=ids).delete()
+        Cart.objects.filter(pk__in=ids).delete()
+    cache.delete_many([_SUMMARY_KEY.format(pk) for pk in ids])
+    return len(ids)
@@ -0,0 +1,114 @@
+"""
+Global catalog version and version-keyed catalog cache.
+
+A single counter in the cache changes whenever products or categories
+change (see store.signals). Anything derived from the catalog (in-process
+indexes, cache keys) includes or compares against it, so a bump makes
+every stale entry unreachable at once; nothing has to be deleted and the
+old entries simply expire. Reading the version is one cache get, never a
+database query, and only plain get/set/add/incr are used so the
+local-memory and file-based backends work as well as Redis/Memcached.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+
+from store.models import Category
+
+VERSION_KEY = 'catalog:version'
+CHANGED_KEY = 'catalog:changed-at'
+
+# Seconds a version-keyed entry may live; a bump invalidates it sooner
+CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+
+def cache_is_shared():
+    """
+    Whether the default cache is seen by every process. Local-memory (and
+    dummy) caches live inside one process, so what a management command
+    writes or counts there never reaches the web workers.
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a lost key never goes back to an old value
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache.set(CHANGED_KEY, timezone.now(), timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        catalog_version()
+        return cache.incr(VERSION_KEY)
+
+
+def catalog_changed_at():
+    """When the catalog last changed (or a later time, if that was lost)."""
+    changed = cache.get(CHANGED_KEY)
+    if changed is None:
+        cache.add(CHANGED_KEY, timezone.now(), timeout=None)
+        changed = cache.get(CHANGED_KEY)
+    return changed
+
+
+def catalog_key(name, *parts):
+    """
+    Cache key for `name` under the current catalog version. Free-form parts
+    (query strings, cursors) are hashed to keep keys short and safe for
+    every backend.
+    """
+    key = f'catalog:{catalog_version()}:{name}'
+    if parts:
+        digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+        key = f'{key}:{digest}'
+    return key
+
+
+def cached(name, build, *parts):
+    """Return the cached value for (`name`, `parts`), calling `build()` on a miss."""
+    key = catalog_key(name, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, CACHE_TIMEOUT)
+    return value
+
+
+def categories():
+    return cached('categories', lambda: list(Category.objects.all()))
+
+
+class CatalogIndex:
+    """
+    An in-process structure derived from the catalog: built by `build()`
+    on first use and rebuilt on the first use after the catalog version
+    changes. One thread rebuilds while the others wait for it.
+    """
+
+    def __init__(self, build):
+        self._build = build
+        self._current = None  # (version, value), swapped in one assignment
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = catalog_version()
+        current = self._current
+        if current is None or current[0] != version:
+            with self._lock:
+                current = self._current
+                if current is None or current[0] != version:
+                    current = self._current = (version, self._build())
+        return current[1]
@@ -0,0 +1,204 @@
+"""
+Stateful pump chatbot conversations.
+
+Each conversation keeps, in the cache, the answers so far and the ids of
+the pumps still matching them. Every answer narrows that set with one mask
+over the recommendation index's columns (service.recommendation), so the
+first turn looks at the whole catalog and later turns only at the few
+pumps left. The next question is whichever unanswered one splits the
+remaining pumps most evenly (highest entropy), so the set shrinks as fast
+as possible. Answering a question again (changing an answer) re-applies
+every answer to the whole index instead. Conversations expire
+CHATBOT_SESSION_TIMEOUT seconds after their last answer; nothing has to
+clean them up.
+
+Sessions are only visible to every web worker when the default cache is
+shared (DJANGO_CACHE_DIR or a cache server). With the local-memory
+fallback a conversation lives in the worker that started it, and any
+other worker answers it as expired.
+"""
+import math
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from store.models import Product
+
+from .facets import FACETS_BY_PARAM
+from .recommendation import get_index
+
+_SESSION_KEY = 'chatbot:{}'
+
+PHASES = dict(Product._meta.get_field('phase').choices)
+USAGES = dict(Product._meta.get_field('usage_type').choices)
+
+# Bucket edges used to judge how informative the numeric questions are
+DEPTH_EDGES = [high for _, _, _, high in FACETS_BY_PARAM['depth'].buckets if high is not None]
+PRICE_EDGES = [10000, 25000, 50000, 100000]
+
+QUESTIONS = {
+    'phase': "Which phase do you have? (single / three)",
+    'usage_type': "What is the usage type? (domestic / agriculture / industrial)",
+    'depth_ft': "What is the required water depth (in ft)?",
+    'budget': "What is your maximum budget? (optional — press Enter to skip)",
+}
+
+
+class InvalidAnswer(ValueError):
+    pass
+
+
+def _entropy(labels):
+    if not len(labels):
+        return 0.0
+    counts = np.unique(labels, return_counts=True)[1]
+    shares = counts / counts.sum()
+    return float(-(shares * np.log2(shares)).sum())
+
+
+def _positions(index, state):
+    if state['ids'] is None:
+        return np.arange(len(index))
+    found = [index.positions[pid] for pid in state['ids'] if pid in index.positions]
+    return np.array(found, dtype=np.intp)
+
+
+def _split(index, positions, field):
+    """What each remaining pump "answers" to `field`, for the entropy."""
+    if field == 'phase':
+        return index.phase[positions]
+    if field == 'usage_type':
+        return index.usage[positions]
+    if field == 'depth_ft':
+        return np.digitize(np.nan_to_num(index.depth[positions], nan=-1), DEPTH_EDGES)
+    return np.digitize(index.price[positions], PRICE_EDGES)
+
+
+def _options(index, positions, field):
+    if field not in ('phase', 'usage_type'):
+        return None
+    choices = PHASES if field == 'phase' else USAGES
+    codes = index.phase_codes if field == 'phase' else index.usage_codes
+    column = index.phase if field == 'phase' else index.usage
+    values = column[positions]
+    return [
+        {'value': value, 'label': label, 'count': int((values == codes[value]).sum()) if value in codes else 0}
+        for value, label in choices.items()
+    ]
+
+
+def _next_question(index, positions, answers):
+    unanswered = [field for field in QUESTIONS if field not in answers]
+    if not unanswered or not len(positions):
+        return None
+    # most informative first; the fixed order breaks ties
+    field = max(unanswered, key=lambda f: (_entropy(_split(index, positions, f)), -unanswered.index(f)))
+    return {
+        'field': field,
+        'text': QUESTIONS[field],
+        'options': _options(index, positions, field),
+    }
+
+
+def _parse(field, value):
+    value = '' if value is None else str(value).strip().lower()
+    if field == 'phase':
+        if value not in PHASES:
+            raise InvalidAnswer("Invalid phase. Enter: single or three.")
+        return value
+    if field == 'usage_type':
+        if value not in USAGES:
+            raise InvalidAnswer("Invalid usage type. Enter: domestic, agriculture, or industrial.")
+        return value
+    if field == 'budget' and value == '':
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        number = 0
+    if not math.isfinite(number) or number <= 0 or (field == 'depth_ft' and number > 1000):
+        raise InvalidAnswer("Please enter a valid budget or press Enter to skip." if field == 'budget'
+                            else "Please enter a valid depth in feet (example: 120).")
+    return number
+
+
+def _narrow(index, positions, field, value):
+    if value is None:
+        return positions
+    if field == 'phase':
+        code = index.phase_codes.get(value)
+        return positions[index.phase[positions] == code] if code is not None else positions[:0]
+    if field == 'usage_type':
+        code = index.usage_codes.get(value)
+        return positions[index.usage[positions] == code] if code is not None else positions[:0]
+    if field == 'depth_ft':
+        return positions[index.depth[positions] >= value]
+    return positions[index.price[positions] <= value]
+
+
+def _narrow_all(index, answers):
+    positions = np.arange(len(index))
+    for field, value in answers.items():
+        positions = _narrow(index, positions, field, value)
+    return positions
+
+
+def _reply(session_id, index, positions, answers):
+    question = _next_question(index, positions, answers)
+    reply = {
+        'session': session_id,
+        'answers': answers,
+        'remaining': int(len(positions)),
+        'question': question,
+        'done': question is None,
+    }
+    if question is None:
+        _, reply['recommendations'] = index.recommend(
+            answers.get('depth_ft') or 0, answers.get('usage_type'), answers.get('phase'),
+            limit=settings.RECOMMENDATION_LIMIT, within=positions,
+        )
+    return reply
+
+
+def _save(session_id, index, positions, answers):
+    state = {'ids': [index.rows[i]['id'] for i in positions], 'answers': answers}
+    cache.set(_SESSION_KEY.format(session_id), state, settings.CHATBOT_SESSION_TIMEOUT)
+
+
+def start():
+    """Open a conversation over every available pump; returns the first reply."""
+    session_id = uuid.uuid4().hex
+    index = get_index()
+    cache.set(
+        _SESSION_KEY.format(session_id), {'ids': None, 'answers': {}}, settings.CHATBOT_SESSION_TIMEOUT,
+    )
+    return _reply(session_id, index, np.arange(len(index)), {})
+
+
+def answer(session_id, field, value):
+    """
+    Apply one answer and return the next reply, or None if the session
+    expired. Raises InvalidAnswer for answers that can't be used.
+    """
+    state = cache.get(_SESSION_KEY.format(session_id))
+    if state is None:
+        return None
+    if field not in QUESTIONS:
+        raise InvalidAnswer(f"Unknown question '{field}'.")
+    value = _parse(field, value)
+
+    index = get_index()
+    answers = {**state['answers'], field: value}
+    if field in state['answers']:
+        # a changed answer may widen the set again, so start from every pump
+        positions = _narrow_all(index, answers)
+    else:
+        positions = _narrow(index, _positions(index, state), field, value)
+    _save(session_id, index, positions, answers)
+    return _reply(session_id, index, positions, answers)
+
+
+def end(session_id):
+    cache.delete(_SESSION_KEY.format(session_id))
@@ -0,0 +1,105 @@
+"""
+Pump performance curves.
+
+A curve is the pump's (flow in LPM, head in m) points, flow ascending and
+head falling, stored on Product.performance_curve as packed little-endian
+float32 pairs (8 bytes a point). Admins upload them as two-column CSV.
+
+For recommendations many curves are laid out side by side as padded
+(pumps x points) arrays, so the flow every pump delivers at a given head
+is computed for all of them at once (flow_at_head).
+"""
+import csv
+import io
+
+import numpy as np
+
+MAX_POINTS = 16
+
+_DTYPE = np.dtype('<f4')
+
+
+def parse_csv(text):
+    """
+    [(flow, head), ...] from CSV text with one 'flow_lpm,head_m' row per
+    point (a header row is skipped). Raises ValueError describing the
+    first problem found.
+    """
+    points = []
+    for number, row in enumerate(csv.reader(io.StringIO(text)), start=1):
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if not cells:
+            continue
+        try:
+            flow, head = (float(cell) for cell in cells)
+        except ValueError:
+            if number == 1 and not points:
+                continue  # header
+            raise ValueError(f"Line {number}: expected two numbers, flow_lpm and head_m.")
+        if flow < 0 or head < 0:
+            raise ValueError(f"Line {number}: flow and head can't be negative.")
+        points.append((flow, head))
+    return validate(points)
+
+
+def validate(points):
+    points = sorted(points)
+    if not 2 <= len(points) <= MAX_POINTS:
+        raise ValueError(f"A curve needs between 2 and {MAX_POINTS} points.")
+    for (flow_a, head_a), (flow_b, head_b) in zip(points, points[1:]):
+        if flow_b == flow_a:
+            raise ValueError(f"Flow {flow_a:g} appears twice.")
+        if head_b > head_a:
+            raise ValueError("Head must fall (or stay level) as flow rises.")
+    return points
+
+
+def pack(points):
+    return np.asarray(points, dtype=_DTYPE).tobytes()
+
+
+def unpack(blob):
+    """(points x 2) array of flow, head; empty for no curve."""
+    if not blob:
+        return np.empty((0, 2), dtype=_DTYPE)
+    return np.frombuffer(bytes(blob), dtype=_DTYPE).reshape(-1, 2)
+
+
+def to_csv(blob):
+    return ''.join(f'{flow:g},{head:g}\n' for flow, head in unpack(blob))
+
+
+def stack(curves):
+    """Pad a list of unpacked curves into (flows, heads) arrays, NaN past each curve's end."""
+    width = max((len(curve) for curve in curves), default=0) or 1
+    flows = np.full((len(curves), width), np.nan, dtype=_DTYPE)
+    heads = np.full((len(curves), width), np.nan, dtype=_DTYPE)
+    for i, curve in enumerate(curves):
+        flows[i, :len(curve)] = curve[:, 0]
+        heads[i, :len(curve)] = curve[:, 1]
+    return flows, heads
+
+
+def flow_at_head(flows, heads, head):
+    """
+    Flow each curve delivers at `head` metres, by linear interpolation
+    between the two points around it. 0 where the pump can't reach the
+    head (or has no curve); beyond the last point the last flow is used.
+    """
+    valid = ~np.isnan(heads)
+    count = valid.sum(axis=1)
+    # head falls along each curve, so the points still at or above `head` are a prefix
+    reached = (valid & (heads >= head)).sum(axis=1)
+    last = np.maximum(reached - 1, 0)[:, None]
+    after = np.minimum(reached, np.maximum(count - 1, 0))[:, None]
+
+    flow_a = np.take_along_axis(flows, last, axis=1)[:, 0]
+    head_a = np.take_along_axis(heads, last, axis=1)[:, 0]
+    flow_b = np.take_along_axis(flows, after, axis=1)[:, 0]
+    head_b = np.take_along_axis(heads, after, axis=1)[:, 0]
+
+    drop = head_a - head_b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = flow_a + (head_a - head) * (flow_b - flow_a) / drop
+    flow = np.where(reached >= count, flow_a, between)
+    return np.where(reached > 0, flow, 0).astype(np.float64)
@@ -0,0 +1,205 @@
+"""
+Faceted filtering for the shop sidebar.
+
+For every catalog version the available products are loaded once into an
+in-process facet index: one bitmask (a Python int, bit i = i-th product)
+per facet value. Counts for any filter combination are then a few AND/OR
+operations and popcounts, with no GROUP BY queries, and each combination's
+result is memoised on the index. A catalog change (see
+store.service.catalog) makes the next request build a fresh index.
+"""
+from decimal import Decimal
+from functools import lru_cache
+
+from django.db.models import Q
+
+from store.models import Product
+
+from .catalog import CatalogIndex
+
+
+class Facet:
+    def __init__(self, param, label, field, choices=None, buckets=None):
+        """
+        A facet on `field`, selected through the `param` query parameter.
+        Either `choices` ((value, label), ...) for exact values or `buckets`
+        ((key, label, low, high), ...) for [low, high) ranges, high=None
+        meaning unbounded.
+        """
+        self.param = param
+        self.label = label
+        self.field = field
+        self.choices = choices or ()
+        self.buckets = buckets or ()
+
+    def options(self):
+        if self.choices:
+            return list(self.choices)
+        return [(key, label) for key, label, _, _ in self.buckets]
+
+    def key_for(self, value):
+        if value is None:
+            return None
+        if self.choices:
+            return value
+        for key, _, low, high in self.buckets:
+            if value >= low and (high is None or value < high):
+                return key
+        return None
+
+    def q(self, keys):
+        """ORM filter matching any of the selected `keys`."""
+        if self.choices:
+            return Q(**{f'{self.field}__in': keys})
+        condition = Q()
+        for key, _, low, high in self.buckets:
+            if key in keys:
+                bucket = Q(**{f'{self.field}__gte': low})
+                if high is not None:
+                    bucket &= Q(**{f'{self.field}__lt': high})
+                condition |= bucket
+        return condition
+
+
+FACETS = (
+    Facet('phase', 'Phase', 'phase', choices=Product._meta.get_field('phase').choices),
+    Facet('usage', 'Usage', 'usage_type', choices=Product._meta.get_field('usage_type').choices),
+    Facet('hp', 'Motor Power', 'motor_power_hp', buckets=(
+        ('0-1', 'Below 1 HP', Decimal('0'), Decimal('1')),
+        ('1-2', '1–2 HP', Decimal('1'), Decimal('2')),
+        ('2-5', '2–5 HP', Decimal('2'), Decimal('5')),
+        ('5-10', '5–10 HP', Decimal('5'), Decimal('10')),
+        ('10+', '10 HP & above', Decimal('10'), None),
+    )),
+    Facet('head', 'Max Head', 'max_head_m', buckets=(
+        ('0-50', 'Up to 50 m', 0, 50),
+        ('50-100', '50–100 m', 50, 100),
+        ('100-200', '100–200 m', 100, 200),
+        ('200+', '200 m & above', 200, None),
+    )),
+    Facet('flow', 'Max Flow', 'max_flow_lpm', buckets=(
+        ('0-50', 'Up to 50 LPM', 0, 50),
+        ('50-100', '50–100 LPM', 50, 100),
+        ('100-250', '100–250 LPM', 100, 250),
+        ('250+', '250 LPM & above', 250, None),
+    )),
+    Facet('depth', 'Max Depth', 'max_depth_ft', buckets=(
+        ('0-100', 'Up to 100 ft', 0, 100),
+        ('100-300', '100–300 ft', 100, 300),
+        ('300-600', '300–600 ft', 300, 600),
+        ('600+', '600 ft & above', 600, None),
+    )),
+)
+FACETS_BY_PARAM = {facet.param: facet for facet in FACETS}
+
+
+def parse_selection(params):
+    """{param: frozenset(keys)} of valid facet values chosen in a QueryDict."""
+    selection = {}
+    for facet in FACETS:
+        valid = {key for key, _ in facet.options()}
+        keys = frozenset(k for k in params.getlist(facet.param) if k in valid)
+        if keys:
+            selection[facet.param] = keys
+    return selection
+
+
+def apply_selection(queryset, selection):
+    for param, keys in selection.items():
+        queryset = queryset.filter(FACETS_BY_PARAM[param].q(keys))
+    return queryset
+
+
+class FacetIndex:
+    def __init__(self, rows):
+        """`rows` are (id, category_slug, value per facet...) for available products."""
+        self.positions = {row[0]: i for i, row in enumerate(rows)}
+        self.all = (1 << len(rows)) - 1
+        self.categories = {}
+        self.masks = {facet.param: {} for facet in FACETS}
+        for i, row in enumerate(rows):
+            bit = 1 << i
+            self.categories[row[1]] = self.categories.get(row[1], 0) | bit
+            for facet, value in zip(FACETS, row[2:]):
+                key = facet.key_for(value)
+                if key is not None:
+                    masks = self.masks[facet.param]
+                    masks[key] = masks.get(key, 0) | bit
+        self.counts = lru_cache(maxsize=1024)(self._counts)
+
+    def mask_for_ids(self, ids):
+        mask = 0
+        for pid in ids:
+            position = self.positions.get(pid)
+            if position is not None:
+                mask |= 1 << position
+        return mask
+
+    def _selected_mask(self, param, keys):
+        mask = 0
+        for key in keys:
+            mask |= self.masks[param].get(key, 0)
+        return mask
+
+    def _counts(self, category, selection, base):
+        """
+        Counts per facet value. Each facet is counted against the other
+        facets' selections only, so picking "Single Phase" still shows how
+        many "Three Phase" products there are.
+        """
+        scope = self.all if base is None else base
+        if category:
+            scope &= self.categories.get(category, 0)
+        selected = {param: self._selected_mask(param, keys) for param, keys in selection}
+
+        counts = {}
+        for facet in FACETS:
+            mask = scope
+            for param, selected_mask in selected.items():
+                if param != facet.param:
+                    mask &= selected_mask
+            counts[facet.param] = {
+                key: (mask & value_mask).bit_count()
+                for key, value_mask in self.masks[facet.param].items()
+            }
+        return counts
+
+
+def build_index():
+    fields = ['id', 'category__slug'] + [facet.field for facet in FACETS]
+    rows = list(Product.objects.filter(is_available=True).order_by('id').values_list(*fields))
+    return FacetIndex(rows)
+
+
+_index = CatalogIndex(build_index)
+
+
+def get_index():
+    return _index.get()
+
+
+def sidebar(selection, category=None, search_ids=None):
+    """
+    Facet groups for the template: [{param, label, options: [{key, label,
+    count, selected}]}]. `search_ids` restricts counts to search results.
+    """
+    index = get_index()
+    base = None if search_ids is None else index.mask_for_ids(search_ids)
+    frozen = tuple(sorted(selection.items()))
+    counts = index.counts(category or None, frozen, base)
+
+    groups = []
+    for facet in FACETS:
+        chosen = selection.get(facet.param, ())
+        options = [
+            {
+                'key': key,
+                'label': label,
+                'count': counts[facet.param].get(key, 0),
+                'selected': key in chosen,
+            }
+            for key, label in facet.options()
+        ]
+        if any(option['count'] or option['selected'] for option in options):
+            groups.append({'param': facet.param, 'label': facet.label, 'options': options})
+    return groups
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from store.models import Product, StockHold
+
+from .cart import InsufficientStock, line_quantities
+
+
+def active_holds(now=None):
+    return StockHold.objects.filter(expires_at__gt=now or timezone.now())
+
+
+def held_quantity(exclude_razorpay_order_id=None):
+    """
+    Correlated subquery: units of the outer Product currently held by
+    unexpired reservations (0 when there are none).
+    """
+    holds = active_holds().filter(product=OuterRef('pk'))
+    if exclude_razorpay_order_id:
+        holds = holds.exclude(razorpay_order_id=exclude_razorpay_order_id)
+    held = holds.values('product').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(held, output_field=IntegerField()), Value(0))
+
+
+def with_available_stock(queryset):
+    """Annotate `available_stock` = stock minus active holds."""
+    return queryset.annotate(
+        available_stock=Greatest(F('stock') - held_quantity(), Value(0))
+    )
+
+
+def hold_stock(razorpay_order_id, lines, user=None):
+    """
+    Reserve the cart `lines` for `razorpay_order_id` until the hold expires.
+
+    Raises InsufficientStock if any line exceeds what is available to sell.
+    Calling it again for the same razorpay order replaces the earlier holds,
+    and so does a new hold for the same `user`: reloading the payment page
+    creates a new razorpay order, and the buyer's abandoned one must not
+    count against their own cart.
+    """
+    quantities = line_quantities(lines)
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_HOLD_MINUTES)
+
+    with transaction.atomic():
+        previous = Q(razorpay_order_id=razorpay_order_id)
+        if user is not None:
+            previous |= Q(user=user)
+        StockHold.objects.filter(previous).delete()
+
+        products = with_available_stock(
+            Product.objects.select_for_update().filter(id__in=list(quantities))
+        )
+        short = [p for p in products if p.available_stock < quantities[p.id]]
+        if short:
+            raise InsufficientStock(short)
+
+        StockHold.objects.bulk_create([
+            StockHold(
+                product_id=pid,
+                user=user,
+                razorpay_order_id=razorpay_order_id,
+                quantity=qty,
+                expires_at=expires_at,
+            )
+            for pid, qty in quantities.items()
+        ])
+
+
+def release_holds(razorpay_order_id):
+    return StockHold.objects.filter(razorpay_order_id=razorpay_order_id).delete()[0]
+
+
+def release_user_holds(user):
+    """Drop every hold of `user`'s unfinished online payments."""
+    return StockHold.objects.filter(user=user).delete()[0]
+
+
+def release_expired_holds(now=None):
+    """Delete every expired hold in one statement; returns how many were removed."""
+    return StockHold.objects.filter(expires_at__lte=now or timezone.now()).delete()[0]
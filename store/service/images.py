@@ -0,0 +1,106 @@
+"""
+Responsive image variants for product and category images.
+
+Each uploaded image is resized to a few fixed widths and encoded as AVIF
+and WebP next to the original (products/variants/<name>-card-400.webp,
+...). The variant names and pixel sizes are stored on the model in
+`image_variants`, so templates can emit srcset/width/height without
+touching storage:
+
+    {"source": "products/pump.jpg",
+     "card": {"width": 400, "height": 300,
+              "avif": "products/variants/pump-card-400.avif",
+              "webp": "products/variants/pump-card-400.webp"}, ...}
+
+Generation runs in the job worker (store.tasks) or, for the existing media
+tree, in a process pool (manage.py regenerate_image_variants), never on
+the request thread.
+"""
+import posixpath
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .catalog import bump_catalog_version
+
+# name -> target width in pixels
+VARIANTS = {
+    'thumb': 160,
+    'card': 400,
+    'detail': 900,
+}
+
+# format -> Pillow save options, preferred format first
+FORMATS = {
+    'avif': {'quality': 55},
+    'webp': {'quality': 80, 'method': 6},
+}
+
+IMAGE_MODELS = ('store.Product', 'store.Category')
+
+
+def variant_name(source_name, variant, width, fmt):
+    directory, filename = posixpath.split(source_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'variants', f'{stem}-{variant}-{width}.{fmt}')
+
+
+def generate_variants(source_name):
+    """
+    Write every variant of the stored image `source_name` and return the
+    `image_variants` value describing them. Images are never upscaled.
+    Touches storage only (no database), so it is safe to run in a
+    separate process.
+    """
+    with default_storage.open(source_name, 'rb') as handle:
+        image = Image.open(handle)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    variants = {'source': source_name}
+    for variant, target in VARIANTS.items():
+        width = min(target, image.width)
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        entry = {'width': width, 'height': height}
+        for fmt, options in FORMATS.items():
+            name = variant_name(source_name, variant, width, fmt)
+            buffer = BytesIO()
+            resized.save(buffer, format=fmt.upper(), **options)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            entry[fmt] = default_storage.save(name, ContentFile(buffer.getvalue()))
+        variants[variant] = entry
+    return variants
+
+
+def needs_variants(instance):
+    """True if `instance.image` has no up-to-date variants yet."""
+    return bool(instance.image) and (instance.image_variants or {}).get('source') != instance.image.name
+
+
+def store_variants(model_label, pk, variants, bump=True):
+    """
+    Save generated `variants` on the row, unless its image was replaced in
+    the meantime. Uses UPDATE so no save signals fire; bumps the catalog
+    version itself (unless the caller batches that) since cached pages
+    embed the variant URLs.
+    """
+    model = apps.get_model(model_label)
+    updated = model.objects.filter(pk=pk, image=variants['source']).update(image_variants=variants)
+    if updated and bump:
+        bump_catalog_version()
+    return bool(updated)
+
+
+def process_image(model_label, pk):
+    """Generate and store variants for one row (the job worker entry point)."""
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if instance is None or not needs_variants(instance):
+        return False
+    return store_variants(model_label, pk, generate_variants(instance.image.name))
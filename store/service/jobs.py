@@ -0,0 +1,100 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from store.models import Job
+
+logger = logging.getLogger(__name__)
+
+# name -> callable(**payload); filled by the @task decorator (see store.tasks)
+_registry = {}
+
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+# A running job whose worker died is picked up again after this long
+STALE_LOCK = timedelta(minutes=10)
+
+
+def task(name):
+    """Register a function as a background job handler under `name`."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, max_attempts=5, delay=None, **payload):
+    """
+    Queue `name` to run in the worker with `payload` as keyword arguments.
+
+    The row is written in the caller's transaction, so a job queued inside
+    an atomic block only becomes visible if that block commits.
+    """
+    run_after = timezone.now()
+    if delay:
+        run_after += delay
+    return Job.objects.create(
+        name=name, payload=payload, max_attempts=max_attempts, run_after=run_after
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number `attempts` (30s, 60s, 120s, ... capped)."""
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+def _claim(job, now):
+    """Atomically mark `job` as ours; False if another worker got it first."""
+    return Job.objects.filter(
+        id=job.id, status=job.status, attempts=job.attempts
+    ).update(status='running', locked_at=now, updated_at=now) == 1
+
+
+def due_jobs(now, limit):
+    stale = now - STALE_LOCK
+    return Job.objects.filter(
+        Q(status='pending', run_after__lte=now) |
+        Q(status='running', locked_at__lte=stale)
+    ).order_by('run_after', 'id')[:limit]
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome, scheduling a retry on failure."""
+    handler = _registry.get(job.name)
+    job.attempts += 1
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job '{job.name}'")
+        handler(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            logger.error("Job %s failed permanently after %s attempts", job, job.attempts)
+        else:
+            job.status = 'pending'
+            job.run_after = timezone.now() + timedelta(seconds=backoff(job.attempts))
+            logger.warning("Job %s failed, retry %s scheduled at %s", job, job.attempts, job.run_after)
+    else:
+        job.status = 'done'
+        job.last_error = ''
+    job.locked_at = None
+    job.save(update_fields=['attempts', 'status', 'run_after', 'last_error', 'locked_at', 'updated_at'])
+    return job.status == 'done'
+
+
+def run_pending(limit=50):
+    """Process up to `limit` due jobs; returns (succeeded, failed) counts."""
+    now = timezone.now()
+    succeeded = failed = 0
+    for job in due_jobs(now, limit):
+        if not _claim(job, now):
+            continue
+        if run_job(job):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
@@ -0,0 +1,133 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from store.models import OrderItem, Product
+
+from .cart import InsufficientStock, line_quantities
+from .holds import held_quantity, release_holds, release_user_holds, with_available_stock
+from .sales import record_order
+
+logger = logging.getLogger(__name__)
+
+
+def _per_product(quantities):
+    return Case(
+        *[When(id=pid, then=Value(qty)) for pid, qty in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def decrement_stock(quantities, razorpay_order_id=None):
+    """
+    Take `quantities` ({product_id: qty}) out of stock with one conditional
+    UPDATE. Stock held by other customers' pending payments is not touched;
+    holds belonging to `razorpay_order_id` are treated as ours.
+
+    Returns True only if every product had enough stock; the caller must
+    roll back otherwise, since the rows that did match were updated.
+    """
+    if not quantities:
+        return True
+
+    wanted = _per_product(quantities)
+    updated = (
+        Product.objects
+        .filter(id__in=list(quantities))
+        .filter(stock__gte=wanted + held_quantity(exclude_razorpay_order_id=razorpay_order_id))
+        .update(stock=F('stock') - wanted)
+    )
+    return updated == len(quantities)
+
+
+def _short_products(quantities):
+    # same rule as decrement_stock: stock held for pending payments isn't for sale
+    products = with_available_stock(Product.objects.filter(id__in=list(quantities)))
+    return [p for p in products if p.available_stock < quantities[p.id]]
+
+
+def _set_totals(order, lines):
+    order.total = sum((line.subtotal for line in lines), 0)
+    order.item_count = sum(line.quantity for line in lines)
+
+
+def _create_items(order, lines):
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product=line.product,
+            quantity=line.quantity,
+            price=line.product.price,
+            category_name=line.product.category.name,
+        )
+        for line in lines
+    ])
+
+
+class _StockConflict(Exception):
+    pass
+
+
+def place_order(order, lines):
+    """
+    Save `order`, its items and the stock decrement as one transaction.
+
+    `lines` are priced cart lines (see store.service.cart). Items are
+    written with a single bulk_create. If any line can't be satisfied the
+    whole order is rolled back and InsufficientStock is raised.
+
+    The buyer's holds from an online payment they abandoned for this order
+    are released first, so their own reservation doesn't block it.
+    """
+    quantities = line_quantities(lines)
+
+    try:
+        with transaction.atomic():
+            if order.user_id:
+                release_user_holds(order.user_id)
+            _set_totals(order, lines)
+            order.save()
+            if not decrement_stock(quantities):
+                raise _StockConflict
+            _create_items(order, lines)
+            record_order(order)
+    except _StockConflict:
+        order.pk = None
+        raise InsufficientStock(_short_products(quantities))
+
+    return order
+
+
+def place_paid_order(order, lines):
+    """
+    Record an order whose online payment has already been captured and turn
+    its stock holds into a real decrement.
+
+    The money is already taken, so the order is never rejected: if the holds
+    expired and the stock was sold meanwhile, stock is floored at zero and
+    the shortfall is logged for the shop to follow up.
+    """
+    quantities = line_quantities(lines)
+
+    with transaction.atomic():
+        _set_totals(order, lines)
+        order.save()
+        try:
+            with transaction.atomic():
+                if not decrement_stock(quantities, razorpay_order_id=order.razorpay_order_id):
+                    raise _StockConflict
+        except _StockConflict:
+            logger.error(
+                "Paid order %s (%s) exceeds available stock; flooring at zero",
+                order.id, order.razorpay_order_id,
+            )
+            Product.objects.filter(id__in=list(quantities)).update(
+                stock=Greatest(F('stock') - _per_product(quantities), Value(0))
+            )
+        _create_items(order, lines)
+        record_order(order)
+        release_holds(order.razorpay_order_id)
+
+    return order
@@ -0,0 +1,88 @@
+"""
+Keyset (cursor) pagination for storefront listings.
+
+Pages are fetched with `WHERE (sort key) > (last row's key)` on a stable
+ordering that always ends in the primary key, so every page costs the
+same no matter how deep the visitor scrolls and no COUNT(*) is needed.
+Cursors are signed, opaque tokens; a bad or tampered token just yields
+the first page.
+"""
+from django.core import signing
+from django.db.models import Q
+
+from . import search
+
+PAGE_SIZE = 24
+
+SORTS = {
+    'newest': ('-id',),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+}
+RELEVANCE = 'relevance'
+
+_SALT = 'store.shop.cursor'
+
+
+def encode_cursor(sort, position):
+    return signing.dumps({'s': sort, 'p': position}, salt=_SALT, compress=True)
+
+
+def decode_cursor(token, sort):
+    """Position stored in `token`, or None if missing, invalid or for another sort."""
+    if not token:
+        return None
+    try:
+        data = signing.loads(token, salt=_SALT)
+    except signing.BadSignature:
+        return None
+    if data.get('s') != sort:
+        return None
+    return data.get('p')
+
+
+def _after(fields, values):
+    """Q for rows strictly after `values` in the ordering given by `fields`."""
+    condition = Q()
+    for i, field in enumerate(fields):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        for prev_field, prev_value in zip(fields[:i], values[:i]):
+            step &= Q(**{prev_field.lstrip('-'): prev_value})
+        condition |= step
+    return condition
+
+
+def keyset_page(queryset, sort, cursor=None, page_size=PAGE_SIZE):
+    """Return (rows, next_cursor) for one page of `queryset` in `sort` order."""
+    fields = SORTS[sort]
+    queryset = queryset.order_by(*fields)
+    position = decode_cursor(cursor, sort)
+    if position is not None:
+        queryset = queryset.filter(_after(fields, position))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, [str(getattr(last, f.lstrip('-'))) for f in fields])
+    return rows, next_cursor
+
+
+def relevance_page(queryset, query, cursor=None, page_size=PAGE_SIZE):
+    """
+    Return (rows, next_cursor) for search results in relevance order. The
+    ranked id list is already bounded (search.RESULT_LIMIT), so the cursor
+    is simply an offset into it. Needs the FTS5 index.
+    """
+    offset = decode_cursor(cursor, RELEVANCE) or 0
+    ids = search.ranked_ids(query, within=queryset)
+    page_ids = ids[offset:offset + page_size]
+    found = queryset.in_bulk(page_ids)
+    rows = [found[pid] for pid in page_ids if pid in found]
+    next_cursor = None
+    if len(ids) > offset + page_size:
+        next_cursor = encode_cursor(RELEVANCE, offset + page_size)
+    return rows, next_cursor
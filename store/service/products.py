@@ -0,0 +1,128 @@
+"""
+Read-through cache for single products, looked up by id or slug.
+
+Lookups go to a small in-process LRU first, then the shared cache, then
+the database. Entries are keyed on the catalog version, so any product or
+category save/delete (store.signals) invalidates them everywhere.
+
+`stock` is deliberately left out of the cached row: it changes on every
+order without a catalog bump. Callers get their own copy of the product
+and reading `product.stock` on it loads the live value with one query, so
+stock checks are never answered from the cache.
+
+Outcomes are counted in the default cache (see stats()). With a shared
+backend that is the hit rate across all worker processes; with the
+local-memory default each worker counts its own, and the figures are
+read from a running server (views.cache_stats_api), not a new process.
+"""
+import copy
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.http import Http404
+
+from store.models import Product
+
+from .catalog import CACHE_TIMEOUT, catalog_key, catalog_version
+
+LRU_SIZE = 256
+
+OUTCOMES = ('local', 'shared', 'miss')
+_STATS_KEY = 'stats:product-cache:{}'
+
+# Marks "no such product" so misses for bad ids/slugs are cached too
+_MISSING = 'missing'
+
+
+class LRU:
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = LRU(LRU_SIZE)
+
+
+def _record(outcome):
+    key = _STATS_KEY.format(outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def stats():
+    counts = {outcome: cache.get(_STATS_KEY.format(outcome), 0) for outcome in OUTCOMES}
+    total = sum(counts.values())
+    counts['lookups'] = total
+    counts['hit_rate'] = (counts['local'] + counts['shared']) / total if total else 0.0
+    return counts
+
+
+def reset_stats():
+    cache.delete_many([_STATS_KEY.format(outcome) for outcome in OUTCOMES])
+
+
+def _load(**lookup):
+    product = (
+        Product.objects.select_related('category').defer('stock', 'performance_curve').filter(**lookup).first()
+    )
+    return product if product is not None else _MISSING
+
+
+def _lookup(name, value, **lookup):
+    version = catalog_version()
+    local_key = (version, name, value)
+    product = _local.get(local_key)
+    if product is not None:
+        _record('local')
+    else:
+        key = catalog_key(name, value)
+        product = cache.get(key)
+        if product is not None:
+            _record('shared')
+        else:
+            _record('miss')
+            product = _load(**lookup)
+            cache.set(key, product, CACHE_TIMEOUT)
+        _local.put(local_key, product)
+
+    if isinstance(product, str):
+        return None
+    # Each caller gets its own instance (and its own lazily loaded stock)
+    return copy.copy(product)
+
+
+def get_product(pk=None, slug=None):
+    """The product with `pk` or `slug` (without cached stock), or None."""
+    if pk is not None:
+        return _lookup('product-id', int(pk), pk=pk)
+    return _lookup('product-slug', slug, slug=slug)
+
+
+def get_product_or_404(pk=None, slug=None, available_only=False):
+    product = get_product(pk=pk, slug=slug)
+    if product is None or (available_only and not product.is_available):
+        raise Http404("No product matches the given query.")
+    return product
@@ -1,25 +1,361 @@
+"""
+Pump recommendations from an in-process, vectorised index.
+
+For every catalog version the available pumps are loaded once into NumPy
+column arrays (price, power, head, flow, depth, coded phase and usage)
+alongside their pre-serialised API rows. A query is then a few boolean
+masks over the columns, a weighted fit score for the candidates that pass,
+and a top-k selection with argpartition: no database access and well
+under a millisecond for tens of thousands of pumps. A catalog change (see
+store.service.catalog) makes the next query build a fresh index, the same
+way the facet index (store.service.facets) is refreshed.
+
+The fit score is a weighted sum of, each scaled to 0..1:
+
+  depth   how closely the pump's rated depth matches the borewell
+          (a pump rated for just a bit more than needed fits best)
+  head    whether its head covers the lift the depth implies
+  flow    its flow relative to the best candidate
+  power   its motor power relative to the best candidate
+  price   how cheap it is relative to the cheapest candidate
+
+When the caller gives an operating point (flow_lpm at head_m) the index
+instead interpolates every candidate's performance curve (service.curves)
+at that head, drops pumps that can't deliver the flow and ranks the rest
+by efficiency margin: the least oversized pump runs closest to its duty
+point. Pumps without an uploaded curve use the straight line from
+(0, max_head_m) to (max_flow_lpm, 0).
+
+Results are cached in the shared cache under a normalised query (see
+PumpIndex.normalize): every depth between two neighbouring pump ratings,
+and every budget between two neighbouring prices, selects exactly the
+same pumps, so they share one entry. Hit/miss counts and the time spent
+answering each are kept in the cache too (see stats()); like the product
+cache counters they are per worker under the local-memory cache, so they
+are read from the server (views.cache_stats_api).
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
 from store.models import Product
+from store.serializers import ProductRecommendationSerializer
+
+from . import curves
+from .catalog import CACHE_TIMEOUT, CatalogIndex, catalog_key
+
+WEIGHTS = {
+    'depth': 0.30,
+    'head': 0.20,
+    'flow': 0.15,
+    'power': 0.10,
+    'price': 0.25,
+}
+
+FT_TO_M = 0.3048
+
+# Lift needed per metre of depth, allowing for drawdown and pipe friction
+HEAD_ALLOWANCE = 1.25
+
+# A pump rated this much deeper than needed (as a fraction) gets half the depth score
+DEPTH_SLACK = 0.5
+
+
+def _column(values):
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+
+
+def _ratio(values, best):
+    """values / best, with missing values and a missing/zero best counting as 0."""
+    if not np.isfinite(best) or best <= 0:
+        return np.zeros_like(values)
+    return np.nan_to_num(values / best, nan=0.0)
+
+
+def _curve(blob, max_flow, max_head):
+    curve = curves.unpack(blob)
+    if not len(curve) and max_flow and max_head:
+        curve = np.array([(0, max_head), (max_flow, 0)], dtype=np.float32)
+    return curve
+
+
+class PumpIndex:
+    def __init__(self, rows, curve_blobs=None):
+        """
+        `rows` are serialised recommendations (ProductRecommendationSerializer
+        data); `curve_blobs` the matching packed performance curves.
+        """
+        self.rows = rows
+        # product id -> position, so a stored set of ids survives an index rebuild
+        self.positions = {row['id']: i for i, row in enumerate(rows)}
+        self.price = _column(row['price'] for row in rows)
+        self.power = _column(row['motor_power_hp'] for row in rows)
+        self.head = _column(row['max_head_m'] for row in rows)
+        self.flow = _column(row['max_flow_lpm'] for row in rows)
+        self.depth = _column(row['max_depth_ft'] for row in rows)
+        self.phase_codes, self.phase = self._codes(row['phase'] for row in rows)
+        self.usage_codes, self.usage = self._codes(row['usage_type'] for row in rows)
+        self.curve_flows, self.curve_heads = curves.stack([
+            _curve(blob, row['max_flow_lpm'], row['max_head_m'])
+            for row, blob in zip(rows, curve_blobs or [None] * len(rows))
+        ])
+        # distinct ratings and prices: the edges of the normalised query buckets
+        self.depth_breakpoints = np.unique(self.depth[~np.isnan(self.depth)])
+        self.price_breakpoints = np.unique(self.price[~np.isnan(self.price)])
+
+    @staticmethod
+    def _codes(values):
+        codes = {}
+        column = np.array([codes.setdefault(v, len(codes)) for v in values], dtype=np.int16)
+        return codes, column
+
+    def __len__(self):
+        return len(self.rows)
+
+    def normalize(self, depth_ft, usage_type, phase, max_budget=None):
+        """
+        The canonical form of a query: depth raised to the shallowest pump
+        rating that covers it (inf if none does) and budget lowered to the
+        dearest price within it (-1 if none is). Queries with the same
+        canonical form match the same pumps.
+        """
+        depths = self.depth_breakpoints
+        i = np.searchsorted(depths, depth_ft, side='left')
+        depth = float(depths[i]) if i < len(depths) else float('inf')
+        budget = None
+        if max_budget is not None:
+            j = np.searchsorted(self.price_breakpoints, max_budget, side='right')
+            budget = float(self.price_breakpoints[j - 1]) if j else -1.0
+        return depth, (usage_type or '').strip().lower(), (phase or '').strip().lower(), budget
+
+    def group(self, usage_type, phase):
+        """Positions of the pumps for one (usage_type, phase) pair."""
+        usage = self.usage_codes.get(usage_type)
+        phase = self.phase_codes.get(phase)
+        if usage is None or phase is None:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero((self.usage == usage) & (self.phase == phase))
+
+    def candidates(self, depth_ft, usage_type, phase, max_budget=None, within=None):
+        """
+        Positions of the pumps that pass the hard filters. `within`, the
+        group() for this usage and phase, saves rescanning the whole index.
+        """
+        positions = self.group(usage_type, phase) if within is None else within
+        mask = self.depth[positions] >= depth_ft
+        if max_budget is not None:
+            mask &= self.price[positions] <= max_budget
+        return positions[mask]
+
+    def score(self, positions, depth_ft):
+        """Weighted fit score (0..1) of each pump in `positions` for a `depth_ft` borewell."""
+        depth = self.depth[positions]
+        margin = (depth - depth_ft) / max(depth_ft, 1)
+        depth_fit = 1 / (1 + margin / DEPTH_SLACK)
+
+        head_needed = max(depth_ft * FT_TO_M * HEAD_ALLOWANCE, 1)
+        head_fit = np.clip(np.nan_to_num(self.head[positions] / head_needed, nan=0.0), 0, 1)
+
+        flow = self.flow[positions]
+        power = self.power[positions]
+        price = self.price[positions]
+        flow_fit = _ratio(flow, np.nanmax(flow, initial=0))
+        power_fit = _ratio(power, np.nanmax(power, initial=0))
+        cheapest = np.nanmin(price, initial=np.inf)
+        price_fit = np.where(price > 0, cheapest / np.where(price > 0, price, 1), 1.0)
+
+        return (
+            WEIGHTS['depth'] * depth_fit
+            + WEIGHTS['head'] * head_fit
+            + WEIGHTS['flow'] * flow_fit
+            + WEIGHTS['power'] * power_fit
+            + WEIGHTS['price'] * price_fit
+        )
 
-def recommend_pumps(depth_ft, usage_type, phase, max_budget=None):
+    def operating_point(self, positions, flow_lpm, head_m):
+        """
+        For the pumps in `positions`: the flow each delivers at `head_m` and
+        its efficiency margin, (flow - flow_lpm) / flow_lpm.
+        """
+        flow = curves.flow_at_head(self.curve_flows[positions], self.curve_heads[positions], head_m)
+        return flow, (flow - flow_lpm) / max(flow_lpm, 1e-9)
+
+    def recommend(self, depth_ft, usage_type, phase, max_budget=None, limit=None,
+                  flow_lpm=None, head_m=None, within=None):
+        """(number of matching pumps, the best `limit` of them, best first)."""
+        positions = self.candidates(depth_ft, usage_type, phase, max_budget, within)
+        if flow_lpm is not None and head_m is not None and len(positions):
+            flow, margin = self.operating_point(positions, flow_lpm, head_m)
+            enough = flow >= flow_lpm
+            positions, flow, margin = positions[enough], flow[enough], margin[enough]
+            # smallest margin (least oversized) first
+            scores = -margin
+        else:
+            flow = margin = None
+            scores = self.score(positions, depth_ft) if len(positions) else None
+
+        total = len(positions)
+        if not total:
+            return 0, []
+        if limit is not None and total > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            positions, scores = positions[top], scores[top]
+            if flow is not None:
+                flow, margin = flow[top], margin[top]
+        # best score first; the cheaper pump wins a tie
+        order = np.lexsort((self.price[positions], -scores))
+        if flow is None:
+            return total, [self.rows[i] for i in positions[order]]
+        return total, [
+            {
+                **self.rows[positions[i]],
+                'operating_flow_lpm': round(float(flow[i]), 1),
+                'efficiency_margin': round(float(margin[i]), 3),
+            }
+            for i in order
+        ]
+
+
+def build_index():
+    products = list(Product.objects.filter(is_available=True).order_by('id'))
+    return PumpIndex(
+        list(ProductRecommendationSerializer(products, many=True).data),
+        [product.performance_curve for product in products],
+    )
+
+
+_index = CatalogIndex(build_index)
+
+
+def get_index():
+    return _index.get()
+
+
+def recommend_many(queries, limit=None):
     """
-    Rule-based recommendation logic
+    Answer many queries (dicts with the recommend_pumps arguments) in one
+    pass, yielding (count, rows) for each in order. The index is scanned
+    once per (usage_type, phase) pair, each query then only filters and
+    scores its group; nothing touches the database or the result cache.
     """
+    if limit is None:
+        limit = settings.RECOMMENDATION_LIMIT
+    index = get_index()
+    groups = {}
+    for query in queries:
+        usage_type, phase = query['usage_type'], query['phase']
+        if (usage_type, phase) not in groups:
+            groups[usage_type, phase] = index.group(usage_type, phase)
+        yield index.recommend(
+            query['depth_ft'], usage_type, phase,
+            max_budget=query.get('max_budget'),
+            limit=limit or None,
+            flow_lpm=query.get('flow_lpm'),
+            head_m=query.get('head_m'),
+            within=groups[usage_type, phase],
+        )
+
+
+def parse_query(raw):
+    """
+    A recommend_many() query from one batch row (a JSON object or CSV
+    record of strings). Raises ValueError naming the problem.
+    """
+    def number(name, cast=float):
+        value = raw.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be a number")
+
+    query = {
+        'depth_ft': number('depth_ft', int),
+        'usage_type': str(raw.get('usage_type') or '').strip().lower(),
+        'phase': str(raw.get('phase') or '').strip().lower(),
+        'max_budget': number('budget'),
+        'flow_lpm': number('flow_lpm'),
+        'head_m': number('head_m'),
+    }
+    if query['depth_ft'] is None or not query['usage_type'] or not query['phase']:
+        raise ValueError("depth_ft, usage_type and phase are required")
+    if (query['flow_lpm'] is None) != (query['head_m'] is None):
+        raise ValueError("flow_lpm and head_m must be given together")
+    return query
+
+
+OUTCOMES = ('hit', 'miss')
+_STATS_KEY = 'stats:recommend-cache:{}'
+
+
+def _record(outcome, seconds):
+    for name, amount in ((outcome, 1), (f'{outcome}-us', int(seconds * 1_000_000))):
+        key = _STATS_KEY.format(name)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            if not cache.add(key, amount, timeout=None):
+                cache.incr(key, amount)
 
-    qs = Product.objects.filter(
-        is_available=True,
-        usage_type=usage_type,
-        phase=phase,
-        max_depth_ft__gte=depth_ft
-    )
 
-    if max_budget:
-        qs = qs.filter(price__lte=max_budget)
+def stats():
+    """Hit/miss counts, hit rate and mean milliseconds per hit and per miss."""
+    result = {}
+    for outcome in OUTCOMES:
+        count = cache.get(_STATS_KEY.format(outcome), 0)
+        micros = cache.get(_STATS_KEY.format(f'{outcome}-us'), 0)
+        result[outcome] = count
+        result[f'{outcome}_ms'] = micros / count / 1000 if count else 0.0
+    lookups = result['hit'] + result['miss']
+    result['lookups'] = lookups
+    result['hit_rate'] = result['hit'] / lookups if lookups else 0.0
+    return result
 
-    # Ranking logic (best first)
-    qs = qs.order_by(
-        'price',             # cheaper first
-        '-motor_power_hp',   # higher power preferred
-        '-max_flow_lpm'      # higher flow preferred
+
+def reset_stats():
+    cache.delete_many([
+        _STATS_KEY.format(name) for outcome in OUTCOMES for name in (outcome, f'{outcome}-us')
+    ])
+
+
+def recommend_pumps(depth_ft, usage_type, phase, max_budget=None, limit=None,
+                    flow_lpm=None, head_m=None):
+    """
+    Available pumps for a borewell of `depth_ft` feet, best fit first, as
+    (number of matches, serialised rows). With an operating point (both
+    `flow_lpm` and `head_m`) only pumps delivering it are returned, ranked
+    by efficiency margin. `limit` defaults to RECOMMENDATION_LIMIT; pass 0
+    for every match.
+
+    Answers come from the result cache when an equivalent query (same
+    normalised form) was answered under the current catalog version; the
+    ranking is computed for the normalised depth so it is the same for
+    every query sharing the entry.
+    """
+    started = time.perf_counter()
+    if limit is None:
+        limit = settings.RECOMMENDATION_LIMIT
+    index = get_index()
+    depth, usage_type, phase, budget = index.normalize(
+        depth_ft, usage_type, phase,
+        max_budget=None if max_budget in (None, '') else float(max_budget),
     )
+    key = catalog_key('recommend', depth, usage_type, phase, budget, limit or None, flow_lpm, head_m)
+    result = cache.get(key)
+    if result is not None:
+        _record('hit', time.perf_counter() - started)
+        return result
 
-    return qs
+    result = index.recommend(
+        depth, usage_type, phase,
+        max_budget=budget,
+        limit=limit or None,
+        flow_lpm=flow_lpm,
+        head_m=head_m,
+    )
+    cache.set(key, result, CACHE_TIMEOUT)
+    _record('miss', time.perf_counter() - started)
+    return result
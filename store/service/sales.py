@@ -0,0 +1,139 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Lower, TruncDate
+from django.utils import timezone
+
+from store.models import DailyCategorySales, DailySales, Order, OrderItem
+
+UNKNOWN_CATEGORY = 'Unknown'
+
+
+def _bump(model, key, **deltas):
+    """Add `deltas` to the rollup row identified by `key`, creating it if needed."""
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # created concurrently, add to it instead
+        model.objects.filter(**key).update(**changes)
+
+
+def _category_breakdown(order):
+    rows = (
+        order.items
+        .values(name=F('category_name'))
+        .annotate(revenue=Sum(F('price') * F('quantity')), items=Sum('quantity'))
+    )
+    return [(r['name'] or UNKNOWN_CATEGORY, r['revenue'] or 0, r['items'] or 0) for r in rows]
+
+
+def figures(order):
+    """
+    What `order` contributes to the rollup, as (total, item_count,
+    per-category breakdown). Take it before editing an order's items and
+    hand it to record_total_change() afterwards.
+    """
+    return order.total, order.item_count, _category_breakdown(order)
+
+
+def _apply(order, status, sign, figures):
+    day = timezone.localdate(order.created_at)
+    status = (status or '').lower()
+    total, item_count, breakdown = figures
+
+    _bump(
+        DailySales, {'date': day, 'status': status},
+        revenue=sign * total,
+        order_count=sign,
+        item_count=sign * item_count,
+    )
+    for name, revenue, items in breakdown:
+        _bump(
+            DailyCategorySales, {'date': day, 'status': status, 'category_name': name},
+            revenue=sign * revenue,
+            item_count=sign * items,
+        )
+
+    if sign < 0:
+        # drop rows emptied by the move so a rebuild gives identical tables
+        DailySales.objects.filter(date=day, status=status, order_count=0).delete()
+        DailyCategorySales.objects.filter(date=day, status=status, item_count=0).delete()
+
+
+def record_order(order):
+    """Add a newly placed order (items already saved) to the rollup."""
+    _apply(order, order.status, 1, figures(order))
+
+
+def record_status_change(order, old_status):
+    """Move an order's figures from `old_status` to its current status."""
+    if (old_status or '').lower() == (order.status or '').lower():
+        return
+    current = figures(order)
+    with transaction.atomic():
+        _apply(order, old_status, -1, current)
+        _apply(order, order.status, 1, current)
+
+
+def record_total_change(order, before):
+    """
+    Replace the figures `before` (see figures()) with the order's current
+    ones, after its items or stored totals were changed.
+    """
+    after = figures(order)
+    if after == before:
+        return
+    with transaction.atomic():
+        _apply(order, order.status, -1, before)
+        _apply(order, order.status, 1, after)
+
+
+def record_delete(order):
+    """Take an order out of the rollup; call it before deleting, while its items exist."""
+    _apply(order, order.status, -1, figures(order))
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute both rollup tables from scratch with two GROUP BY queries."""
+    DailySales.objects.all().delete()
+    DailyCategorySales.objects.all().delete()
+
+    daily = (
+        Order.objects
+        .annotate(day=TruncDate('created_at'), status_key=Lower('status'))
+        .values('day', 'status_key')
+        .annotate(revenue=Sum('total'), orders=Count('id'), items=Sum('item_count'))
+    )
+    DailySales.objects.bulk_create([
+        DailySales(
+            date=row['day'], status=row['status_key'],
+            revenue=row['revenue'] or 0, order_count=row['orders'], item_count=row['items'] or 0,
+        )
+        for row in daily
+    ])
+
+    by_category = (
+        OrderItem.objects
+        .annotate(
+            day=TruncDate('order__created_at'),
+            status_key=Lower('order__status'),
+            name=F('category_name'),
+        )
+        .values('day', 'status_key', 'name')
+        .annotate(revenue=Sum(F('price') * F('quantity')), items=Sum('quantity'))
+    )
+    merged = {}
+    for row in by_category:
+        key = (row['day'], row['status_key'], row['name'] or UNKNOWN_CATEGORY)
+        revenue, items = merged.get(key, (0, 0))
+        merged[key] = (revenue + (row['revenue'] or 0), items + (row['items'] or 0))
+    DailyCategorySales.objects.bulk_create([
+        DailyCategorySales(date=day, status=status, category_name=name, revenue=revenue, item_count=items)
+        for (day, status, name), (revenue, items) in merged.items()
+    ])
+
+    return len(daily), len(merged)
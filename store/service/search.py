@@ -0,0 +1,157 @@
+"""
+Product search backed by an SQLite FTS5 index (store_product_fts).
+
+The index holds name, model number, description and category name for
+every product, keyed by rowid = product id. It is kept in sync by the
+signal handlers in store.signals. When FTS5 isn't available (another
+database backend, or SQLite built without it) search falls back to
+icontains filters.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'store_product_fts'
+
+# bm25 weights for name, model_number, description, category
+COLUMN_WEIGHTS = (10.0, 8.0, 1.0, 3.0)
+
+# Ranked ids fetched from the index per search
+RESULT_LIMIT = 500
+
+# Keep '-' inside tokens so model numbers like "V-4" stay one term
+CREATE_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, model_number, description, category, "
+    "tokenize = \"unicode61 tokenchars '-'\")"
+)
+
+_TOKEN_RE = re.compile(r"[\w-]+")
+
+_available = None
+
+
+def fts_available():
+    global _available
+    if _available is None:
+        _available = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _available
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query: every term must match as a prefix."""
+    terms = [t.strip('-') for t in _TOKEN_RE.findall(query.lower())]
+    return ' '.join(f'"{t}"*' for t in terms if t)
+
+
+def index_products(products):
+    """(Re)index the given Product instances (category should be loaded)."""
+    if not fts_available():
+        return
+    rows = [
+        (p.id, p.name, p.model_number or '', p.description or '', p.category.name)
+        for p in products
+    ]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(r[0],) for r in rows])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, model_number, description, category) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def remove_products(ids):
+    if not fts_available() or not ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pid,) for pid in ids])
+
+
+def rebuild_index():
+    """Repopulate the whole index from the product table with one INSERT ... SELECT."""
+    if not fts_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, model_number, description, category) "
+            "SELECT p.id, p.name, COALESCE(p.model_number, ''), p.description, c.name "
+            "FROM store_product p JOIN store_category c ON c.id = p.category_id"
+        )
+        return cursor.rowcount
+
+
+def ranked_ids(query, within=None, limit=None):
+    """
+    Product ids matching `query`, best match first, at most `limit`
+    (RESULT_LIMIT by default). `within` is an optional Product queryset
+    (e.g. category/availability filters) to restrict to, applied before the
+    limit so filtered searches aren't starved.
+    """
+    if limit is None:
+        limit = RESULT_LIMIT
+    expression = match_expression(query)
+    if not expression:
+        return []
+    weights = ', '.join(str(w) for w in COLUMN_WEIGHTS)
+    sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    params = [expression]
+    if within is not None:
+        # Correlated primary-key probe per match: MATCH drives the query and
+        # the product table is never scanned.
+        probe = within.order_by().filter(id=RawSQL(f"{FTS_TABLE}.rowid", ())).values('id')
+        within_sql, within_params = probe.query.sql_with_params()
+        sql += f" AND EXISTS ({within_sql})"
+        params.extend(within_params)
+    sql += f" ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def icontains_filter(query):
+    return (
+        Q(name__icontains=query) |
+        Q(model_number__icontains=query) |
+        Q(description__icontains=query) |
+        Q(category__name__icontains=query)
+    )
+
+
+def match_filter(expression):
+    """Q for products matching an FTS `expression` (see match_expression), uncapped."""
+    sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    return Q(id__in=RawSQL(sql, (expression,)))
+
+
+def search_products(queryset, query, ranked=True):
+    """
+    Filter `queryset` to products matching `query`. Ranked, they are the
+    RESULT_LIMIT best matches ordered by relevance; unranked, every match
+    with no ordering, for callers that sort and page by something else.
+    """
+    if not fts_available():
+        return queryset.filter(icontains_filter(query))
+
+    if not ranked:
+        expression = match_expression(query)
+        return queryset.filter(match_filter(expression)) if expression else queryset.none()
+
+    ids = ranked_ids(query, within=queryset)
+    if not ids:
+        return queryset.none()
+    # Order by position in the ranked id list. A single instr() expression
+    # compiles far faster than a CASE with hundreds of WHEN branches.
+    positions = ',' + ','.join(str(pid) for pid in ids) + ','
+    table = queryset.model._meta.db_table
+    rank = RawSQL(f"""instr(%s, ',' || "{table}"."id" || ',')""", (positions,))
+    return queryset.filter(id__in=ids).order_by(rank)
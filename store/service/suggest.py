@@ -0,0 +1,102 @@
+"""
+In-process typeahead index for the shop search box.
+
+Product names, model numbers and category names are normalised into a
+sorted list of keys; a lookup is two bisects plus a short scan, so the
+hot path touches neither the database nor the cache backend beyond one
+catalog version read. The index is built lazily and rebuilt when the
+catalog version changes.
+"""
+import re
+from bisect import bisect_left
+
+from django.urls import reverse
+
+from store.models import Category, Product
+
+from .catalog import CatalogIndex
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+# Keys scanned per lookup before ranking; bounds the cost of short prefixes
+SCAN_LIMIT = 200
+
+_WORD_RE = re.compile(r"[\w-]+")
+
+
+def normalize(text):
+    return ' '.join(_WORD_RE.findall((text or '').lower()))
+
+
+class PrefixIndex:
+    def __init__(self, entries):
+        """
+        `entries` is a list of suggestion dicts with a 'label' and optional
+        'model_number'. Each entry is reachable by the prefix of its full
+        label, of any later word in it, and of its model number.
+        """
+        self.entries = entries
+        keys = []
+        for position, entry in enumerate(entries):
+            label = normalize(entry['label'])
+            words = label.split(' ')
+            for i in range(len(words)):
+                # rank 0 for the whole label, 1 for inner words
+                keys.append((' '.join(words[i:]), 0 if i == 0 else 1, position))
+            model = normalize(entry.get('model_number'))
+            if model:
+                keys.append((model, 0, position))
+        keys.sort()
+        self.keys = [k[0] for k in keys]
+        self.refs = [(k[1], k[2]) for k in keys]
+
+    def search(self, prefix, limit=DEFAULT_LIMIT):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        start = bisect_left(self.keys, prefix)
+        best = {}
+        for i in range(start, min(start + SCAN_LIMIT, len(self.keys))):
+            if not self.keys[i].startswith(prefix):
+                break
+            rank, position = self.refs[i]
+            if rank < best.get(position, 2):
+                best[position] = rank
+        ordered = sorted(
+            best.items(),
+            key=lambda item: (item[1], len(self.entries[item[0]]['label']), item[0]),
+        )
+        return [self.entries[position] for position, _ in ordered[:limit]]
+
+
+def build_index():
+    entries = []
+    for category in Category.objects.only('name', 'slug'):
+        entries.append({
+            'type': 'category',
+            'label': category.name,
+            'slug': category.slug,
+            'url': f"{reverse('store:shop')}?category={category.slug}",
+        })
+    products = Product.objects.filter(is_available=True).only('name', 'slug', 'model_number')
+    for product in products:
+        entries.append({
+            'type': 'product',
+            'label': product.name,
+            'slug': product.slug,
+            'model_number': product.model_number or '',
+            'url': reverse('store:product_detail', kwargs={'slug': product.slug}),
+        })
+    return PrefixIndex(entries)
+
+
+_index = CatalogIndex(build_index)
+
+
+def get_index():
+    return _index.get()
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    return get_index().search(query, limit=max(1, min(limit, MAX_LIMIT)))
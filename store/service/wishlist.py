@@ -0,0 +1,134 @@
+"""
+Per-user wishlist: writes and the cached product id set.
+
+The navbar count (context_processors.wishlist_count) and the hearts on the
+shop and product pages all read the same cached id set, so in the steady
+state they cost no queries. The set is loaded with one query on a miss.
+
+Every write goes through this module as a fixed number of statements
+(toggle is one DELETE plus, only if nothing was deleted, one INSERT that
+relies on the (user, product) unique constraint) and patches the cached
+set once the transaction commits. Wishlist has no delete signals so its
+deletes stay single statements; rows removed some other way (a product
+delete cascading, the admin) call forget() instead.
+"""
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from store.models import Product, Wishlist
+
+from . import cart_store
+
+TIMEOUT = 60 * 60 * 24
+
+_IDS_KEY = 'wishlist:{}:ids'
+
+
+def product_ids(user):
+    """frozenset of the product ids on `user`'s wishlist (empty for anonymous users)."""
+    if not user.is_authenticated:
+        return frozenset()
+    key = _IDS_KEY.format(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(Wishlist.objects.filter(user=user).values_list('product_id', flat=True))
+        cache.set(key, ids, TIMEOUT)
+    return ids
+
+
+def count(user):
+    return len(product_ids(user))
+
+
+def _update(user_id, add=(), discard=()):
+    # Only patch a set that is already cached; a miss is recomputed lazily
+    key = _IDS_KEY.format(user_id)
+    ids = cache.get(key)
+    if ids is not None:
+        cache.set(key, (ids | frozenset(add)) - frozenset(discard), TIMEOUT)
+
+
+def _after_commit(user_id, add=(), discard=()):
+    add, discard = list(add), list(discard)
+    transaction.on_commit(lambda: _update(user_id, add=add, discard=discard))
+
+
+def forget(*user_ids):
+    cache.delete_many([_IDS_KEY.format(user_id) for user_id in user_ids])
+
+
+def add(user, product_id):
+    """Add one product; False if it was already on the wishlist."""
+    try:
+        with transaction.atomic():
+            Wishlist.objects.create(user=user, product_id=product_id)
+    except IntegrityError:
+        return False
+    _after_commit(user.pk, add=[product_id])
+    return True
+
+
+def remove(user, product_id):
+    """Remove one product; False if it was not on the wishlist."""
+    deleted, _ = Wishlist.objects.filter(user=user, product_id=product_id).delete()
+    _after_commit(user.pk, discard=[product_id])
+    return bool(deleted)
+
+
+def toggle(user, product_id):
+    """Remove the product if it is on the wishlist, else add it. Returns True if added."""
+    with transaction.atomic():
+        deleted, _ = Wishlist.objects.filter(user=user, product_id=product_id).delete()
+        if not deleted:
+            Wishlist.objects.bulk_create(
+                [Wishlist(user=user, product_id=product_id)], ignore_conflicts=True,
+            )
+    if deleted:
+        _after_commit(user.pk, discard=[product_id])
+    else:
+        _after_commit(user.pk, add=[product_id])
+    return not deleted
+
+
+def add_many(user, product_ids):
+    """
+    Add every existing product in `product_ids` (2 queries), skipping ones
+    already on the wishlist. Returns the ids of the products it added.
+    """
+    ids = list(
+        Product.objects.filter(pk__in=list(product_ids))
+        .exclude(pk__in=Wishlist.objects.filter(user=user).values('product_id'))
+        .values_list('pk', flat=True)
+    )
+    Wishlist.objects.bulk_create(
+        [Wishlist(user=user, product_id=pk) for pk in ids], ignore_conflicts=True,
+    )
+    _after_commit(user.pk, add=ids)
+    return ids
+
+
+def remove_many(user, product_ids):
+    """Remove `product_ids` from the wishlist (1 query). Returns the number removed."""
+    product_ids = list(product_ids)
+    deleted, _ = Wishlist.objects.filter(user=user, product_id__in=product_ids).delete()
+    _after_commit(user.pk, discard=product_ids)
+    return deleted
+
+
+def move_to_cart(user, cart, product_ids=None):
+    """
+    Put one of each in-stock wishlisted product (all of them, or just
+    `product_ids`) into `cart` and take them off the wishlist. Lines
+    already in the cart keep their quantity. A fixed number of queries
+    regardless of how many products move; returns the ids moved.
+    """
+    rows = Wishlist.objects.filter(user=user, product__is_available=True, product__stock__gt=0)
+    if product_ids is not None:
+        rows = rows.filter(product_id__in=list(product_ids))
+    with transaction.atomic():
+        ids = list(rows.order_by().values_list('product_id', flat=True))
+        if ids:
+            cart_store.add_missing(cart, ids)
+            Wishlist.objects.filter(user=user, product_id__in=ids).delete()
+    _after_commit(user.pk, discard=ids)
+    return ids
@@ -0,0 +1,70 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Category, Product, Wishlist
+from .service import cart_store, images, search, wishlist
+from .service.catalog import bump_catalog_version
+from .service.jobs import enqueue
+
+
+def _catalog_changed():
+    # Bump now, and again once the transaction commits so nothing rebuilt
+    # from not-yet-committed rows stays cached under the final version.
+    bump_catalog_version()
+    transaction.on_commit(bump_catalog_version)
+
+
+def _schedule_image_variants(instance):
+    # Resizing happens in the job worker, never on the request thread
+    if images.needs_variants(instance):
+        enqueue('generate_image_variants', model=instance._meta.label, pk=instance.pk)
+    elif not instance.image and instance.image_variants:
+        type(instance).objects.filter(pk=instance.pk).update(image_variants={})
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_products([instance])
+    _schedule_image_variants(instance)
+    _catalog_changed()
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance, **kwargs):
+    # the cascade deletes wishlist rows without signals; drop the cached sets
+    users = list(Wishlist.objects.filter(product=instance).values_list('user_id', flat=True))
+    if users:
+        transaction.on_commit(lambda: wishlist.forget(*users))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.remove_products([instance.id])
+    _catalog_changed()
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    # category name is part of every product's index row
+    if not created:
+        search.index_products(instance.products.select_related('category'))
+    _schedule_image_variants(instance)
+    _catalog_changed()
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    _catalog_changed()
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        cart_store.merge_on_login(request, user)
+
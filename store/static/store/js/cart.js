@@ -0,0 +1,99 @@
+// AJAX cart: forms carrying data-cart-api post to the JSON cart API and
+// patch the page (navbar badge, cart line, totals) instead of reloading.
+document.addEventListener('DOMContentLoaded', function () {
+    const table = document.querySelector('[data-cart-version]');
+
+    function csrfToken(form) {
+        const input = form.querySelector('input[name="csrfmiddlewaretoken"]');
+        return input ? input.value : '';
+    }
+
+    function setCount(count) {
+        document.querySelectorAll('[data-cart-count]').forEach(function (badge) {
+            badge.textContent = count;
+            badge.classList.toggle('d-none', !count);
+        });
+    }
+
+    function toast(text, level) {
+        const box = document.createElement('div');
+        box.className = 'alert alert-' + level + ' position-fixed bottom-0 end-0 m-3 shadow-sm';
+        box.style.zIndex = 1080;
+        box.textContent = text;
+        document.body.appendChild(box);
+        setTimeout(function () { box.remove(); }, 2500);
+    }
+
+    function updateCartPage(data) {
+        if (!table) {
+            return;
+        }
+        table.dataset.cartVersion = data.version;
+        if (data.line) {
+            const row = table.querySelector('[data-cart-line="' + data.line.product_id + '"]');
+            if (row) {
+                row.querySelector('[data-line-subtotal]').textContent = data.line.subtotal;
+                row.querySelector('input[name="quantity"]').value = data.line.quantity;
+            }
+        } else if (data.removed || !data.cart_count) {
+            table.querySelectorAll('[data-cart-line]').forEach(function (row) {
+                if (!data.cart_count || (data.removed && row.dataset.removing)) {
+                    row.remove();
+                }
+            });
+        }
+        table.querySelectorAll('[data-cart-total]').forEach(function (cell) {
+            cell.textContent = data.total;
+        });
+        if (!data.cart_count) {
+            window.location.reload();
+        }
+    }
+
+    document.querySelectorAll('form[data-cart-api]').forEach(function (form) {
+        form.addEventListener('submit', function (e) {
+            e.preventDefault();
+            const body = new FormData(form);
+            if (table) {
+                body.append('version', table.dataset.cartVersion);
+            }
+            const row = form.closest('[data-cart-line]');
+            if (row && form.dataset.cartAction === 'remove') {
+                row.dataset.removing = '1';
+            }
+
+            fetch(form.dataset.cartApi, {
+                method: 'POST',
+                headers: { 'X-CSRFToken': csrfToken(form), 'X-Requested-With': 'XMLHttpRequest' },
+                body: body
+            })
+            .then(function (res) {
+                return res.json().then(function (data) { return { status: res.status, data: data }; });
+            })
+            .then(function (result) {
+                const data = result.data;
+                if (result.status === 401 && data.login_url) {
+                    window.location.href = data.login_url;
+                    return;
+                }
+                if (result.status === 409) {
+                    window.location.reload();
+                    return;
+                }
+                if (result.status !== 200) {
+                    toast(data.error || 'Something went wrong.', 'danger');
+                    return;
+                }
+                setCount(data.cart_count);
+                updateCartPage(data);
+                if (data.line && form.dataset.cartAction === 'add') {
+                    toast('Added ' + data.line.name + ' to cart.', 'success');
+                }
+            })
+            .catch(function () {
+                // fall back to the regular form post
+                form.submit();
+            });
+        });
+    });
+});
@@ -1,5 +1,9 @@
-let step = 0;
-let chatData = {};
+// Conversation state lives on the server (see store/service/chatbot.py):
+// each answer narrows that session's candidate pumps and the reply says
+// which question to ask next.
+let session = null;
+let question = null;
+let finished = false;
 
 const chatBox = document.getElementById("chatBox");
 const chatForm = document.getElementById("chatForm");
@@ -15,130 +19,105 @@ function addMessage(text, sender = "bot") {
   chatBox.scrollTop = chatBox.scrollHeight;
 }
 
-function resetChat() {
-  step = 0;
-  chatData = {};
-  addMessage("🔄 Sure! Let’s find another pump.");
-  addMessage("What is the required water depth (in ft)?");
+function post(url, body) {
+  return fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body || {})
+  }).then(res => res.json().then(data => ({ ok: res.ok, status: res.status, data })));
 }
 
-/* ---------- Validation Functions ---------- */
-
-function isValidDepth(value) {
-  return !isNaN(value) && Number(value) > 0 && Number(value) <= 1000;
+function askQuestion(q) {
+  let text = q.text;
+  if (q.options) {
+    const counts = q.options
+      .filter(option => option.count > 0)
+      .map(option => `${option.label}: ${option.count}`);
+    if (counts.length) {
+      text += `<br><small class="text-muted">${counts.join(" · ")}</small>`;
+    }
+  }
+  addMessage(text);
 }
 
-function isValidUsage(value) {
-  return ["domestic", "agriculture", "industrial"].includes(value);
+function showRecommendations(pumps) {
+  if (!pumps || pumps.length === 0) {
+    addMessage("❌ Sorry, no suitable pumps found.");
+  } else {
+    pumps.forEach(pump => {
+      addMessage(`
+        <strong>${pump.name}</strong><br>
+        Model: ${pump.model_number}<br>
+        Power: ${pump.motor_power_hp} HP<br>
+        Max Depth: ${pump.max_depth_ft} ft<br>
+        Price: ₹${pump.price}<br>
+        <a href="${pump.product_url}" class="btn btn-sm btn-outline-primary mt-2">
+          View Product
+        </a>
+      `);
+    });
+  }
+  addMessage("👉 Would you like another pump recommendation? (yes / no)");
+  finished = true;
 }
 
-function isValidPhase(value) {
-  return ["single", "three"].includes(value);
+function handleReply(reply) {
+  session = reply.session;
+  question = reply.question;
+  if (reply.done) {
+    showRecommendations(reply.recommendations);
+  } else {
+    askQuestion(question);
+  }
 }
 
-function isValidBudget(value) {
-  return value === "" || (!isNaN(value) && Number(value) > 0);
+function startChat() {
+  session = question = null;
+  finished = false;
+  return post("/api/chatbot/sessions/").then(({ data }) => handleReply(data));
 }
 
 /* ---------- Chatbot Logic ---------- */
+
 chatForm.addEventListener("submit", function (e) {
   e.preventDefault();
 
-  let rawInput = userInput.value;
-  let input = rawInput.trim().toLowerCase();
-
+  const input = userInput.value.trim().toLowerCase();
   addMessage(input || "(skipped)", "user");
   userInput.value = "";
 
-  /* STEP 0: DEPTH */
-  if (step === 0) {
-    if (!isValidDepth(input)) {
-      addMessage("❌ Please enter a valid depth in feet (example: 120).");
-      return;
-    }
-    chatData.depth_ft = input;
-    addMessage("Great 👍 What is the usage type? (domestic / agriculture / industrial)");
-    step = 1;
-  }
-
-  /* STEP 1: USAGE */
-  else if (step === 1) {
-    if (!isValidUsage(input)) {
-      addMessage("❌ Invalid usage type. Enter: domestic, agriculture, or industrial.");
-      return;
-    }
-    chatData.usage_type = input;
-    addMessage("Which phase do you have? (single / three)");
-    step = 2;
-  }
-
-  /* STEP 2: PHASE */
-  else if (step === 2) {
-    if (!isValidPhase(input)) {
-      addMessage("❌ Invalid phase. Enter: single or three.");
-      return;
-    }
-    chatData.phase = input;
-    addMessage("What is your maximum budget? (optional — press Enter to skip)");
-    step = 3;
-  }
-
-  /* STEP 3: BUDGET (ALLOW EMPTY INPUT) */
-  else if (step === 3) {
-    if (input !== "" && !isValidBudget(input)) {
-      addMessage("❌ Please enter a valid budget or press Enter to skip.");
-      return;
-    }
-
-    if (input !== "") {
-      chatData.budget = input;
-    }
-
-    addMessage("🔍 Finding the best pumps for you...");
-
-    fetch("/api/recommend-pump/", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(chatData)
-    })
-      .then(res => res.json())
-      .then(data => {
-        if (!data.recommendations || data.recommendations.length === 0) {
-          addMessage("❌ Sorry, no suitable pumps found.");
-        } else {
-            data.recommendations.forEach(pump => {
-            addMessage(`
-              <strong>${pump.name}</strong><br>
-              Model: ${pump.model_number}<br>
-              Power: ${pump.motor_power_hp} HP<br>
-              Max Depth: ${pump.max_depth_ft} ft<br>
-              Price: ₹${pump.price}<br>
-              <a href="${pump.product_url}" class="btn btn-sm btn-outline-primary mt-2">
-                View Product
-              </a>
-            `);
-          });
-        }
-
-        addMessage("👉 Would you like another pump recommendation? (yes / no)");
-        step = 4;   // 🔥 IMPORTANT
-      });
-  }
-
-  /* STEP 4: RESTART OR END */
-  else if (step === 4) {
+  /* RESTART OR END */
+  if (finished) {
     if (input === "yes") {
-      step = 0;
-      chatData = {};
       addMessage("🔄 Sure! Let’s start again.");
-      addMessage("What is the required water depth (in ft)?");
-    }
-    else if (input === "no") {
+      startChat();
+    } else if (input === "no") {
       addMessage("😊 Thank you for using Smart Pump Assistant. Have a great day!");
-      step = 5;
-    }
-    else {
+      session = null;
+    } else {
       addMessage("❓ Please reply with 'yes' or 'no'.");
     }
+    return;
   }
+  if (!question) {
+    return;
+  }
+
+  post(`/api/chatbot/sessions/${session}/`, { field: question.field, value: input })
+    .then(({ ok, status, data }) => {
+      if (status === 404) {
+        addMessage("⌛ This conversation timed out, let’s start again.");
+        return startChat();
+      }
+      if (!ok) {
+        addMessage(`❌ ${data.error}`);
+        return;
+      }
+      if (data.done) {
+        addMessage("🔍 Finding the best pumps for you...");
+      }
+      handleReply(data);
+    });
 });
+
+startChat();
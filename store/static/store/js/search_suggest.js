@@ -0,0 +1,73 @@
+// Typeahead for the navbar search boxes, backed by /api/search/suggest/
+document.addEventListener('DOMContentLoaded', function () {
+    const inputs = document.querySelectorAll('input[type="search"][name="q"]');
+
+    inputs.forEach(function (input) {
+        const form = input.closest('form');
+        form.classList.add('position-relative');
+        input.setAttribute('autocomplete', 'off');
+
+        const menu = document.createElement('div');
+        menu.className = 'dropdown-menu w-100 shadow-sm';
+        menu.style.top = '100%';
+        form.appendChild(menu);
+
+        let timer = null;
+        let lastQuery = '';
+
+        function hide() {
+            menu.classList.remove('show');
+        }
+
+        function render(suggestions) {
+            menu.innerHTML = '';
+            if (!suggestions.length) {
+                hide();
+                return;
+            }
+            suggestions.forEach(function (s) {
+                const link = document.createElement('a');
+                link.className = 'dropdown-item d-flex justify-content-between';
+                link.href = s.url;
+
+                const label = document.createElement('span');
+                label.textContent = s.label;
+                link.appendChild(label);
+
+                const meta = document.createElement('small');
+                meta.className = 'text-muted ms-2';
+                meta.textContent = s.type === 'category' ? 'Category' : (s.model_number || '');
+                link.appendChild(meta);
+
+                menu.appendChild(link);
+            });
+            menu.classList.add('show');
+        }
+
+        input.addEventListener('input', function () {
+            const q = input.value.trim();
+            clearTimeout(timer);
+            if (!q) {
+                hide();
+                return;
+            }
+            timer = setTimeout(function () {
+                lastQuery = q;
+                fetch('/api/search/suggest/?q=' + encodeURIComponent(q))
+                    .then(res => res.json())
+                    .then(data => {
+                        // ignore responses for stale keystrokes
+                        if (data.query === lastQuery) {
+                            render(data.suggestions);
+                        }
+                    })
+                    .catch(hide);
+            }, 120);
+        });
+
+        input.addEventListener('blur', function () {
+            // let clicks on a suggestion land first
+            setTimeout(hide, 150);
+        });
+    });
+});
@@ -0,0 +1,33 @@
+"""
+Background job handlers. Queue them with store.service.jobs.enqueue(name, ...)
+and run them with `python manage.py runworker`.
+"""
+from django.core.mail import send_mail
+
+from .models import Order
+from .service.images import process_image
+from .service.jobs import task
+from .utils import send_order_receipt
+
+
+@task('send_order_receipt')
+def send_order_receipt_job(order_id):
+    order = Order.objects.filter(id=order_id).first()
+    if order is None:
+        return
+    send_order_receipt(order)
+
+
+@task('send_mail')
+def send_mail_job(subject, message, recipient_list, from_email=None):
+    send_mail(
+        subject=subject,
+        message=message,
+        from_email=from_email,
+        recipient_list=recipient_list,
+    )
+
+
+@task('generate_image_variants')
+def generate_image_variants_job(model, pk):
+    process_image(model, pk)
@@ -0,0 +1,54 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from store.service.images import FORMATS, VARIANTS
+
+register = template.Library()
+
+# Default `sizes` per variant, matching the shop/home/detail layouts
+SIZES = {
+    'thumb': '160px',
+    'card': '(min-width: 992px) 25vw, (min-width: 576px) 50vw, 100vw',
+    'detail': '(min-width: 768px) 42vw, 100vw',
+}
+
+
+@register.simple_tag
+def responsive_image(obj, variant='card', alt='', css_class='', sizes=None, loading='lazy'):
+    """
+    <picture> for `obj.image` with AVIF and WebP srcsets covering every
+    variant width, and width/height from the chosen variant so the layout
+    doesn't shift. Falls back to the original upload until the variants
+    have been generated.
+
+        {% responsive_image product 'card' alt=product.name css_class='card-img-top' %}
+    """
+    image = getattr(obj, 'image', None)
+    if not image:
+        return ''
+    variants = getattr(obj, 'image_variants', None) or {}
+    chosen = variants.get(variant)
+    if variants.get('source') != image.name or not chosen:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            image.url, alt, css_class, loading,
+        )
+
+    sources = []
+    for fmt in FORMATS:
+        # the same width can appear twice when the original is small
+        widths = {}
+        for name in VARIANTS:
+            entry = variants.get(name)
+            if entry and fmt in entry:
+                widths[entry['width']] = entry[fmt]
+        srcset = ', '.join(f'{default_storage.url(path)} {width}w' for width, path in sorted(widths.items()))
+        sources.append((f'image/{fmt}', srcset, sizes or SIZES.get(variant, '100vw')))
+
+    fallback = chosen.get('webp') or next(chosen[fmt] for fmt in FORMATS if fmt in chosen)
+    return format_html(
+        '<picture>{}<img src="{}" alt="{}" class="{}" width="{}" height="{}" loading="{}" decoding="async"></picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', sources),
+        default_storage.url(fallback), alt, css_class, chosen['width'], chosen['height'], loading,
+    )
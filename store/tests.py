@@ -1,3 +1,1457 @@
-from django.test import TestCase
+import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.template import Context, Template
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+
+from .models import (
+    Cart, CartItem, Category, DailyCategorySales, DailySales, Job, Order, OrderItem, Product,
+    StockHold, Wishlist,
+)
+from .service.cart import CartLine, price_cart
+from .service.holds import hold_stock, release_expired_holds, with_available_stock
+from .service.jobs import enqueue, run_pending, task
+from .service import (
+    cart_store, catalog, curves, facets, pagination, products, recommendation, sales, search,
+    suggest, wishlist,
+)
+from .service.orders import InsufficientStock, place_order, place_paid_order
+
+
+def _order():
+    return Order(
+        full_name='Test Buyer', email='buyer@example.com', phone='9999999999',
+        address='Street 1', city='Rajkot', pincode='360001',
+    )
+
+
+class PriceCartTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'), stock=5,
+        )
+        self.retired = Product.objects.create(
+            category=category, name='Old Pump', slug='old-pump', price=Decimal('9000.00'), stock=5,
+            is_available=False,
+        )
+
+    def test_reports_missing_and_unavailable_lines_in_one_query(self):
+        gone = Product.objects.create(
+            category=self.pump.category, name='Gone', slug='gone', price=Decimal('1.00'), stock=1,
+        )
+        gone_id = gone.pk
+        gone.delete()
+
+        with self.assertNumQueries(1):
+            priced = price_cart({
+                str(self.pump.pk): 2, str(self.retired.pk): 1, str(gone_id): 1, 'junk': 1,
+            })
+
+        self.assertEqual([(line.product, line.quantity) for line in priced.items], [(self.pump, 2)])
+        self.assertEqual([line.product for line in priced.unavailable], [self.retired])
+        self.assertEqual(priced.missing, ['junk', gone_id])
+        self.assertEqual(priced.total, Decimal('25000.00'))
+        self.assertEqual(priced.item_count, 2)
+        self.assertCountEqual(priced.problem_ids(), ['junk', str(gone_id), str(self.retired.pk)])
+
+    def test_cart_page_prunes_unavailable_lines(self):
+        user = User.objects.create_user('buyer')
+        cart = Cart.objects.create(user=user)
+        cart_store.add(cart, self.pump.pk, 1)
+        cart_store.add(cart, self.retired.pk, 1)
+        self.client.force_login(user)
+
+        response = self.client.get('/cart/')
+
+        self.assertEqual([line.product for line in response.context['items']], [self.pump])
+        self.assertIn('Old Pump is no longer available', ' '.join(
+            str(message) for message in response.context['messages']
+        ))
+        self.assertEqual(cart_store.contents(cart), {str(self.pump.pk): 1})
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump',
+            price=Decimal('12500.00'), stock=3,
+        )
+        self.panel = Product.objects.create(
+            category=category, name='Panel', slug='panel',
+            price=Decimal('4000.00'), stock=1,
+        )
+
+    def test_decrements_stock_and_bulk_creates_items(self):
+        order = place_order(_order(), [CartLine(self.pump, 2), CartLine(self.panel, 1)])
+
+        self.pump.refresh_from_db()
+        self.panel.refresh_from_db()
+        self.assertEqual(self.pump.stock, 1)
+        self.assertEqual(self.panel.stock, 0)
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.total, Decimal('29000.00'))
+        self.assertEqual(order.item_count, 3)
+        self.assertEqual(order.items_totals(), (order.total, order.item_count))
+
+    def test_rejects_whole_order_when_one_line_is_short(self):
+        with self.assertRaises(InsufficientStock) as ctx:
+            place_order(_order(), [CartLine(self.pump, 2), CartLine(self.panel, 2)])
+
+        self.assertEqual(ctx.exception.products, [self.panel])
+        self.pump.refresh_from_db()
+        self.assertEqual(self.pump.stock, 3)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+
+class StockHoldTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump',
+            price=Decimal('12500.00'), stock=3,
+        )
+
+    def available(self):
+        return with_available_stock(Product.objects.filter(id=self.pump.id)).get().available_stock
+
+    def test_hold_reduces_available_stock_and_blocks_cod(self):
+        hold_stock('order_A', [CartLine(self.pump, 2)])
+
+        self.assertEqual(self.available(), 1)
+        with self.assertRaises(InsufficientStock):
+            place_order(_order(), [CartLine(self.pump, 2)])
+        with self.assertRaises(InsufficientStock):
+            hold_stock('order_B', [CartLine(self.pump, 2)])
+
+    def test_cod_rejected_by_a_hold_names_the_held_product(self):
+        hold_stock('order_A', [CartLine(self.pump, 2)])
+
+        with self.assertRaises(InsufficientStock) as ctx:
+            place_order(_order(), [CartLine(self.pump, 2)])
+
+        self.assertEqual(ctx.exception.products, [self.pump])
+        self.assertEqual(str(ctx.exception), "Not enough stock for: V-4 Pump")
+
+    def test_paid_order_converts_hold_into_decrement(self):
+        hold_stock('order_A', [CartLine(self.pump, 2)])
+        order = _order()
+        order.razorpay_order_id = 'order_A'
+
+        place_paid_order(order, [CartLine(self.pump, 2)])
+
+        self.pump.refresh_from_db()
+        self.assertEqual(self.pump.stock, 1)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_sweeper_releases_only_expired_holds(self):
+        hold_stock('order_A', [CartLine(self.pump, 1)])
+        hold_stock('order_B', [CartLine(self.pump, 1)])
+        StockHold.objects.filter(razorpay_order_id='order_A').update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        self.assertEqual(release_expired_holds(), 1)
+        self.assertEqual(self.available(), 2)
+
+
+class VerifyPaymentTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump',
+            price=Decimal('12500.00'), stock=3,
+        )
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret-pass')
+        self.client.force_login(self.user)
+
+    def pay(self):
+        return self.client.post('/api/payment/verify/', {
+            'razorpay_order_id': 'order_A',
+            'razorpay_payment_id': 'pay_A',
+            'razorpay_signature': 'sig',
+        }, content_type='application/json')
+
+    @mock.patch('store.views.razorpay.Client')
+    def test_replayed_verification_returns_same_order(self, client_cls):
+        cart = Cart.objects.create(user=self.user)
+        cart_store.add(cart, self.pump.id, 1)
+        session = self.client.session
+        session['cart_snapshot'] = cart_store.snapshot(cart)
+        session['checkout_data'] = {
+            'full_name': 'Test Buyer', 'phone': '9999999999',
+            'address': 'Street 1', 'city': 'Rajkot', 'pincode': '360001',
+        }
+        session.save()
+
+        first = self.pay()
+        second = self.pay()
+
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(client_cls.return_value.utility.verify_payment_signature.call_count, 1)
+        self.assertEqual(Job.objects.filter(name='send_order_receipt').count(), 1)
+        self.pump.refresh_from_db()
+        self.assertEqual(self.pump.stock, 2)
+
+    @mock.patch('store.views.razorpay.Client')
+    def test_cart_changed_during_payment_records_the_held_lines(self, client_cls):
+        cart = Cart.objects.create(user=self.user)
+        cart_store.add(cart, self.pump.id, 2)
+        session = self.client.session
+        session['cart_snapshot'] = cart_store.snapshot(cart)
+        session['checkout_data'] = {
+            'full_name': 'Test Buyer', 'phone': '9999999999',
+            'address': 'Street 1', 'city': 'Rajkot', 'pincode': '360001',
+        }
+        session.save()
+        hold_stock('order_A', [CartLine(self.pump, 2)], user=self.user)
+        cart_store.add(cart, self.pump.id, 1)
+
+        self.assertTrue(self.pay().json()['success'])
+        self.assertEqual(Order.objects.get().item_count, 2)
+        # the newer cart is left alone
+        self.assertEqual(cart_store.contents(cart), {str(self.pump.id): 3})
+
+
+class PaymentPageHoldTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'), stock=1,
+        )
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret-pass')
+        self.client.force_login(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        cart_store.add(self.cart, self.pump.id, 1)
+        session = self.client.session
+        session['cart_snapshot'] = cart_store.snapshot(self.cart)
+        session.save()
+
+    def open_payment_page(self, client_cls, razorpay_order_id):
+        # every page load creates a new razorpay order
+        client_cls.return_value.order.create.return_value = {'id': razorpay_order_id}
+        return self.client.get('/payment/razorpay/')
+
+    @mock.patch('store.views.razorpay.Client')
+    def test_reloading_the_payment_page_replaces_the_buyers_hold(self, client_cls):
+        self.assertEqual(self.open_payment_page(client_cls, 'order_A').status_code, 200)
+        second = self.open_payment_page(client_cls, 'order_B')
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(list(StockHold.objects.values_list('razorpay_order_id', flat=True)), ['order_B'])
+
+    @mock.patch('store.views.razorpay.Client')
+    def test_cod_after_an_abandoned_payment_is_not_blocked_by_its_hold(self, client_cls):
+        self.open_payment_page(client_cls, 'order_A')
+
+        response = self.client.post('/checkout/', {
+            'payment_method': 'cod', 'full_name': 'Test Buyer', 'email': 'buyer@example.com',
+            'phone': '9999999999', 'address': 'Street 1', 'city': 'Rajkot', 'pincode': '360001',
+        })
+
+        order = Order.objects.get()
+        self.assertRedirects(response, f'/order-success/{order.id}/', fetch_redirect_response=False)
+        self.pump.refresh_from_db()
+        self.assertEqual(self.pump.stock, 0)
+        self.assertFalse(StockHold.objects.exists())
+
+
+class OrderTotalsCommandTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'), stock=9,
+        )
+        self.orders = []
+        for quantity in (1, 2, 3):
+            order = _order()
+            order.save()
+            OrderItem.objects.create(order=order, product=pump, quantity=quantity, price=pump.price)
+            self.orders.append(order)
+        self.empty = _order()
+        self.empty.save()
+
+    def totals(self):
+        return list(Order.objects.order_by('id').values_list('total', 'item_count'))
+
+    def test_backfill_fills_stored_totals_in_chunks(self):
+        out = StringIO()
+        call_command('backfill_order_totals', chunk_size=2, stdout=out)
+
+        self.assertEqual(self.totals(), [
+            (Decimal('12500.00'), 1), (Decimal('25000.00'), 2), (Decimal('37500.00'), 3), (Decimal('0.00'), 0),
+        ])
+        self.assertIn('Done. 4 order(s) updated.', out.getvalue())
+
+    def test_check_reports_drift_and_fix_repairs_it(self):
+        call_command('backfill_order_totals', stdout=StringIO())
+        drifted = self.orders[1]
+        Order.objects.filter(pk=drifted.pk).update(total=Decimal('1.00'), item_count=7)
+
+        out = StringIO()
+        call_command('check_order_totals', stdout=out)
+        self.assertIn(f'Order #{drifted.pk}: stored 1.00 / 7 item(s), actual 25000', out.getvalue())
+        self.assertIn('1 order(s) drifted', out.getvalue())
+        drifted.refresh_from_db()
+        self.assertEqual(drifted.item_count, 7)
+
+        out = StringIO()
+        call_command('check_order_totals', fix=True, stdout=out)
+        self.assertIn('Fixed 1 drifted order(s).', out.getvalue())
+        drifted.refresh_from_db()
+        self.assertEqual((drifted.total, drifted.item_count), (Decimal('25000.00'), 2))
+
+        out = StringIO()
+        call_command('check_order_totals', stdout=out)
+        self.assertIn('All order totals are consistent.', out.getvalue())
+
+
+class JobQueueTests(TestCase):
+    def test_receipt_job_sends_email_with_pdf(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump',
+            price=Decimal('12500.00'), stock=3,
+        )
+        order = place_order(_order(), [CartLine(pump, 1)])
+        enqueue('send_order_receipt', order_id=order.id)
+
+        self.assertEqual(run_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].attachments[0][2], 'application/pdf')
+        self.assertEqual(Job.objects.get().status, 'done')
+
+    def test_failed_job_is_retried_with_backoff_then_given_up(self):
+        calls = []
+
+        @task('test_flaky')
+        def flaky():
+            calls.append(1)
+            raise RuntimeError('smtp down')
+
+        job = enqueue('test_flaky', max_attempts=2)
+        self.assertEqual(run_pending(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'pending')
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=20))
+
+        # not due yet
+        self.assertEqual(run_pending(), (0, 0))
+
+        Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        self.assertEqual(run_pending(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('smtp down', job.last_error)
+        self.assertEqual(len(calls), 2)
+
+
+class SalesRollupTests(TestCase):
+    def snapshot(self):
+        return (
+            sorted(DailySales.objects.values_list('date', 'status', 'revenue', 'order_count', 'item_count')),
+            sorted(DailyCategorySales.objects.values_list('date', 'status', 'category_name', 'revenue', 'item_count')),
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        sales.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_incremental_rollup_matches_rebuild(self):
+        pumps = Category.objects.create(name='Pumps', slug='pumps')
+        cables = Category.objects.create(name='Cable', slug='cable')
+        pump = Product.objects.create(
+            category=pumps, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'), stock=5,
+        )
+        cable = Product.objects.create(
+            category=cables, name='Cable 10m', slug='cable-10m', price=Decimal('800.00'), stock=50,
+        )
+        first = place_order(_order(), [CartLine(pump, 1), CartLine(cable, 3)])
+        place_order(_order(), [CartLine(pump, 2)])
+
+        first.status = 'delivered'
+        first.save()
+        sales.record_status_change(first, 'pending')
+
+        day = timezone.localdate()
+        delivered = DailySales.objects.get(date=day, status='delivered')
+        self.assertEqual(delivered.revenue, Decimal('14900.00'))
+        self.assertEqual(DailySales.objects.get(date=day, status='pending').order_count, 1)
+        self.assertEqual(
+            DailyCategorySales.objects.get(date=day, status='delivered', category_name='Cable').item_count, 3,
+        )
+
+        self.assertMatchesRebuild()
+
+    def admin_post(self, url, order, items, **fields):
+        data = {
+            'full_name': 'Test Buyer', 'email': 'buyer@example.com', 'phone': '9999999999',
+            'address': 'Street 1', 'city': 'Rajkot', 'pincode': '360001',
+            'status': 'pending', 'payment_status': 'pending',
+            'items-TOTAL_FORMS': len(items), 'items-INITIAL_FORMS': len(order.items.all()) if order else 0,
+            'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+            **fields,
+        }
+        for i, item in enumerate(items):
+            data.update({f'items-{i}-{key}': value for key, value in item.items()})
+            if order:
+                data[f'items-{i}-order'] = order.pk
+        return self.client.post(url, data)
+
+    def test_admin_create_edit_and_delete_keep_the_rollup_in_step(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'), stock=5,
+        )
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        day = timezone.localdate()
+
+        response = self.admin_post('/admin/store/order/add/', None, [
+            {'product': pump.pk, 'quantity': 2, 'price': '12500.00'},
+        ])
+        self.assertEqual(response.status_code, 302)
+        order = Order.objects.get()
+        self.assertEqual(DailySales.objects.get(date=day, status='pending').revenue, Decimal('25000.00'))
+        self.assertMatchesRebuild()
+
+        item = order.items.get()
+        response = self.admin_post(f'/admin/store/order/{order.pk}/change/', order, [
+            {'id': item.pk, 'product': pump.pk, 'quantity': 3, 'price': '12500.00'},
+        ], status='shipped')
+        self.assertEqual(response.status_code, 302)
+        shipped = DailySales.objects.get(date=day, status='shipped')
+        self.assertEqual((shipped.revenue, shipped.item_count), (Decimal('37500.00'), 3))
+        self.assertFalse(DailySales.objects.filter(status='pending').exists())
+        self.assertMatchesRebuild()
+
+        response = self.client.post(f'/admin/store/order/{order.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.snapshot(), ([], []))
+
+    def test_admin_bulk_delete_subtracts_each_order(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'), stock=5,
+        )
+        kept = place_order(_order(), [CartLine(pump, 1)])
+        gone = [place_order(_order(), [CartLine(pump, 1)]) for _ in range(2)]
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+        self.client.post('/admin/store/order/', {
+            'action': 'delete_selected', 'post': 'yes', '_selected_action': [o.pk for o in gone],
+        })
+
+        self.assertEqual(list(Order.objects.all()), [kept])
+        self.assertEqual(DailySales.objects.get().order_count, 1)
+        self.assertMatchesRebuild()
+
+    def test_status_change_after_product_deletion_keeps_the_original_category(self):
+        category = Category.objects.create(name='RvCat', slug='rvcat')
+        pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump', price=Decimal('100.00'), stock=5,
+        )
+        order = place_order(_order(), [CartLine(pump, 2)])
+        pump.delete()
+        category.name = 'Renamed'
+        category.save()
+
+        order.status = 'shipped'
+        order.save()
+        sales.record_status_change(order, 'pending')
+
+        self.assertEqual(
+            sorted(DailyCategorySales.objects.values_list('status', 'category_name', 'revenue', 'item_count')),
+            [('shipped', 'RvCat', Decimal('200.00'), 2)],
+        )
+        self.assertMatchesRebuild()
+
+    def test_fixing_drifted_totals_corrects_the_rollup(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'), stock=5,
+        )
+        order = place_order(_order(), [CartLine(pump, 2)])
+        # stored totals drift and the rollup was built from the drifted figures
+        Order.objects.filter(pk=order.pk).update(total=Decimal('100.00'), item_count=1)
+        sales.rebuild()
+
+        call_command('check_order_totals', fix=True, stdout=StringIO())
+
+        daily = DailySales.objects.get()
+        self.assertEqual((daily.revenue, daily.item_count), (Decimal('25000.00'), 2))
+        self.assertMatchesRebuild()
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Pumps', slug='pumps')
+        self.v4 = Product.objects.create(
+            category=self.category, name='Submersible Pump', slug='v-4-pump',
+            model_number='V-4', price=Decimal('12500.00'), stock=3,
+        )
+        self.openwell = Product.objects.create(
+            category=self.category, name='Openwell Pump', slug='openwell',
+            model_number='KO-1', description='Replacement for the V-4 series',
+            price=Decimal('9000.00'), stock=3,
+        )
+
+    def search(self, query, queryset=None):
+        return list(search.search_products(queryset or Product.objects.all(), query))
+
+    def test_model_number_prefix_ranks_above_description(self):
+        self.assertEqual(self.search('v-4'), [self.v4, self.openwell])
+        self.assertEqual(self.search('V'), [self.v4, self.openwell])
+        self.assertEqual(self.search('openwell pu'), [self.openwell])
+
+    def test_respects_queryset_filters(self):
+        self.assertEqual(self.search('v-4', Product.objects.exclude(id=self.v4.id)), [self.openwell])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.category.name = 'Borewell'
+        self.category.save()
+        self.assertEqual(len(self.search('borewell')), 2)
+
+        Product.objects.filter(id=self.v4.id).delete()
+        self.assertEqual(self.search('v-4'), [self.openwell])
+
+    def test_only_relevance_order_is_capped(self):
+        Product.objects.create(
+            category=self.category, name='Booster Pump', slug='booster', price=Decimal('5000.00'), stock=3,
+        )
+        with mock.patch.object(search, 'RESULT_LIMIT', 2):
+            self.assertEqual(len(self.search('pump')), 2)
+            every = search.search_products(Product.objects.all(), 'pump', ranked=False)
+            self.assertEqual(len(every), 3)
+            shop = self.client.get('/shop/?q=pump&sort=price_asc')
+            self.assertEqual([p.slug for p in shop.context['products']], ['booster', 'openwell', 'v-4-pump'])
+
+    def test_falls_back_to_icontains_without_fts(self):
+        with mock.patch.object(search, '_available', False):
+            self.assertEqual(self.search('replacement'), [self.openwell])
+
+
+class SearchSuggestTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Openwell', slug='openwell')
+        Product.objects.create(
+            category=self.category, name='Submersible Pump V-4', slug='v-4-pump',
+            model_number='V-4', price=Decimal('12500.00'), stock=3,
+        )
+        Product.objects.create(
+            category=self.category, name='Vertical Openwell Pump', slug='openwell-pump',
+            model_number='KO-1', price=Decimal('9000.00'), stock=3,
+        )
+
+    def labels(self, query):
+        return [s['label'] for s in suggest.suggest(query)]
+
+    def test_prefix_of_name_word_and_model_number(self):
+        self.assertEqual(self.labels('v-4'), ['Submersible Pump V-4'])
+        self.assertEqual(self.labels('ver'), ['Vertical Openwell Pump'])
+        self.assertEqual(self.labels('open'), ['Openwell', 'Vertical Openwell Pump'])
+
+    def test_warm_lookups_skip_the_database_and_rebuild_on_catalog_change(self):
+        suggest.get_index()
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/search/suggest/?q=sub')
+        self.assertEqual(response.json()['suggestions'][0]['slug'], 'v-4-pump')
+
+        Product.objects.create(
+            category=self.category, name='Submarine Cable', slug='cable',
+            price=Decimal('800.00'), stock=3,
+        )
+        self.assertEqual(self.labels('subm'), ['Submarine Cable', 'Submersible Pump V-4'])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        for i in range(23):
+            Product.objects.create(
+                category=category, name=f'Pump {i}', slug=f'pump-{i}',
+                price=Decimal(1000 + (i % 4) * 250), stock=1,
+            )
+
+    def walk(self, sort):
+        rows, cursor = pagination.keyset_page(Product.objects.all(), sort, page_size=5)
+        seen = list(rows)
+        while cursor:
+            rows, cursor = pagination.keyset_page(Product.objects.all(), sort, cursor, page_size=5)
+            seen.extend(rows)
+        return seen
+
+    def test_pages_cover_ordering_without_gaps_or_duplicates(self):
+        for sort, fields in pagination.SORTS.items():
+            self.assertEqual(self.walk(sort), list(Product.objects.order_by(*fields)), sort)
+
+    def test_bad_or_foreign_cursor_restarts_from_first_page(self):
+        first, cursor = pagination.keyset_page(Product.objects.all(), 'newest', page_size=5)
+        self.assertEqual(pagination.keyset_page(Product.objects.all(), 'newest', 'junk', page_size=5)[0], first)
+        self.assertIsNone(pagination.decode_cursor(cursor, 'price_asc'))
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Pumps', slug='pumps')
+        specs = [
+            ('single', 'domestic', '0.5', 30),
+            ('single', 'agriculture', '1.5', 80),
+            ('three', 'agriculture', '7.5', 150),
+            ('three', 'industrial', '12.5', 250),
+        ]
+        for i, (phase, usage, hp, head) in enumerate(specs):
+            Product.objects.create(
+                category=self.category, name=f'Pump {i}', slug=f'pump-{i}',
+                price=Decimal('1000.00'), stock=1, phase=phase, usage_type=usage,
+                motor_power_hp=Decimal(hp), max_head_m=head,
+            )
+
+    def counts(self, selection, **kwargs):
+        groups = facets.sidebar(selection, **kwargs)
+        return {g['param']: {o['key']: o['count'] for o in g['options']} for g in groups}
+
+    def test_counts_ignore_own_facet_selection(self):
+        counts = self.counts({'phase': frozenset({'three'})})
+        self.assertEqual(counts['phase'], {'single': 2, 'three': 2})
+        self.assertEqual(counts['usage'], {'domestic': 0, 'agriculture': 1, 'industrial': 1})
+        self.assertEqual(counts['hp']['5-10'], 1)
+        self.assertEqual(counts['hp']['0-1'], 0)
+
+    def test_range_filters_match_bucket_counts(self):
+        response = self.client.get('/shop/?hp=5-10&hp=10%2B&head=200%2B')
+        self.assertEqual([p.slug for p in response.context['products']], ['pump-3'])
+        groups = {g['param']: g for g in response.context['facet_groups']}
+        self.assertEqual(
+            {o['key']: o['count'] for o in groups['hp']['options']}['10+'], 1,
+        )
+
+    def test_warm_counts_skip_the_database_and_rebuild_on_catalog_change(self):
+        facets.get_index()
+        with self.assertNumQueries(0):
+            self.counts({}, category='pumps')
+        Product.objects.create(
+            category=self.category, name='Pump 4', slug='pump-4', price=Decimal('1000.00'),
+            stock=1, phase='single', usage_type='domestic', motor_power_hp=Decimal('0.75'),
+        )
+        self.assertEqual(self.counts({})['hp']['0-1'], 2)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=self.category, name='V-4 Pump', slug='v-4-pump',
+            price=Decimal('12500.00'), stock=5,
+        )
+
+    def test_detail_is_cached_but_stock_stays_live(self):
+        # logged in, so the page cache is bypassed and the view runs
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.client.get('/product/v-4-pump/')
+        # session, user, live stock; the wishlist ids come from the cache
+        with self.assertNumQueries(3):
+            response = self.client.get('/product/v-4-pump/')
+        self.assertEqual(response.context['product'].category.name, 'Pumps')
+
+        Product.objects.filter(pk=self.pump.pk).update(stock=2)
+        self.assertEqual(self.client.get('/product/v-4-pump/').context['product'].available_stock, 2)
+
+        self.pump.name = 'V-4 Pump (2024)'
+        self.pump.save()
+        self.assertEqual(self.client.get('/product/v-4-pump/').context['product'].name, 'V-4 Pump (2024)')
+
+    def test_category_list_is_served_from_cache_until_catalog_changes(self):
+        catalog.categories()
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.categories(), [self.category])
+        Category.objects.create(name='Cables', slug='cables')
+        self.assertEqual(len(catalog.categories()), 2)
+
+    def test_bulk_delete_invalidates_shop_pages(self):
+        self.assertEqual(list(self.client.get('/shop/').context['products']), [self.pump])
+        admin = User.objects.create_user('admin', password='pw', is_staff=True)
+        self.client.force_login(admin)
+        self.client.post('/admin-panel/products/bulk-delete/', {'product_ids': [self.pump.pk]})
+        self.assertEqual(list(self.client.get('/shop/').context['products']), [])
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=self.category, name='V-4 Pump', slug='v-4-pump',
+            price=Decimal('12500.00'), stock=5,
+        )
+
+    def test_anonymous_pages_are_served_from_cache_until_catalog_changes(self):
+        self.assertEqual(self.client.get('/shop/')['X-Page-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get('/shop/')
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, 'V-4 Pump')
+        self.assertEqual(self.client.get('/shop/?category=pumps')['X-Page-Cache'], 'MISS')
+
+        self.pump.name = 'V-6 Pump'
+        self.pump.save()
+        response = self.client.get('/shop/')
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'V-6 Pump')
+
+    def test_cached_page_carries_the_visitors_own_csrf_token(self):
+        self.client.get('/product/v-4-pump/')
+        visitor = Client(enforce_csrf_checks=True)
+        response = visitor.get('/product/v-4-pump/')
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertNotContains(response, '__csrf_token__')
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+        response = visitor.post('/login/', {'csrfmiddlewaretoken': token, 'username': 'x', 'password': 'y'})
+        self.assertNotEqual(response.status_code, 403)
+
+    def test_logged_in_visitors_and_carts_bypass_the_cache(self):
+        self.client.get('/shop/')
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.assertEqual(self.client.get('/shop/')['X-Page-Cache'], 'BYPASS')
+
+        anonymous = Client()
+        session = anonymous.session
+        session['cart_id'] = Cart.objects.create().pk
+        session.save()
+        self.assertEqual(anonymous.get('/shop/')['X-Page-Cache'], 'BYPASS')
+
+    def test_warm_command_fills_category_pages(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir,
+        }}
+        with self.settings(CACHES=shared):
+            call_command('warm_page_cache', host='testserver', stdout=StringIO())
+            self.assertEqual(self.client.get('/shop/?category=pumps')['X-Page-Cache'], 'HIT')
+
+    def test_warm_command_refuses_a_process_local_cache(self):
+        with self.assertRaisesMessage(CommandError, 'local to this process'):
+            call_command('warm_page_cache', host='testserver', stdout=StringIO())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=self.category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'),
+            stock=5, phase='single', usage_type='domestic', max_depth_ft=200,
+        )
+
+    def test_unchanged_product_page_is_not_rendered_again(self):
+        self.client.force_login(User.objects.create_user('buyer'))
+        etag = self.client.get('/product/v-4-pump/')['ETag']
+        response = self.client.get('/product/v-4-pump/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertTemplateNotUsed(response, 'store/product_detail.html')
+
+        Product.objects.filter(pk=self.pump.pk).update(stock=4)
+        self.assertEqual(self.client.get('/product/v-4-pump/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_shop_answers_if_modified_since_until_catalog_changes(self):
+        self.client.force_login(User.objects.create_user('buyer'))
+        last_modified = self.client.get('/shop/')['Last-Modified']
+        self.assertEqual(self.client.get('/shop/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        cache.set(catalog.CHANGED_KEY, timezone.now() + timedelta(seconds=5))
+        self.assertEqual(self.client.get('/shop/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_cached_anonymous_page_answers_if_none_match(self):
+        etag = self.client.get('/shop/')['ETag']
+        response = self.client.get('/shop/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['X-Page-Cache']), (304, 'HIT'))
+
+    def test_recommendation_get_is_answered_before_any_query(self):
+        url = '/api/recommend-pump/?depth_ft=150&usage_type=domestic&phase=single'
+        response = self.client.get(url)
+        self.assertEqual(response.json()['recommended_count'], 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageVariantTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), 'steelblue').save(buffer, format='JPEG')
+        self.category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=self.category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'),
+            stock=5, image=SimpleUploadedFile('pump.jpg', buffer.getvalue()),
+        )
+
+    def test_upload_queues_variants_for_the_worker(self):
+        self.assertEqual(self.pump.image_variants, {})
+        self.assertTrue(Job.objects.filter(name='generate_image_variants').exists())
+        self.assertEqual(run_pending(), (1, 0))
+
+        self.pump.refresh_from_db()
+        card = self.pump.image_variants['card']
+        self.assertEqual((card['width'], card['height']), (400, 267))
+        with default_storage.open(card['avif']) as handle:
+            self.assertEqual(Image.open(handle).size, (400, 267))
+
+        html = Template("{% load store_images %}{% responsive_image p 'card' alt='Pump' %}").render(
+            Context({'p': self.pump})
+        )
+        self.assertIn('type="image/avif"', html)
+        self.assertIn('-thumb-160.webp 160w', html)
+        self.assertIn('width="400" height="267" loading="lazy"', html)
+
+    def test_command_regenerates_missing_variants_in_parallel(self):
+        call_command('regenerate_image_variants', workers=2, stdout=StringIO())
+        self.pump.refresh_from_db()
+        self.assertEqual(self.pump.image_variants['detail']['width'], 900)
+        self.assertEqual(self.pump.image_variants['source'], self.pump.image.name)
+
+
+class ProductCacheTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=self.category, name='V-4 Pump', slug='v-4-pump',
+            price=Decimal('12500.00'), stock=5,
+        )
+        self.user = User.objects.create_user('buyer')
+        products.reset_stats()
+
+    def test_lookups_hit_the_in_process_lru_and_count_outcomes(self):
+        self.assertEqual(products.get_product(slug='v-4-pump').pk, self.pump.pk)
+        self.assertIsNone(products.get_product(slug='missing'))
+        with self.assertNumQueries(0):
+            self.assertEqual(products.get_product(slug='v-4-pump').category.name, 'Pumps')
+            self.assertIsNone(products.get_product(slug='missing'))
+            products._local.clear()
+            self.assertEqual(products.get_product(slug='v-4-pump').name, 'V-4 Pump')
+        stats = products.stats()
+        self.assertEqual((stats['local'], stats['shared'], stats['miss']), (2, 1, 2))
+        self.assertEqual(stats['hit_rate'], 0.6)
+
+    def test_stats_are_served_to_staff_by_the_running_server(self):
+        products.get_product(slug='v-4-pump')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/cache-stats/product-cache/').status_code, 403)
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        data = self.client.get('/api/cache-stats/product-cache/').json()
+        self.assertEqual((data['miss'], data['lookups'], data['shared']), (1, 1, False))
+        self.assertEqual(self.client.get('/api/cache-stats/nothing/').status_code, 404)
+        self.assertEqual(self.client.delete('/api/cache-stats/product-cache/').status_code, 204)
+        self.assertEqual(products.stats()['lookups'], 0)
+
+        # a separate process can't see a local-memory cache, so the command refuses
+        with self.assertRaisesMessage(CommandError, '/api/cache-stats/product-cache/'):
+            call_command('product_cache_stats', stdout=StringIO())
+
+    def test_stock_is_always_read_live(self):
+        products.get_product(pk=self.pump.pk)
+        Product.objects.filter(pk=self.pump.pk).update(stock=2)
+        self.client.force_login(self.user)
+        self.client.post(f'/cart/add/{self.pump.pk}/', {'quantity': 10})
+        self.assertEqual(CartItem.objects.get(product=self.pump).quantity, 2)
+
+    def test_save_and_delete_invalidate(self):
+        products.get_product(pk=self.pump.pk)
+        self.pump.name = 'V-4 Pump Mk2'
+        self.pump.save()
+        self.assertEqual(products.get_product(pk=self.pump.pk).name, 'V-4 Pump Mk2')
+        self.pump.delete()
+        self.assertIsNone(products.get_product(pk=self.pump.pk))
+
+
+class CartStoreTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'), stock=9,
+        )
+        self.cable = Product.objects.create(
+            category=category, name='Cable', slug='cable', price=Decimal('800.00'), stock=9,
+        )
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret-pass')
+
+    def test_line_upserts_bump_the_version_and_detect_conflicts(self):
+        cart = Cart.objects.create(user=self.user)
+        cart_store.add(cart, self.pump.pk, 1)
+        cart_store.add(cart, self.pump.pk, 2)
+        version = cart_store.set_quantity(cart, self.cable.pk, 4)
+        self.assertEqual(cart_store.contents(cart), {str(self.pump.pk): 3, str(self.cable.pk): 4})
+        self.assertEqual(version, 3)
+
+        with self.assertRaises(cart_store.CartConflict):
+            cart_store.remove(cart, self.pump.pk, expected_version=2)
+        self.assertTrue(cart_store.remove(cart, self.pump.pk, expected_version=3))
+        self.assertEqual(cart_store.contents(cart), {str(self.cable.pk): 4})
+
+    def test_session_only_keeps_a_pointer(self):
+        self.client.force_login(self.user)
+        self.client.post(f'/cart/add/{self.pump.pk}/', {'quantity': 2})
+        self.client.post(f'/cart/add/{self.cable.pk}/', {'quantity': 1})
+        self.assertNotIn('cart', self.client.session)
+        self.assertEqual(self.client.session['cart_id'], self.user.cart.pk)
+        self.assertEqual(self.client.get('/cart/').context['cart_count'], 2)
+
+    def test_legacy_session_cart_is_moved_skipping_bad_lines(self):
+        self.client.force_login(self.user)
+        session = self.client.session
+        session['cart'] = {
+            str(self.pump.pk): '2', str(self.cable.pk): 'lots', '99999': 1, 'junk': 1,
+        }
+        session.save()
+
+        response = self.client.get('/cart/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('cart', self.client.session)
+        self.assertEqual(cart_store.contents(self.user.cart), {str(self.pump.pk): 2})
+
+    def test_anonymous_cart_is_merged_on_login(self):
+        cart_store.add(Cart.objects.create(user=self.user), self.pump.pk, 1)
+        anonymous = Cart.objects.create()
+        cart_store.add(anonymous, self.pump.pk, 2)
+        cart_store.add(anonymous, self.cable.pk, 1)
+        session = self.client.session
+        session['cart_id'] = anonymous.pk
+        session.save()
+
+        self.client.login(username='buyer', password='secret-pass')
+        self.assertFalse(Cart.objects.filter(pk=anonymous.pk).exists())
+        self.assertEqual(self.client.session['cart_id'], self.user.cart.pk)
+        self.assertEqual(cart_store.contents(self.user.cart), {str(self.pump.pk): 3, str(self.cable.pk): 1})
+
+    def test_idle_carts_expire_in_bulk(self):
+        old = timezone.now() - timedelta(days=30)
+        stale = Cart.objects.create()
+        cart_store.add(stale, self.pump.pk, 1)
+        kept = Cart.objects.create(user=self.user)
+        Cart.objects.filter(pk__in=[stale.pk, kept.pk]).update(updated_at=old)
+        fresh = Cart.objects.create()
+
+        call_command('expire_carts', stdout=StringIO())
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {kept.pk, fresh.pk})
+        self.assertFalse(CartItem.objects.filter(cart_id=stale.pk).exists())
+
+
+class CartApiTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'), stock=5,
+        )
+        self.cable = Product.objects.create(
+            category=category, name='Cable', slug='cable', price=Decimal('800.00'), stock=9,
+        )
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret-pass')
+        self.client.force_login(self.user)
+
+    def test_add_returns_the_line_and_totals(self):
+        self.client.post(f'/api/cart/add/{self.cable.pk}/', {'quantity': 2})
+        response = self.client.post(f'/api/cart/add/{self.pump.pk}/', {'quantity': 9})
+        data = response.json()
+        self.assertEqual(data['line']['quantity'], 5)  # capped at stock
+        self.assertEqual(data['line']['subtotal'], '62500.00')
+        self.assertEqual(data['total'], '64100.00')
+        self.assertEqual(data['cart_count'], 2)
+        self.assertEqual(data['version'], 2)
+
+    def test_update_and_remove_check_the_version(self):
+        version = self.client.post(f'/api/cart/add/{self.pump.pk}/').json()['version']
+        stale = self.client.post(f'/api/cart/update/{self.pump.pk}/', {'quantity': 3, 'version': version - 1})
+        self.assertEqual(stale.status_code, 409)
+        self.assertTrue(stale.json()['conflict'])
+
+        data = self.client.post(
+            f'/api/cart/update/{self.pump.pk}/', {'quantity': 3, 'version': version},
+        ).json()
+        self.assertEqual(data['line']['quantity'], 3)
+
+        data = self.client.post(
+            f'/api/cart/remove/{self.pump.pk}/', {'version': data['version']},
+        ).json()
+        self.assertTrue(data['removed'])
+        self.assertEqual((data['cart_count'], data['total']), (0, '0'))
+        self.assertEqual(cart_store.contents(self.user.cart), {})
+
+    def test_mutation_costs_two_reads_and_two_writes(self):
+        self.client.post(f'/api/cart/add/{self.pump.pk}/')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(f'/api/cart/add/{self.cable.pk}/', content_type='application/json',
+                             data={'quantity': 1})
+        store = [q['sql'] for q in ctx.captured_queries if '"store_' in q['sql']]
+        selects = [sql for sql in store if sql.startswith('SELECT')]
+        writes = [sql for sql in store if not sql.startswith('SELECT')]
+        self.assertEqual(len(selects), 2)  # the cart, then lines + products + stock
+        self.assertEqual(len(writes), 2)  # version bump, line upsert
+
+    def test_anonymous_add_asks_to_log_in(self):
+        self.client.logout()
+        response = self.client.post(f'/api/cart/add/{self.pump.pk}/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('login_url', response.json())
+
+
+class WishlistCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        self.pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump', price=Decimal('12500.00'), stock=5,
+        )
+        self.cable = Product.objects.create(
+            category=category, name='Cable', slug='cable', price=Decimal('800.00'), stock=9,
+        )
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret-pass')
+
+    def test_ids_are_loaded_once_and_kept_current(self):
+        Wishlist.objects.create(user=self.user, product=self.pump)
+        with self.assertNumQueries(1):
+            wishlist.product_ids(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            wishlist.add(self.user, self.cable.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(wishlist.product_ids(self.user), {self.pump.pk, self.cable.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pump.delete()
+        self.assertEqual(wishlist.count(self.user), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(wishlist.count(self.user), 1)
+
+    def test_toggle_is_one_delete_or_insert(self):
+        # toggle on: DELETE, INSERT (plus the savepoint pair)
+        with self.assertNumQueries(4):
+            self.assertTrue(wishlist.toggle(self.user, self.pump.pk))
+        with self.assertNumQueries(3):
+            self.assertFalse(wishlist.toggle(self.user, self.pump.pk))
+        self.assertFalse(Wishlist.objects.exists())
+
+    def test_bulk_add_remove_and_move_to_cart(self):
+        third = Product.objects.create(
+            category=self.pump.category, name='Panel', slug='panel', price=Decimal('4000.00'), stock=0,
+        )
+        with self.assertNumQueries(2):
+            wishlist.add_many(self.user, [self.pump.pk, self.cable.pk, third.pk, 999])
+        self.assertEqual(Wishlist.objects.filter(user=self.user).count(), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(wishlist.remove_many(self.user, [self.cable.pk]), 1)
+
+        wishlist.add(self.user, self.cable.pk)
+        cart = Cart.objects.create(user=self.user)
+        cart_store.add(cart, self.cable.pk, 3)
+        # select, cart version bump and re-read, one INSERT, one DELETE (+ savepoints)
+        with self.assertNumQueries(9):
+            moved = wishlist.move_to_cart(self.user, cart)
+        self.assertEqual(sorted(moved), sorted([self.pump.pk, self.cable.pk]))
+        self.assertEqual(cart_store.contents(cart), {str(self.pump.pk): 1, str(self.cable.pk): 3})
+        # out of stock, so it stays on the wishlist
+        self.assertEqual(list(Wishlist.objects.values_list('product_id', flat=True)), [third.pk])
+
+    def test_bulk_and_move_endpoints(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/wishlist/bulk/', {'action': 'add', 'product_ids': [self.pump.pk, self.cable.pk]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['wishlist_count'], 2)
+        self.assertEqual(response.json()['changed'], 2)
+        response = self.client.post(
+            '/wishlist/bulk/', {'action': 'add', 'product_ids': [self.pump.pk]},
+            content_type='application/json',
+        )
+        self.assertEqual((response.json()['changed'], response.json()['wishlist_count']), (0, 2))
+        response = self.client.post('/wishlist/move-to-cart/', {'product_ids': [self.pump.pk]})
+        self.assertRedirects(response, '/cart/')
+        self.assertEqual(cart_store.contents(self.user.cart), {str(self.pump.pk): 1})
+        self.assertEqual(list(Wishlist.objects.values_list('product_id', flat=True)), [self.cable.pk])
+
+    def test_toggle_reports_the_count_from_the_cache(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/wishlist/toggle/{self.pump.pk}/', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+        self.assertEqual(response.json()['wishlist_count'], 1)
+        self.assertEqual(self.client.get('/cart/').context['wishlist_count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/wishlist/toggle/{self.pump.pk}/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(self.client.get('/cart/').context['wishlist_count'], 0)
+
+
+class RecommendationEngineTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+
+        def pump(slug, price, depth, **specs):
+            return Product.objects.create(
+                category=category, name=slug, slug=slug, price=Decimal(price), stock=5,
+                phase=specs.pop('phase', 'single'), usage_type=specs.pop('usage_type', 'domestic'),
+                max_depth_ft=depth, **specs,
+            )
+
+        self.snug = pump('snug', '9000.00', 160, max_head_m=60, max_flow_lpm=40, motor_power_hp=1)
+        self.deep = pump('deep', '8000.00', 600, max_head_m=60, max_flow_lpm=40, motor_power_hp=1)
+        self.pricey = pump('pricey', '30000.00', 180, max_head_m=70, max_flow_lpm=45, motor_power_hp=2)
+        self.shallow = pump('shallow', '5000.00', 100)
+        pump('three-phase', '7000.00', 200, phase='three')
+
+    def test_filters_and_ranks_by_fit(self):
+        count, rows = recommendation.recommend_pumps(150, 'domestic', 'single')
+        self.assertEqual(count, 3)
+        # the cheapest pump is rated far deeper than needed, so it ranks last
+        self.assertEqual([row['slug'] for row in rows], ['snug', 'pricey', 'deep'])
+        self.assertEqual(set(rows[0]), {
+            'id', 'slug', 'name', 'model_number', 'price', 'motor_power_hp', 'max_head_m',
+            'max_flow_lpm', 'max_depth_ft', 'phase', 'usage_type', 'product_url',
+        })
+
+        count, rows = recommendation.recommend_pumps(150, 'domestic', 'single', max_budget=10000, limit=1)
+        self.assertEqual((count, [row['slug'] for row in rows]), (2, ['snug']))
+        self.assertEqual(recommendation.recommend_pumps(150, 'industrial', 'single'), (0, []))
+
+    def test_index_is_reused_until_the_catalog_changes(self):
+        recommendation.recommend_pumps(150, 'domestic', 'single')
+        with self.assertNumQueries(0):
+            recommendation.recommend_pumps(120, 'domestic', 'single')
+
+        self.shallow.max_depth_ft = 400
+        self.shallow.save()
+        count, _ = recommendation.recommend_pumps(150, 'domestic', 'single')
+        self.assertEqual(count, 4)
+
+    def test_equivalent_queries_share_a_cached_result(self):
+        recommendation.reset_stats()
+        first = recommendation.recommend_pumps(120, 'domestic', 'single', max_budget=9500)
+        # 150 ft is still within the 100-160 ft bucket, 9999 still buys the same pumps
+        second = recommendation.recommend_pumps(150, 'Domestic', 'single', max_budget=9999)
+        self.assertEqual(first, second)
+        recommendation.recommend_pumps(170, 'domestic', 'single', max_budget=9500)
+        stats = recommendation.stats()
+        self.assertEqual((stats['hit'], stats['miss']), (1, 2))
+
+        self.pricey.price = Decimal('9000.00')
+        self.pricey.save()
+        count, _ = recommendation.recommend_pumps(150, 'domestic', 'single', max_budget=9999)
+        self.assertEqual(count, 3)
+        self.assertEqual(recommendation.stats()['miss'], 3)
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        data = self.client.get('/api/cache-stats/recommend-cache/').json()
+        self.assertEqual((data['hit'], data['miss'], data['shared']), (1, 3, False))
+        with self.assertRaisesMessage(CommandError, '/api/cache-stats/recommend-cache/'):
+            call_command('recommendation_cache_stats', stdout=StringIO())
+
+    def test_api_validates_numbers(self):
+        response = self.client.get('/api/recommend-pump/?depth_ft=deep&usage_type=domestic&phase=single')
+        self.assertEqual(response.status_code, 400)
+        data = self.client.get(
+            '/api/recommend-pump/?depth_ft=150&usage_type=domestic&phase=single&limit=2'
+        ).json()
+        self.assertEqual(data['recommended_count'], 3)
+        self.assertEqual(len(data['recommendations']), 2)
+
+    @override_settings(RECOMMENDATION_LIMIT=1)
+    def test_api_returns_every_match_unless_limited(self):
+        data = self.client.get('/api/recommend-pump/?depth_ft=150&usage_type=domestic&phase=single').json()
+        self.assertEqual((data['recommended_count'], len(data['recommendations'])), (3, 3))
+
+
+class BatchRecommendationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        for slug, price, depth, phase in (
+            ('v-3', '9000.00', 160, 'single'), ('v-4', '14000.00', 300, 'single'),
+            ('v-6', '30000.00', 500, 'three'),
+        ):
+            Product.objects.create(
+                category=category, name=slug, slug=slug, price=Decimal(price), stock=5,
+                phase=phase, usage_type='agriculture', max_depth_ft=depth,
+            )
+        self.client.force_login(User.objects.create_user('dealer'))
+
+    def lines(self, response):
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_json_batch_streams_one_line_per_row_in_order(self):
+        queries = [
+            {'ref': 'well-1', 'depth_ft': 150, 'usage_type': 'agriculture', 'phase': 'single'},
+            {'ref': 'well-2', 'depth_ft': 200, 'usage_type': 'agriculture', 'phase': 'three', 'budget': 1000},
+            {'ref': 'well-3', 'depth_ft': 'deep', 'usage_type': 'agriculture', 'phase': 'single'},
+            {'ref': 'well-4', 'depth_ft': 250, 'usage_type': 'agriculture', 'phase': 'single'},
+        ]
+        lines = self.lines(self.client.post(
+            '/api/recommend-pump/batch/?limit=1', queries, content_type='application/json',
+        ))
+        self.assertEqual([line['ref'] for line in lines], ['well-1', 'well-2', 'well-3', 'well-4'])
+        self.assertEqual(lines[0]['recommended_count'], 2)
+        self.assertEqual(len(lines[0]['recommendations']), 1)
+        self.assertEqual(lines[1]['recommended_count'], 0)
+        self.assertIn('must be a number', lines[2]['error'])
+        self.assertEqual([r['slug'] for r in lines[3]['recommendations']], ['v-4'])
+
+    def test_csv_batch_costs_the_same_queries_for_any_size(self):
+        def post(count):
+            body = 'ref,depth_ft,usage_type,phase,budget\n' + ''.join(
+                f'w{i},{100 + i},agriculture,single,\n' for i in range(count)
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                lines = self.lines(self.client.post(
+                    '/api/recommend-pump/batch/', body, content_type='text/csv',
+                ))
+            self.assertEqual(len(lines), count)
+            return len(ctx.captured_queries)
+
+        post(1)  # builds the index
+        self.assertEqual(post(1), post(200))
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.post('/api/recommend-pump/batch/', [], content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+
+class PerformanceCurveTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Pumps', slug='pumps')
+
+    def pump(self, slug, price, points=None, **specs):
+        return Product.objects.create(
+            category=self.category, name=slug, slug=slug, price=Decimal(price), stock=5,
+            phase='three', usage_type='agriculture', max_depth_ft=400,
+            performance_curve=curves.pack(points) if points else None, **specs,
+        )
+
+    def test_csv_round_trip_and_validation(self):
+        points = curves.parse_csv('flow_lpm,head_m\n80,38\n0,62\n40,55\n')
+        self.assertEqual(points, [(0, 62), (40, 55), (80, 38)])
+        self.assertEqual(curves.to_csv(curves.pack(points)), '0,62\n40,55\n80,38\n')
+        with self.assertRaisesMessage(ValueError, 'fall'):
+            curves.parse_csv('0,40\n50,45\n')
+        with self.assertRaisesMessage(ValueError, 'Line 2'):
+            curves.parse_csv('0,40\nabc,12\n')
+
+    def test_flow_at_head_matches_per_curve_interpolation(self):
+        rng = np.random.default_rng(7)
+        stacked = []
+        for size in (2, 5, 9):
+            flows = np.sort(rng.uniform(0, 300, size)).astype(np.float32)
+            heads = np.sort(rng.uniform(10, 120, size))[::-1].astype(np.float32)
+            stacked.append(np.column_stack([flows, heads]))
+        flows, heads = curves.stack(stacked)
+        for head in (5, 30, 60, 90, 150):
+            expected = [
+                np.interp(head, c[::-1, 1], c[::-1, 0]) if head <= c[0, 1] else 0 for c in stacked
+            ]
+            np.testing.assert_allclose(curves.flow_at_head(flows, heads, head), expected, rtol=1e-5)
+
+    def test_api_ranks_pumps_meeting_the_operating_point_by_margin(self):
+        self.pump('just-right', '20000.00', [(0, 70), (50, 62), (100, 40)])
+        self.pump('oversized', '15000.00', [(0, 90), (100, 80), (200, 50)])
+        self.pump('too-weak', '9000.00', [(0, 65), (30, 55), (60, 30)])
+        # no curve: falls back to the straight line from its max head to its max flow
+        self.pump('no-curve', '12000.00', max_head_m=100, max_flow_lpm=150)
+
+        data = self.client.get(
+            '/api/recommend-pump/?depth_ft=200&usage_type=agriculture&phase=three&flow_lpm=45&head_m=60'
+        ).json()
+        self.assertEqual(data['recommended_count'], 3)
+        self.assertEqual(
+            [row['slug'] for row in data['recommendations']], ['just-right', 'no-curve', 'oversized'],
+        )
+        self.assertAlmostEqual(data['recommendations'][0]['operating_flow_lpm'], 54.5)
+        self.assertGreaterEqual(data['recommendations'][0]['efficiency_margin'], 0)
+
+        response = self.client.get('/api/recommend-pump/?depth_ft=200&usage_type=agriculture&phase=three&head_m=60')
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_form_uploads_a_curve(self):
+        from adminpanel.forms import ProductForm
+
+        product = self.pump('v-6', '20000.00')
+        data = {
+            'category': self.category.pk, 'name': 'V-6', 'slug': 'v-6', 'price': '20000.00',
+            'stock': 5, 'is_available': True,
+        }
+        upload = SimpleUploadedFile('curve.csv', b'flow_lpm,head_m\n0,70\n50,62\n100,40\n')
+        form = ProductForm(data, {'performance_curve_csv': upload}, instance=product)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        product.refresh_from_db()
+        self.assertEqual(curves.unpack(product.performance_curve).tolist(), [[0, 70], [50, 62], [100, 40]])
+
+        bad = SimpleUploadedFile('curve.csv', b'0,70\n')
+        form = ProductForm(data, {'performance_curve_csv': bad}, instance=product)
+        self.assertIn('performance_curve_csv', form.errors)
+
+    def test_benchmark_command_runs(self):
+        out = StringIO()
+        call_command('benchmark_recommendations', pumps=50, repeat=1, stdout=out)
+        self.assertIn('Built index of 50 pumps', out.getvalue())
+        self.assertIn('vectorised', out.getvalue())
+
+
+class ChatbotSessionTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        for slug, phase, usage, depth in (
+            ('s-agri', 'single', 'agriculture', 150), ('s-home', 'single', 'domestic', 160),
+            ('t-agri', 'three', 'agriculture', 200), ('t-agri-2', 'three', 'agriculture', 250),
+        ):
+            Product.objects.create(
+                category=category, name=slug, slug=slug, price=Decimal('8000.00'), stock=5,
+                phase=phase, usage_type=usage, max_depth_ft=depth,
+            )
+
+    def answer(self, session, field, value):
+        return self.client.post(
+            f'/api/chatbot/sessions/{session}/', {'field': field, 'value': value},
+            content_type='application/json',
+        )
+
+    def test_asks_the_most_informative_question_and_narrows_each_turn(self):
+        reply = self.client.post('/api/chatbot/sessions/').json()
+        session = reply['session']
+        # phase splits the pumps 2/2, usage only 3/1; depth and price don't split them
+        self.assertEqual(reply['question']['field'], 'phase')
+        self.assertEqual(reply['remaining'], 4)
+        self.assertEqual({o['value']: o['count'] for o in reply['question']['options']},
+                         {'single': 2, 'three': 2})
+
+        reply = self.answer(session, 'phase', 'Single').json()
+        self.assertEqual((reply['remaining'], reply['question']['field']), (2, 'usage_type'))
+
+        # later turns only look at the narrowed set: no database access
+        with self.assertNumQueries(0):
+            reply = self.answer(session, 'usage_type', 'agriculture').json()
+        self.assertEqual((reply['remaining'], reply['question']['field']), (1, 'depth_ft'))
+
+        reply = self.answer(session, 'depth_ft', '120').json()
+        self.assertEqual(reply['question']['field'], 'budget')
+        reply = self.answer(session, 'budget', '').json()
+        self.assertTrue(reply['done'])
+        self.assertEqual([r['slug'] for r in reply['recommendations']], ['s-agri'])
+
+    def test_invalid_answers_leave_the_session_unchanged(self):
+        session = self.client.post('/api/chatbot/sessions/').json()['session']
+        self.assertEqual(self.answer(session, 'phase', 'two').status_code, 400)
+        self.assertEqual(self.answer(session, 'colour', 'red').status_code, 400)
+        reply = self.answer(session, 'depth_ft', '210').json()
+        self.assertEqual(reply['answers'], {'depth_ft': 210.0})
+        self.assertEqual((reply['remaining'], reply['question']['field']), (1, 'phase'))
+        reply = self.answer(session, 'phase', 'single').json()
+        # nothing left to narrow, so no more questions
+        self.assertTrue(reply['done'])
+        self.assertEqual(reply['recommendations'], [])
+
+    def test_changing_an_answer_starts_again_from_every_pump(self):
+        session = self.client.post('/api/chatbot/sessions/').json()['session']
+        self.assertEqual(self.answer(session, 'phase', 'single').json()['remaining'], 2)
+        reply = self.answer(session, 'phase', 'three').json()
+        self.assertEqual((reply['remaining'], reply['answers']), (2, {'phase': 'three'}))
+        reply = self.answer(session, 'usage_type', 'agriculture').json()
+        self.assertEqual(reply['remaining'], 2)
+
+    def test_non_finite_numbers_are_rejected(self):
+        session = self.client.post('/api/chatbot/sessions/').json()['session']
+        for value in ('nan', 'inf', '-inf'):
+            self.assertEqual(self.answer(session, 'depth_ft', value).status_code, 400)
+            self.assertEqual(self.answer(session, 'budget', value).status_code, 400)
+        self.assertEqual(self.answer(session, 'phase', 'three').json()['remaining'], 2)
+
+    def test_unknown_session_is_reported_as_expired(self):
+        response = self.answer('0' * 32, 'phase', 'single')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'This conversation has expired'})
+
+    def test_expired_or_ended_sessions_are_gone(self):
+        session = self.client.post('/api/chatbot/sessions/').json()['session']
+        self.assertEqual(self.client.delete(f'/api/chatbot/sessions/{session}/').status_code, 204)
+        self.assertEqual(self.answer(session, 'phase', 'single').status_code, 404)
+        with self.settings(CHATBOT_SESSION_TIMEOUT=-1):
+            session = self.client.post('/api/chatbot/sessions/').json()['session']
+        self.assertEqual(self.answer(session, 'phase', 'single').status_code, 404)
+
+    def test_survives_a_catalog_change_between_turns(self):
+        session = self.client.post('/api/chatbot/sessions/').json()['session']
+        self.answer(session, 'phase', 'three')
+        Product.objects.filter(slug='t-agri').update(is_available=False)
+        catalog.bump_catalog_version()
+        reply = self.answer(session, 'usage_type', 'agriculture').json()
+        self.assertEqual(reply['remaining'], 1)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    BUYERS = 25
+    STOCK = 7
+
+    def test_no_oversell_under_concurrent_buyers(self):
+        category = Category.objects.create(name='Pumps', slug='pumps')
+        pump = Product.objects.create(
+            category=category, name='V-4 Pump', slug='v-4-pump',
+            price=Decimal('12500.00'), stock=self.STOCK,
+        )
+        start = threading.Barrier(self.BUYERS)
+        results = []
+
+        def buy():
+            product = Product.objects.get(id=pump.id)
+            start.wait()
+            for _ in range(500):
+                try:
+                    place_order(_order(), [CartLine(product, 1)])
+                    results.append('ok')
+                    break
+                except InsufficientStock:
+                    results.append('rejected')
+                    break
+                except OperationalError:
+                    # SQLite serialises writers; retry when the table is locked
+                    time.sleep(0.005)
+            connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(self.BUYERS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        pump.refresh_from_db()
+        self.assertEqual(results.count('ok'), self.STOCK)
+        self.assertEqual(results.count('rejected'), self.BUYERS - self.STOCK)
+        self.assertEqual(pump.stock, 0)
+        self.assertEqual(
+            sum(OrderItem.objects.filter(product=pump).values_list('quantity', flat=True)),
+            self.STOCK,
+        )
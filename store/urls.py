@@ -7,6 +7,7 @@ app_name = 'store'
 urlpatterns = [
     path('', views.home, name='home'),  
     path('shop/', views.shop, name='shop'),
+    path('api/search/suggest/', views.search_suggest, name='search_suggest'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
 
     path('cart/', views.cart_detail, name='cart_detail'),
@@ -14,6 +15,10 @@ urlpatterns = [
     path('cart/remove/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('cart/clear/', views.clear_cart, name='clear_cart'),
     path('cart/update/<int:product_id>/', views.update_cart, name='update_cart'),
+    path('api/cart/add/<int:product_id>/', views.cart_api_add, name='cart_api_add'),
+    path('api/cart/update/<int:product_id>/', views.cart_api_update, name='cart_api_update'),
+    path('api/cart/remove/<int:product_id>/', views.cart_api_remove, name='cart_api_remove'),
+    path('api/cart/clear/', views.cart_api_clear, name='cart_api_clear'),
 
     path('checkout/', views.checkout, name='checkout'),
     path('order-success/<int:order_id>/', views.order_success, name='order_success'),
@@ -32,6 +37,8 @@ urlpatterns = [
     path('wishlist/add/<int:product_id>/', views.add_to_wishlist, name='add_to_wishlist'),
     path('wishlist/remove/<int:product_id>/', views.remove_from_wishlist, name='remove_from_wishlist'),
     path('wishlist/toggle/<int:product_id>/', views.toggle_wishlist, name='toggle_wishlist'),
+    path('wishlist/bulk/', views.wishlist_bulk, name='wishlist_bulk'),
+    path('wishlist/move-to-cart/', views.wishlist_move_to_cart, name='wishlist_move_to_cart'),
 
     path('payment/razorpay/', views.razorpay_payment, name='razorpay_payment'),
     path('api/payment/verify/', views.verify_payment, name='verify_payment'),
@@ -45,7 +52,11 @@ urlpatterns = [
     path('forgot-password/', views.forgot_password_page, name='forgot_password'),
 
     path('api/recommend-pump/', views.pump_recommendation_api, name='pump_recommendation'),
+    path('api/recommend-pump/batch/', views.pump_recommendation_batch_api, name='pump_recommendation_batch'),
+    path('api/chatbot/sessions/', views.chatbot_session_start, name='chatbot_session_start'),
+    path('api/chatbot/sessions/<str:session_id>/', views.chatbot_session_answer, name='chatbot_session_answer'),
     path('pump-chatbot/', views.pump_chatbot_page, name='pump_chatbot'),
+    path('api/cache-stats/<str:name>/', views.cache_stats_api, name='cache_stats'),
    
 
 ]
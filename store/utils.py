@@ -46,11 +46,9 @@ def generate_receipt_pdf(order):
     y -= 15
 
     p.setFont("Helvetica", 10)
-    total_amount = 0
 
-    for item in order.items.all():
+    for item in order.items.select_related('product'):
         line_total = item.price * item.quantity
-        total_amount += line_total
 
         p.drawString(40, y, item.product.name)
         p.drawString(260, y, str(item.quantity))
@@ -64,7 +62,7 @@ def generate_receipt_pdf(order):
 
     y -= 20
     p.setFont("Helvetica-Bold", 11)
-    p.drawString(40, y, f"Total Amount Paid: ₹{total_amount}")
+    p.drawString(40, y, f"Total Amount Paid: ₹{order.total}")
 
     y -= 40
     p.setFont("Helvetica", 9)
@@ -99,15 +97,15 @@ def send_order_receipt(order):
 
     html_content = render_to_string('store/email_receipt.html', {
         'order': order,
-        'items': order.items.all(),
-        'total': sum(i.price * i.quantity for i in order.items.all())
+        'items': order.items.select_related('product'),
+        'total': order.total
     })
 
     text_content = f"""
 Thank you for your order!
 
 Order ID: {order.id}
-Total Paid: ₹{sum(i.price * i.quantity for i in order.items.all())}
+Total Paid: ₹{order.total}
 
 KEC Pumps
 """
@@ -128,11 +126,9 @@ KEC Pumps
         mimetype="application/pdf"
     )
 
-    try:
-        email.send()
-        print(f"PDF receipt email sent to {order.email}")
-    except Exception as e:
-        print("Receipt email failed:", e)
+    # Let failures propagate so the background worker can retry
+    email.send()
+    print(f"PDF receipt email sent to {order.email}")
 
 
 def generate_otp():
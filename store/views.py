@@ -1,4 +1,5 @@
 from django.shortcuts import render,get_object_or_404,redirect
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.urls import reverse
 from .models import Category, Product, Order, OrderItem,Address,Wishlist
@@ -8,19 +9,26 @@ from .forms import CheckoutForm,AddressForm,SignUpForm,ProfileForm
 
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
+from django.db import IntegrityError, transaction
+import csv
+import hashlib
+import io
+import json
 import logging
 logger = logging.getLogger(__name__)
 
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.core.cache import cache
 
 import razorpay
 from django.conf import settings
 
 from razorpay.errors import SignatureVerificationError
-from store.utils import send_order_receipt
+from store.service.jobs import enqueue
 
-from django.core.mail import send_mail
 from .models import PasswordResetOTP
 from .utils import generate_otp
 from django.contrib.auth.models import User
@@ -28,103 +36,267 @@ from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
 
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny,IsAuthenticated
+from rest_framework.permissions import AllowAny,IsAdminUser,IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes , authentication_classes
 from rest_framework.authentication import SessionAuthentication
 
-from .serializers import ProductRecommendationSerializer
+from .service import recommendation
 from .service.recommendation import recommend_pumps
+from .service import cart_store, wishlist
+from .service.cart import price_cart, price_lines
+from .service.orders import place_order, place_paid_order, InsufficientStock
+from .service.holds import hold_stock, with_available_stock
+from .service.search import search_products, fts_available
+from .service.pagination import SORTS, RELEVANCE, keyset_page, relevance_page
+from .service.suggest import suggest
+from .service import products as product_cache
+from .service.products import get_product_or_404
+from .service import catalog, chatbot, facets
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
 
+def _page_etag(request, *parts):
+    """
+    ETag for a storefront page built from `parts` plus what personalises it
+    (user, cart version). None when the page must be re-rendered anyway
+    because flash messages are waiting to be shown.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    cart = cart_store.summary(request.session.get(cart_store.SESSION_KEY))
+    digest = hashlib.md5(
+        repr((request.user.pk, cart, parts)).encode(), usedforsecurity=False
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def _not_modified(request, etag, last_modified):
+    """A 304 response when the client's copy is still current, else None."""
+    if etag is None:
+        return None
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()),
+    )
+
+
+def _set_validators(response, etag, last_modified):
+    if etag is not None:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
 def home(request):
-    categories = Category.objects.all()
+    categories = catalog.categories()
     return render(request, 'store/home.html', 
                  {'categories': categories,})
 
 
+def _shop_page(products, category_slug, selection, query, sort, cursor):
+    """
+    One page of shop results as (rows, next_cursor). Which ids make up the
+    page is cached under the catalog version; the rows themselves are always
+    re-read so stock and holds are live.
+    """
+    key = (category_slug, sorted(selection.items()), query, sort, cursor)
+    page = cache.get(catalog.catalog_key('shop-page', *key))
+    if page is not None:
+        ids, next_cursor = page
+        found = products.in_bulk(ids)
+        return [found[pid] for pid in ids if pid in found], next_cursor
+
+    if query and sort == RELEVANCE:
+        rows, next_cursor = relevance_page(products, query, cursor)
+    else:
+        if query:
+            # every FTS5 match (icontains fallback); the keyset sort pages them
+            products = search_products(products, query, ranked=False)
+        rows, next_cursor = keyset_page(products, sort, cursor)
+    cache.set(
+        catalog.catalog_key('shop-page', *key),
+        ([p.id for p in rows], next_cursor),
+        catalog.CACHE_TIMEOUT,
+    )
+    return rows, next_cursor
+
 def shop(request):
-    categories = Category.objects.all()
-    products = Product.objects.filter(is_available=True)
+    categories = catalog.categories()
+    available = Product.objects.filter(is_available=True)
+    products = with_available_stock(available)
     
     # Category filter 
     category_slug = request.GET.get('category')
     if category_slug:
         products = products.filter(category__slug=category_slug)
+
+    # Spec facets (phase, usage, HP/head/flow/depth ranges)
+    selection = facets.parse_selection(request.GET)
+    products = facets.apply_selection(products, selection)
     
-    # Search filter 
+    # Sorting: relevance only makes sense (and only exists) for FTS searches
     query = request.GET.get('q')
-    if query:
-        products = products.filter(
-            Q(name__icontains=query) |
-            Q(model_number__icontains=query) 
-        )
+    sort = request.GET.get('sort')
+    if sort not in SORTS and not (sort == RELEVANCE and query and fts_available()):
+        sort = RELEVANCE if query and fts_available() else 'newest'
+
+    # Search filter + keyset pagination (no COUNT(*), constant cost per page)
+    cursor = request.GET.get('cursor')
+    products, next_cursor = _shop_page(products, category_slug, selection, query, sort, cursor)
+
+    next_url = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        params.pop('format', None)
+        next_url = f"{request.path}?{params.urlencode()}"
     
     # Get wishlist product IDs for current user
-    wishlist_product_ids = []
-    if request.user.is_authenticated:
-        wishlist_product_ids = list(
-            Wishlist.objects.filter(user=request.user).values_list('product_id', flat=True)
-        )
+    wishlist_product_ids = wishlist.product_ids(request.user)
     
+    # Conditional GET: the page is fully determined by the catalog version,
+    # the query string and the live stock of the rows on it.
+    etag = _page_etag(
+        request, catalog.catalog_version(), request.GET.urlencode(),
+        [(p.id, p.stock, p.available_stock) for p in products], sorted(wishlist_product_ids),
+    )
+    last_modified = catalog.catalog_changed_at()
+    not_modified = _not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
     context = {
         'categories': categories,
         'products': products,
         'selected_category': category_slug,
         'search_query': query,
+        'sort': sort,
         'wishlist_product_ids': wishlist_product_ids,
+        'next_url': next_url,
     }
-    return render(request, 'store/shop.html', context)
+
+    # Infinite-scroll variant: the next page of cards as JSON
+    if request.GET.get('format') == 'json':
+        return _set_validators(JsonResponse({
+            'html': render_to_string('store/_product_cards.html', context, request=request),
+            'count': len(products),
+            'next_cursor': next_cursor,
+            'next_url': next_url,
+        }), etag, last_modified)
+
+    # Sidebar counts come from the in-process facet index; a search only
+    # costs one extra id lookup to scope them.
+    search_ids = None
+    if query:
+        search_ids = catalog.cached('search-ids', lambda: list(
+            search_products(available, query, ranked=False).values_list('id', flat=True)
+        ), query)
+    context['facet_groups'] = facets.sidebar(selection, category=category_slug, search_ids=search_ids)
+    return _set_validators(render(request, 'store/shop.html', context), etag, last_modified)
+
+def search_suggest(request):
+    """Typeahead suggestions from the in-process prefix index (no DB hit when warm)."""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', 8))
+    except ValueError:
+        limit = 8
+    return JsonResponse({
+        'query': query,
+        'suggestions': suggest(query, limit=limit) if query else [],
+    })
 
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug, is_available=True)
+    # Product and category come from the product cache; stock is re-read
+    # because orders change it without bumping the catalog version.
+    product = get_product_or_404(slug=slug, available_only=True)
+    stock = (
+        with_available_stock(Product.objects.filter(pk=product.pk))
+        .values_list('stock', 'available_stock').first()
+    )
+    if stock is None:
+        raise Http404("No product matches the given query.")
+    product.stock, product.available_stock = stock
     
     # Check if product is in wishlist
-    is_in_wishlist = False
-    if request.user.is_authenticated:
-        is_in_wishlist = Wishlist.objects.filter(
-            user=request.user, 
-            product=product
-        ).exists()
+    wishlist_product_ids = wishlist.product_ids(request.user)
+    is_in_wishlist = product.id in wishlist_product_ids
+
+    etag = _page_etag(
+        request, product.id, product.updated_at, product.category.updated_at,
+        product.stock, product.available_stock, sorted(wishlist_product_ids),
+    )
+    last_modified = max(product.updated_at, product.category.updated_at)
+    not_modified = _not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
     
-    return render(request, 'store/product_detail.html', {
+    return _set_validators(render(request, 'store/product_detail.html', {
         'product': product,
         'is_in_wishlist': is_in_wishlist,
-    })
+    }), etag, last_modified)
 
 # CART HELPERS 
 
-def _get_cart(request):
-    """Return cart dict from session: {product_id: quantity}"""
-    return request.session.get('cart', {})
+def _get_cart(request, create=False):
+    """
+    The visitor's server-side Cart (see service.cart_store), or None.
+    A cart dict left in the session by older code is moved into the store.
+    """
+    legacy = request.session.get('cart')
+    cart = cart_store.get_cart(request, create=create or bool(legacy))
+    if legacy is not None:
+        wanted = {}
+        for pid, qty in legacy.items():
+            try:
+                pid, qty = int(pid), int(qty)
+            except (TypeError, ValueError):
+                continue  # unreadable line from an old session
+            if qty > 0:
+                wanted[pid] = qty
+        for pid in Product.objects.filter(id__in=list(wanted)).values_list('id', flat=True):
+            cart_store.add(cart, pid, wanted[pid])
+        del request.session['cart']
+    return cart
+
 
+def _cart_quantity(cart, product_id):
+    if cart is None:
+        return None
+    return cart.items.filter(product_id=product_id).values_list('quantity', flat=True).first()
 
-def _save_cart(request, cart):
-    """Save cart dict back to session"""
-    request.session['cart'] = cart
-    request.session.modified = True
+
+def _price_visitor_cart(request, cart):
+    """
+    Price the cart in one query. Lines whose product was deleted or made
+    unavailable are dropped from the cart and reported to the user.
+    """
+    priced = price_cart(cart_store.contents(cart))
+    if priced.has_problems:
+        for line in priced.unavailable:
+            messages.warning(request, f"{line.product.name} is no longer available and was removed from your cart.")
+        if priced.missing:
+            messages.warning(request, "Some items in your cart no longer exist and were removed.")
+        cart_store.remove_many(cart, [int(pid) for pid in priced.problem_ids() if str(pid).isdigit()])
+    return priced
 
 
 #  CART VIEWS
 @login_required
 def add_to_cart(request, product_id):
-    product = get_object_or_404(Product, id=product_id, is_available=True)
+    product = get_product_or_404(pk=product_id, available_only=True)
 
-    cart = _get_cart(request)
+    cart = _get_cart(request, create=True)
     quantity = int(request.POST.get('quantity', 1))
     if quantity < 1:
         quantity = 1
 
-    pid = str(product_id)
-    current_qty = cart.get(pid, 0)
+    current_qty = _cart_quantity(cart, product.id) or 0
     new_qty = current_qty + quantity
 
 
     if product.stock and new_qty > product.stock:
         new_qty = product.stock
 
-    cart[pid] = new_qty
-    _save_cart(request, cart)
+    cart_store.set_quantity(cart, product.id, new_qty)
 
     messages.success(request, f"Added {product.name} (x{quantity}) to cart.")
 
@@ -137,52 +309,39 @@ def add_to_cart(request, product_id):
 @login_required
 def cart_detail(request):
     cart = _get_cart(request)
-    items = []
-    total = 0
-
-    for pid, qty in cart.items():
-        product = get_object_or_404(Product, id=pid)
-        subtotal = product.price * qty
-        total += subtotal
-        items.append({
-            'product': product,
-            'quantity': qty,
-            'subtotal': subtotal,
-        })
+    priced = _price_visitor_cart(request, cart)
 
     return render(request, 'store/cart.html', {
-        'items': items,
-        'total': total,
+        'items': priced.items,
+        'total': priced.total,
+        'cart_version': cart.version if cart is not None else 0,
     })
 
 
 @require_POST
 def remove_from_cart(request, product_id):
     cart = _get_cart(request)
-    pid = str(product_id)
-    if pid in cart:
-        del cart[pid]
-        _save_cart(request, cart)
+    if cart is not None and cart_store.remove(cart, product_id):
         messages.info(request, "Item removed from cart.")
     return redirect('store:cart_detail')
 
 
 @require_POST
 def clear_cart(request):
-    request.session['cart'] = {}
-    request.session.modified = True
+    cart = _get_cart(request)
+    if cart is not None:
+        cart_store.clear(cart)
     messages.info(request, "Cart cleared.")
     return redirect('store:cart_detail')
 
 @require_POST
 def update_cart(request, product_id):
     cart = _get_cart(request)
-    pid = str(product_id)
 
-    if pid not in cart:
+    if _cart_quantity(cart, product_id) is None:
         return redirect('store:cart_detail')
 
-    product = get_object_or_404(Product, id=product_id)
+    product = get_product_or_404(pk=product_id)
 
     try:
         quantity = int(request.POST.get('quantity', 1))
@@ -191,7 +350,7 @@ def update_cart(request, product_id):
 
     if quantity < 1:
         
-        del cart[pid]
+        cart_store.remove(cart, product.id)
         messages.info(request, f"{product.name} removed from cart.")
     else:
         # optional: cap by stock
@@ -199,30 +358,147 @@ def update_cart(request, product_id):
             quantity = product.stock
             messages.warning(request, f"Quantity adjusted to available stock ({product.stock}).")
 
-        cart[pid] = quantity
+        cart_store.set_quantity(cart, product.id, quantity)
         messages.success(request, f"Updated {product.name} quantity to {quantity}.")
 
-    _save_cart(request, cart)
     return redirect('store:cart_detail')
 
+# CART API (JSON)
+# Each mutation costs two reads (the cart, then its lines + products + stock
+# in one query) and two writes in one transaction: the conditional version
+# bump on Cart, which is what detects a concurrent change, and the upsert of
+# the one line. It answers with just that line and the new totals.
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
+
+def _int_param(data, name, default=None):
+    try:
+        return int(data.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _cart_payload(cart, quantities, products, product_id=None):
+    priced = price_lines(quantities, products)
+    line = None
+    if product_id in quantities:
+        product = products[product_id]
+        line = {
+            'product_id': product.id,
+            'name': product.name,
+            'quantity': quantities[product_id],
+            'price': str(product.price),
+            'subtotal': str(product.price * quantities[product_id]),
+            'max_quantity': product.stock,
+        }
+    if cart is not None:
+        cart_store.remember_summary(cart, len(quantities))
+    return {
+        'version': cart.version if cart is not None else 0,
+        'line': line,
+        'removed': product_id is not None and line is None,
+        'total': str(priced.total),
+        'item_count': priced.item_count,
+        'cart_count': len(quantities),
+    }
+
+
+def _write_line(cart, data, quantities, products, product_id, quantity):
+    """Set one line (0 removes it) against the version the caller saw."""
+    expected = _int_param(data, 'version', cart.version)
+    try:
+        cart_store.set_quantity(cart, product_id, quantity, expected_version=expected)
+    except cart_store.CartConflict:
+        return JsonResponse(
+            {'error': 'Your cart was changed elsewhere. Please reload it.', 'conflict': True},
+            status=409,
+        )
+    if quantity > 0:
+        quantities[product_id] = quantity
+    else:
+        quantities.pop(product_id, None)
+    return JsonResponse(_cart_payload(cart, quantities, products, product_id))
+
+
+@require_POST
+def cart_api_add(request, product_id):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Please log in to add items.', 'login_url': reverse('store:login')}, status=401)
+    data = _request_data(request)
+    quantity = max(_int_param(data, 'quantity', 1), 1)
+
+    cart = _get_cart(request, create=True)
+    quantities, products = cart_store.read_lines(cart, product_id)
+    product = products.get(product_id)
+    if product is None or not product.is_available:
+        return JsonResponse({'error': 'Product not available.'}, status=404)
+
+    new_qty = quantities.get(product_id, 0) + quantity
+    if product.stock and new_qty > product.stock:
+        new_qty = product.stock
+    return _write_line(cart, data, quantities, products, product_id, new_qty)
+
+
+@require_POST
+def cart_api_update(request, product_id):
+    data = _request_data(request)
+    cart = _get_cart(request)
+    if cart is None:
+        return JsonResponse({'error': 'Item not in cart.'}, status=404)
+    quantities, products = cart_store.read_lines(cart)
+    if product_id not in quantities:
+        return JsonResponse({'error': 'Item not in cart.'}, status=404)
+
+    quantity = _int_param(data, 'quantity', 1)
+    stock = products[product_id].stock
+    if stock and quantity > stock:
+        quantity = stock
+    return _write_line(cart, data, quantities, products, product_id, max(quantity, 0))
+
+
+@require_POST
+def cart_api_remove(request, product_id):
+    data = _request_data(request)
+    cart = _get_cart(request)
+    if cart is None:
+        return JsonResponse(_cart_payload(None, {}, {}, product_id))
+    quantities, products = cart_store.read_lines(cart)
+    return _write_line(cart, data, quantities, products, product_id, 0)
+
+
+@require_POST
+def cart_api_clear(request):
+    data = _request_data(request)
+    cart = _get_cart(request)
+    if cart is not None:
+        try:
+            cart_store.clear(cart, expected_version=_int_param(data, 'version'))
+        except cart_store.CartConflict:
+            return JsonResponse(
+                {'error': 'Your cart was changed elsewhere. Please reload it.', 'conflict': True},
+                status=409,
+            )
+    return JsonResponse(_cart_payload(cart, {}, {}))
+
 @login_required
 def checkout(request):
     cart = _get_cart(request)
-    if not cart:
+    priced = _price_visitor_cart(request, cart)
+    if not priced.items and not priced.has_problems:
         messages.error(request, "Your cart is empty. Add some products before checkout.")
         return redirect('store:shop')
 
-    items = []
-    total = 0
-    for pid, qty in cart.items():
-        product = get_object_or_404(Product, id=pid)
-        subtotal = product.price * qty
-        total += subtotal
-        items.append({
-            'product': product,
-            'quantity': qty,
-            'subtotal': subtotal,
-        })
+    if priced.has_problems:
+        return redirect('store:cart_detail')
+    items = priced.items
+    total = priced.total
 
     # Load user's saved addresses if authenticated
     user_addresses = None
@@ -254,79 +530,57 @@ def checkout(request):
                     'pincode': selected_address.pincode,
                     'notes': '',
                 }
-                request.session['cart_snapshot'] = cart
+                request.session['cart_snapshot'] = cart_store.snapshot(cart)
                 return redirect('store:razorpay_payment')
             
-            with transaction.atomic():
-                order = Order.objects.create(
-                    user=request.user if request.user.is_authenticated else None,
-                    full_name=selected_address.full_name,
-                    email=request.user.email if request.user.is_authenticated and request.user.email else '',
-                    phone=selected_address.phone,
-                    address=selected_address.address_line,
-                    city=selected_address.city,
-                    pincode=selected_address.pincode,
-                    notes=''
-                )
-
-                
-                for item in items:
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item['product'],
-                        quantity=item['quantity'],
-                        price=item['product'].price
-                    )
-                    
-                    p = item['product']
-                    if p.stock is not None:
-                        p.stock = max(0, p.stock - item['quantity'])
-                        p.save()
+            order = Order(
+                user=request.user if request.user.is_authenticated else None,
+                full_name=selected_address.full_name,
+                email=request.user.email if request.user.is_authenticated and request.user.email else '',
+                phone=selected_address.phone,
+                address=selected_address.address_line,
+                city=selected_address.city,
+                pincode=selected_address.pincode,
+                notes=''
+            )
+            try:
+                place_order(order, items)
+            except InsufficientStock as e:
+                messages.error(request, str(e))
+                return redirect('store:cart_detail')
 
-                
-                request.session['cart'] = {}
-                request.session.modified = True
+            cart_store.clear(cart)
 
-                messages.success(request, f"Your order #{order.id} has been placed successfully!")
-                return redirect('store:order_success', order_id=order.id)
+            messages.success(request, f"Your order #{order.id} has been placed successfully!")
+            return redirect('store:order_success', order_id=order.id)
 
         else:
            
             if form.is_valid():
                 if payment_method == 'online':
                     request.session['checkout_data'] = request.POST.dict()
-                    request.session['cart_snapshot'] = cart
+                    request.session['cart_snapshot'] = cart_store.snapshot(cart)
                     return redirect('store:razorpay_payment')
                 
-                with transaction.atomic():
-                    order = form.save(commit=False)
-                    if request.user.is_authenticated:
-                        order.user = request.user
-                        # if email empty in form but user has email, you might want to set it
-                        if not order.email and request.user.email:
-                            order.email = request.user.email
-                    order.save()
-
-                    for item in items:
-                        OrderItem.objects.create(
-                            order=order,
-                            product=item['product'],
-                            quantity=item['quantity'],
-                            price=item['product'].price
-                        )
-                        # reduce stock
-                        p = item['product']
-                        if p.stock is not None:
-                            p.stock = max(0, p.stock - item['quantity'])
-                            p.save()
-
-                    # optionally: if user checked "save address" on form, create Address object here
-                    # clear cart
-                    request.session['cart'] = {}
-                    request.session.modified = True
-
-                    messages.success(request, f"Your order #{order.id} has been placed successfully!")
-                    return redirect('store:order_success', order_id=order.id)
+                order = form.save(commit=False)
+                if request.user.is_authenticated:
+                    order.user = request.user
+                    # if email empty in form but user has email, you might want to set it
+                    if not order.email and request.user.email:
+                        order.email = request.user.email
+
+                try:
+                    place_order(order, items)
+                except InsufficientStock as e:
+                    messages.error(request, str(e))
+                    return redirect('store:cart_detail')
+
+                # optionally: if user checked "save address" on form, create Address object here
+                # clear cart
+                cart_store.clear(cart)
+
+                messages.success(request, f"Your order #{order.id} has been placed successfully!")
+                return redirect('store:order_success', order_id=order.id)
             else:
                 messages.error(request, "Please correct errors in the form.")
     else:
@@ -505,13 +759,8 @@ def wishlist_view(request):
 @login_required
 def add_to_wishlist(request, product_id):
     """Add product to wishlist"""
-    product = get_object_or_404(Product, id=product_id)
-    
-    # Check if already in wishlist
-    wishlist_item, created = Wishlist.objects.get_or_create(
-        user=request.user,
-        product=product
-    )
+    product = get_product_or_404(pk=product_id)
+    created = wishlist.add(request.user, product.id)
     
     if created:
         messages.success(request, f'{product.name} added to wishlist!')
@@ -530,18 +779,16 @@ def add_to_wishlist(request, product_id):
 @login_required
 def remove_from_wishlist(request, product_id):
     """Remove product from wishlist"""
-    product = get_object_or_404(Product, id=product_id)
+    product = get_product_or_404(pk=product_id)
     
-    try:
-        wishlist_item = Wishlist.objects.get(user=request.user, product=product)
-        wishlist_item.delete()
+    if wishlist.remove(request.user, product.id):
         messages.success(request, f'{product.name} removed from wishlist.')
         
         # For AJAX requests
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({'success': True, 'message': 'Removed from wishlist'})
             
-    except Wishlist.DoesNotExist:
+    else:
         messages.error(request, 'Item not found in wishlist.')
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -551,41 +798,99 @@ def remove_from_wishlist(request, product_id):
 
 @login_required
 def toggle_wishlist(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-
-    try:
-        wishlist_item = Wishlist.objects.get(user=request.user, product=product)
-        wishlist_item.delete()
-        in_wishlist = False
-        message = 'Removed from wishlist'
-    except Wishlist.DoesNotExist:
-        Wishlist.objects.create(user=request.user, product=product)
-        in_wishlist = True
-        message = 'Added to wishlist'
+    product = get_product_or_404(pk=product_id)
 
-    wishlist_count = Wishlist.objects.filter(user=request.user).count()
+    # one DELETE, plus one INSERT only if there was nothing to delete
+    in_wishlist = wishlist.toggle(request.user, product.id)
+    message = 'Added to wishlist' if in_wishlist else 'Removed from wishlist'
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        # the cached set is patched on commit, so adjust it for this change here
+        ids = wishlist.product_ids(request.user)
+        ids = ids | {product.id} if in_wishlist else ids - {product.id}
         return JsonResponse({
             'success': True,
             'in_wishlist': in_wishlist,
-            'wishlist_count': wishlist_count,
+            'wishlist_count': len(ids),
             'message': message
         })
 
     return redirect(request.META.get('HTTP_REFERER', 'store:shop'))
 
+def _wishlist_product_ids(data):
+    """Product ids from a form (repeated product_ids) or a JSON body (a list)."""
+    raw = data.getlist('product_ids') if hasattr(data, 'getlist') else data.get('product_ids') or []
+    ids = []
+    for value in raw if isinstance(raw, list) else [raw]:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+@login_required
+@require_POST
+def wishlist_bulk(request):
+    """Add or remove many products at once (action=add|remove), in a fixed number of queries."""
+    data = _request_data(request)
+    action = data.get('action')
+    product_ids = _wishlist_product_ids(data)
+    if action not in ('add', 'remove') or not product_ids:
+        return JsonResponse({'success': False, 'message': 'Give an action and product_ids.'}, status=400)
+
+    if action == 'add':
+        added = wishlist.add_many(request.user, product_ids)
+        changed = len(added)
+        ids = wishlist.product_ids(request.user) | set(added)
+    else:
+        changed = wishlist.remove_many(request.user, product_ids)
+        ids = wishlist.product_ids(request.user) - set(product_ids)
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.content_type == 'application/json':
+        return JsonResponse({
+            'success': True,
+            'action': action,
+            'changed': changed,
+            'wishlist_count': len(ids),
+        })
+    messages.success(request, f'Wishlist updated ({changed} item(s)).')
+    return redirect(request.META.get('HTTP_REFERER', 'store:wishlist'))
+
+@login_required
+@require_POST
+def wishlist_move_to_cart(request):
+    """Move all (or the given) in-stock wishlist products into the cart."""
+    data = _request_data(request)
+    product_ids = _wishlist_product_ids(data) or None
+    cart = _get_cart(request, create=True)
+    moved = wishlist.move_to_cart(request.user, cart, product_ids)
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.content_type == 'application/json':
+        _, lines = cart_store.summary(cart.pk)
+        return JsonResponse({
+            'success': True,
+            'moved': moved,
+            'cart_count': lines,
+            'wishlist_count': len(wishlist.product_ids(request.user) - set(moved)),
+        })
+    if moved:
+        messages.success(request, f'Moved {len(moved)} item(s) to your cart.')
+    else:
+        messages.info(request, 'Nothing in your wishlist is in stock right now.')
+    return redirect('store:cart_detail')
+
 @login_required
 def razorpay_payment(request):
-    cart = request.session.get('cart_snapshot')
+    cart = cart_store.snapshot_contents(request.session.get('cart_snapshot'), request.user)
     if not cart:
-        messages.error(request, "Invalid payment session")
+        messages.error(request, "Your cart changed or the payment session expired. Please review your cart.")
         return redirect('store:cart_detail')
 
-    total = 0
-    for pid, qty in cart.items():
-        product = Product.objects.get(id=pid)
-        total += product.price * qty
+    priced = price_cart(cart)
+    if priced.has_problems or not priced.items:
+        messages.error(request, "Some items in your cart are no longer available. Please review your cart.")
+        return redirect('store:cart_detail')
+    total = priced.total
 
     client = razorpay.Client(auth=(
         settings.RAZORPAY_KEY_ID,
@@ -598,23 +903,53 @@ def razorpay_payment(request):
         "payment_capture": 1
     })
 
+    # Reserve the stock until the payment is verified or the hold expires
+    try:
+        hold_stock(razorpay_order['id'], priced.items, user=request.user)
+    except InsufficientStock as e:
+        messages.error(request, str(e))
+        return redirect('store:cart_detail')
+
     return render(request, 'store/razorpay.html', {
         'razorpay_key': settings.RAZORPAY_KEY_ID,
         'order_id': razorpay_order['id'],
-        'amount': total
+        'amount': total,
+        'items': priced.items,
+    })
+
+def _paid_order_response(user, razorpay_order_id):
+    """Success response for a payment that was already recorded, else None."""
+    if not razorpay_order_id:
+        return None
+    order_id = (
+        Order.objects
+        .filter(razorpay_order_id=razorpay_order_id, user=user)
+        .values_list('id', flat=True)
+        .first()
+    )
+    if order_id is None:
+        return None
+    return Response({
+        'success': True,
+        'redirect_url': reverse('store:order_success', args=[order_id])
     })
 
 @api_view(['POST'])
 @authentication_classes([SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def verify_payment(request):
+    data = request.data
+
+    # Retries and double-clicks: the order for this payment already exists
+    existing = _paid_order_response(request.user, data.get('razorpay_order_id'))
+    if existing:
+        return existing
+
     client = razorpay.Client(auth=(
         settings.RAZORPAY_KEY_ID,
         settings.RAZORPAY_KEY_SECRET
     ))
 
-    data = request.data
-
     # Verify signature
     try:
         client.utility.verify_payment_signature({
@@ -626,50 +961,54 @@ def verify_payment(request):
         return Response({'success': False, 'error': 'Signature verification failed'}, status=400)
 
     # Get session data
-    cart = request.session.get('cart_snapshot')
+    # The cart as it was at checkout, or the lines held for this payment
+    # if the cart has changed since
+    cart = cart_store.snapshot_contents(
+        request.session.get('cart_snapshot'), request.user, data.get('razorpay_order_id'),
+    )
     checkout_data = request.session.get('checkout_data')
 
     if not cart or not checkout_data:
         return Response({'success': False, 'error': 'Session expired'}, status=400)
 
     # Create order
-    with transaction.atomic():
-        order = Order.objects.create(
-            user=request.user,
-            full_name=checkout_data.get('full_name'),
-            email = checkout_data.get('email') or request.user.email,
-            phone=checkout_data.get('phone'),
-            address=checkout_data.get('address'),
-            city=checkout_data.get('city'),
-            pincode=checkout_data.get('pincode'),
-            notes=checkout_data.get('notes'),
-
-            payment_method='razorpay',
-            payment_status='paid',
-            razorpay_order_id=data.get('razorpay_order_id'),
-            razorpay_payment_id=data.get('razorpay_payment_id'),
-            razorpay_signature=data.get('razorpay_signature'),
-        )
+    order = Order(
+        user=request.user,
+        full_name=checkout_data.get('full_name'),
+        email = checkout_data.get('email') or request.user.email,
+        phone=checkout_data.get('phone'),
+        address=checkout_data.get('address'),
+        city=checkout_data.get('city'),
+        pincode=checkout_data.get('pincode'),
+        notes=checkout_data.get('notes'),
+
+        payment_method='razorpay',
+        payment_status='paid',
+        razorpay_order_id=data.get('razorpay_order_id'),
+        razorpay_payment_id=data.get('razorpay_payment_id'),
+        razorpay_signature=data.get('razorpay_signature'),
+    )
 
-        for pid, qty in cart.items():
-            product = Product.objects.get(id=pid)
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=qty,
-                price=product.price
-            )
+    # Payment is already captured, so keep lines that went unavailable
+    # meanwhile; only products that were deleted can't be recorded.
+    priced = price_cart(cart)
+    if priced.missing:
+        logger.warning("Paid order %s references deleted products %s", data.get('razorpay_order_id'), priced.missing)
+    try:
+        place_paid_order(order, priced.items + priced.unavailable)
+    except IntegrityError:
+        # A concurrent retry recorded this payment first
+        existing = _paid_order_response(request.user, order.razorpay_order_id)
+        if existing:
+            return existing
+        raise
 
-        # Clear cart + session
-        request.session['cart'] = {}
-        request.session.pop('cart_snapshot', None)
-        request.session.pop('checkout_data', None)
+    # Clear cart (unless it was changed during payment) + session
+    cart_store.clear_snapshot(request.session.pop('cart_snapshot', None), request.user)
+    request.session.pop('checkout_data', None)
 
-    try:
-        send_order_receipt(order)
-        print("Receipt email sent to:", order.email)
-    except Exception as e:
-        print("Receipt email FAILED:", e)
+    # PDF + SMTP happen in the worker, not before the JSON response
+    enqueue('send_order_receipt', order_id=order.id)
 
     return Response({
         'success': True,
@@ -694,10 +1033,10 @@ def send_otp(request):
     otp = generate_otp()
     PasswordResetOTP.objects.create(user=user, otp=otp)
 
-    send_mail(
+    enqueue(
+        'send_mail',
         subject='KEC Password Reset OTP',
         message=f'Your OTP is {otp}. Valid for 10 minutes.',
-        from_email=None,
         recipient_list=[email],
     )
 
@@ -765,13 +1104,14 @@ def reset_password_page(request):
     return render(request, 'store/reset_password.html')
 
 @csrf_exempt 
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
 @permission_classes([AllowAny]) 
 def pump_recommendation_api(request):
-    depth_ft = request.data.get('depth_ft')
-    usage_type = request.data.get('usage_type')
-    phase = request.data.get('phase')
-    budget = request.data.get('budget')
+    params = request.query_params if request.method == 'GET' else request.data
+    depth_ft = params.get('depth_ft')
+    usage_type = params.get('usage_type')
+    phase = params.get('phase')
+    budget = params.get('budget')
 
     # Basic validation
     if not depth_ft or not usage_type or not phase:
@@ -780,20 +1120,172 @@ def pump_recommendation_api(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    products = recommend_pumps(
-        depth_ft=int(depth_ft),
+    # GETs are conditional: results depend only on the parameters and the
+    # catalog, so a repeat request is answered before any query runs.
+    etag = last_modified = None
+    if request.method == 'GET':
+        etag = _page_etag(
+            request, catalog.catalog_version(), depth_ft, usage_type, phase, budget,
+            params.get('flow_lpm'), params.get('head_m'), params.get('limit'),
+        )
+        last_modified = catalog.catalog_changed_at()
+        not_modified = _not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+    try:
+        depth_ft = int(depth_ft)
+        budget = float(budget) if budget not in (None, '') else None
+        # every match unless the client asks for fewer (0 also means every match)
+        limit = int(params.get('limit') or 0)
+        # optional operating point: the flow needed at a given head
+        flow_lpm, head_m = (
+            float(params[name]) if params.get(name) not in (None, '') else None
+            for name in ('flow_lpm', 'head_m')
+        )
+    except (TypeError, ValueError):
+        return Response(
+            {"error": "depth_ft, budget, limit, flow_lpm and head_m must be numbers"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if (flow_lpm is None) != (head_m is None):
+        return Response(
+            {"error": "flow_lpm and head_m must be given together"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Answered from the result cache or scored in memory; no queries once warm
+    count, recommendations = recommend_pumps(
+        depth_ft=depth_ft,
         usage_type=usage_type,
         phase=phase,
-        max_budget=budget
+        max_budget=budget,
+        limit=max(limit, 0),
+        flow_lpm=flow_lpm,
+        head_m=head_m,
     )
 
-    serializer = ProductRecommendationSerializer(products, many=True)
+    return _set_validators(Response({
+        "recommended_count": count,
+        "recommendations": recommendations
+    }), etag, last_modified)
 
-    return Response({
-        "recommended_count": products.count(),
-        "recommendations": serializer.data
-    })
+
+@api_view(['POST'])
+@authentication_classes([SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def pump_recommendation_batch_api(request):
+    """
+    Recommendations for many borewells at once. Takes a JSON array of
+    queries (or {"queries": [...]}) or a CSV upload ('file', or a text/csv
+    body) with depth_ft, usage_type, phase and optional budget, flow_lpm,
+    head_m and ref columns. Streams one NDJSON line per row, in order.
+    """
+    if request.content_type == 'text/csv':
+        raw = request.body
+    elif 'file' in request.FILES:
+        raw = request.FILES['file'].read()
+    else:
+        raw = None
+
+    if raw is not None:
+        try:
+            rows = list(csv.DictReader(io.StringIO(raw.decode('utf-8-sig'))))
+        except UnicodeDecodeError:
+            return Response({"error": "CSV must be UTF-8"}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        rows = request.data.get('queries') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return Response(
+                {"error": "Send a JSON array of queries or a CSV file"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    if not rows:
+        return Response({"error": "No queries given"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(rows) > settings.RECOMMENDATION_BATCH_MAX_ROWS:
+        return Response(
+            {"error": f"At most {settings.RECOMMENDATION_BATCH_MAX_ROWS} queries per batch"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        limit = int(request.query_params.get('limit', settings.RECOMMENDATION_LIMIT))
+    except ValueError:
+        return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+    def lines():
+        queries, errors = [], {}
+        for i, row in enumerate(rows):
+            try:
+                queries.append(recommendation.parse_query(row))
+            except ValueError as exc:
+                errors[i] = str(exc)
+        answers = recommendation.recommend_many(queries, limit=max(limit, 0))
+        for i, row in enumerate(rows):
+            line = {'row': i, 'ref': row.get('ref')}
+            if i in errors:
+                line['error'] = errors[i]
+            else:
+                line['recommended_count'], line['recommendations'] = next(answers)
+            yield json.dumps(line, cls=DjangoJSONEncoder) + '\n'
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+
+@csrf_exempt
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def chatbot_session_start(request):
+    """Open a chatbot conversation; the reply carries its id and first question."""
+    return Response(chatbot.start(), status=status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@api_view(['POST', 'DELETE'])
+@permission_classes([AllowAny])
+def chatbot_session_answer(request, session_id):
+    """
+    POST {"field": ..., "value": ...} answers one question and returns the
+    next one, or the recommendations once nothing is left to ask. DELETE
+    ends the conversation.
+    """
+    if request.method == 'DELETE':
+        chatbot.end(session_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    try:
+        reply = chatbot.answer(session_id, request.data.get('field'), request.data.get('value'))
+    except chatbot.InvalidAnswer as exc:
+        return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    if reply is None:
+        return Response({"error": "This conversation has expired"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(reply)
 
 
 def pump_chatbot_page(request):
     return render(request, 'store/pump_chatbot.html')
+
+
+# Services that count cache outcomes (stats() / reset_stats()), by URL name
+CACHE_STATS = {
+    'product-cache': product_cache,
+    'recommend-cache': recommendation,
+}
+
+
+@api_view(['GET', 'DELETE'])
+@authentication_classes([SessionAuthentication])
+@permission_classes([IsAdminUser])
+def cache_stats_api(request, name):
+    """
+    Hit counters of one of the CACHE_STATS caches, read by the serving
+    process itself. "shared" is false when the cache is local to each
+    worker, in which case the counts are this worker's only. DELETE
+    zeroes them.
+    """
+    service = CACHE_STATS.get(name)
+    if service is None:
+        raise Http404
+    if request.method == 'DELETE':
+        service.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({**service.stats(), 'shared': catalog.cache_is_shared()})